@@ -1,9 +1,33 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple, Union
+import asyncio
+import base64
+import json
+import numpy as np
 import os
+import time
 import uuid
 
+from services.audio_buffer import AudioBuffer, AudioDecodeError, SAMPLE_RATE
+from services.audio_store import get_audio_store
+from services.emotion_batcher import EmotionMicroBatcher
+from services.log import get_logger, new_request_id, request_id_var, session_id_var
+from services.memory_audio import get_memory_audio, memory_mode, parse_range
+from services.metrics import MODEL_EVENTS, TURN_SECONDS, server_timing_enabled, server_timing_header, stage_timer
+from services.pipeline import get_pipeline, PipelineBusyError
+from services.reply_stream import iter_sentences, stream_sentence_audio
+from services.session_history import get_session_history
+from services.streaming_stt import StreamingTranscriber
+from services.tts_cache import get_tts_cache
+from services.turn_writer import get_turn_writer
+from services.vad import get_vad, vad_enabled, VadResult
+
+logger = get_logger(__name__)
+
 router = APIRouter()
 
 # Servicios inicializados de forma lazy
@@ -11,59 +35,235 @@ _whisper = None
 _emotion_clf = None
 _llm = None
 _tts = None
+_emotion_batcher = None
+_tts_cache_ready = False
 
-def get_services():
-    """Inicializa los servicios de IA de forma lazy."""
-    global _whisper, _emotion_clf, _llm, _tts
-    
+def _get_whisper():
+    global _whisper
     if _whisper is None:
-        print("=" * 60)
-        print("🔧 Inicializando Whisper STT...")
+        logger.info("🔧 Inicializando Whisper STT...")
         try:
             from services.whisper_stt import get_whisper_service
             _whisper = get_whisper_service()
-            print("✅ WhisperSTT real cargado exitosamente")
+            logger.info("✅ WhisperSTT real cargado exitosamente")
         except Exception as e:
-            print(f"❌ Error cargando Whisper real: {type(e).__name__}: {e}")
+            logger.error(f"❌ Error cargando Whisper real: {type(e).__name__}: {e}")
             try:
                 from services.mock_whisper import get_mock_whisper_service
                 _whisper = get_mock_whisper_service()
-                print("✅ MockWhisper cargado")
+                MODEL_EVENTS.inc(model="whisper", event="fallback_mock")
+                logger.warning("✅ MockWhisper cargado")
             except Exception as e2:
-                print(f"❌ Error cargando MockWhisper: {e2}")
+                logger.error(f"❌ Error cargando MockWhisper: {e2}")
                 _whisper = None
-        print("=" * 60)
-    
+    return _whisper
+
+
+def _get_emotion_classifier():
+    global _emotion_clf
     if _emotion_clf is None:
         try:
             from services.emotion_classifier import EmotionClassifier
             _emotion_clf = EmotionClassifier()
         except Exception as e:
-            print(f"⚠️ Error cargando EmotionClassifier: {e}")
+            logger.warning(f"⚠️ Error cargando EmotionClassifier: {e}")
             _emotion_clf = None
-    
+    return _emotion_clf
+
+
+def _get_llm():
+    global _llm
     if _llm is None:
         try:
             from services.llm_service import LLMService
             _llm = LLMService()
         except Exception as e:
-            print(f"⚠️ Error cargando LLMService: {e}")
+            logger.warning(f"⚠️ Error cargando LLMService: {e}")
             _llm = None
-    
+    return _llm
+
+
+async def close_services():
+    """Cierra las conexiones de los servicios (al apagar la app)."""
+    if _llm is not None and hasattr(_llm, "client"):
+        await _llm.client.aclose()
+    # Turnos aún en cola (si MongoDB no está, acaban en el diario local)
+    await get_turn_writer().close()
+    import services.database as database
+    await database.db_service.disconnect()
+
+
+def _get_tts():
+    global _tts
     if _tts is None:
         try:
             from services.simple_tts import SimpleTTSService
             _tts = SimpleTTSService()
-            print("✅ Usando SimpleTTSService (gTTS)")
+            logger.info("✅ Usando SimpleTTSService (gTTS)")
         except Exception as e:
-            print(f"⚠️ Error cargando SimpleTTS: {e}")
+            logger.warning(f"⚠️ Error cargando SimpleTTS: {e}")
             try:
                 from services.tts_service import TTSService
                 _tts = TTSService()
             except:
                 _tts = None
+    return _tts
+
+
+def _get_tts_cache():
+    """Caché de TTS con las frases fijas del avatar registradas (None si está desactivado)."""
+    global _tts_cache_ready
+    cache = get_tts_cache()
+    if cache is not None and not _tts_cache_ready:
+        cache.register_canned(text for text, _ in canned_utterances())
+        _tts_cache_ready = True
+    return cache
+
+
+def get_services():
+    """Inicializa los servicios de IA de forma lazy."""
+    return _get_whisper(), _get_emotion_classifier(), _get_llm(), _get_tts()
+
+
+def warmup_services():
+    """
+    Carga todos los servicios y ejecuta una inferencia de prueba.
+    Se llama al arrancar el servidor para que el primer usuario no espere.
+    """
+    whisper, emotion_clf, _, _ = get_services()
     
-    return _whisper, _emotion_clf, _llm, _tts
+    if whisper is not None:
+        try:
+            whisper.warmup()
+        except Exception as e:
+            logger.warning(f"⚠️ Error precalentando Whisper: {e}")
+    
+    if emotion_clf is not None:
+        try:
+            emotion_clf.classify(AudioBuffer(np.zeros(SAMPLE_RATE, dtype=np.float32)))
+        except Exception as e:
+            logger.warning(f"⚠️ Error precalentando EmotionClassifier: {e}")
+
+
+# Funciones de etapa a nivel de módulo: así son serializables cuando una etapa
+# del pipeline se configura con pool de procesos (cada proceso carga su servicio).
+def _stage_decode(data: bytes) -> AudioBuffer:
+    return AudioBuffer.from_bytes(data)
+
+
+def _stage_vad(audio: AudioBuffer) -> VadResult:
+    return get_vad().detect(audio)
+
+
+def _stage_transcribe(audio: AudioBuffer) -> dict:
+    return _get_whisper().transcribe(audio)
+
+
+def _stage_classify_batch(audios: List[AudioBuffer]) -> List[dict]:
+    return _get_emotion_classifier().classify_batch(audios)
+
+
+def _stage_classify_features(features: np.ndarray, duration: float) -> dict:
+    return _get_emotion_classifier().classify_features(features.reshape(1, -1), [duration])[0]
+
+
+def _stage_synthesize(text: str, stress_level: int, output_path: str, max_memory_bytes: int = 0) -> Union[str, bytes]:
+    """
+    Sintetiza la respuesta. Las frases fijas salen del caché de TTS.
+    
+    Returns:
+        ruta relativa a temp/ que se sirve en /static/, o los bytes MP3 si
+        max_memory_bytes > 0 y el clip cabe (modo de audio en memoria)
+    """
+    tts = _get_tts()
+    cache = _get_tts_cache()
+    if cache is not None:
+        filename = cache.cached_file(tts, text, stress_level)
+        if filename is not None:
+            return filename
+    
+    if max_memory_bytes > 0:
+        audio = tts.synthesize_bytes(text=text, stress_level=stress_level)
+        if len(audio) <= max_memory_bytes:
+            return audio
+        # Clip largo: a disco como siempre
+        with open(output_path, "wb") as out:
+            out.write(audio)
+    else:
+        tts.synthesize(text=text, stress_level=stress_level, output_path=output_path)
+    return os.path.relpath(output_path, "temp")
+
+
+def _stage_synthesize_bytes(text: str, stress_level: int) -> bytes:
+    cache = _get_tts_cache()
+    if cache is None:
+        return _get_tts().synthesize_bytes(text=text, stress_level=stress_level)
+    return cache.synthesize_bytes(_get_tts(), text, stress_level)
+
+
+def _publish_audio(result: Union[str, bytes], session_id: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    Hace accesible al cliente el resultado de _stage_synthesize.
+    
+    Returns:
+        (audio_url, archivo en temp/ o None si el audio está en memoria)
+    """
+    if isinstance(result, bytes):
+        audio_id = get_memory_audio().put(result, session_id)
+        return f"/api/audio/{audio_id}.mp3", None
+    # Audio propio del turno: se borra al terminar la sesión o por TTL/tamaño
+    get_audio_store().register(result, session_id)
+    return f"/static/{result}", result
+
+
+def _synthesis_memory_limit() -> int:
+    """Tamaño máximo de clip que _stage_synthesize devuelve en memoria (0 = disco)."""
+    return get_memory_audio().max_clip_bytes if memory_mode() else 0
+
+
+def _get_emotion_batcher() -> EmotionMicroBatcher:
+    """Agrupa las clasificaciones concurrentes en lotes del pool 'emotion'."""
+    global _emotion_batcher
+    if _emotion_batcher is None:
+        _emotion_batcher = EmotionMicroBatcher(
+            # Etapa propia: el CPU del lote no se atribuye a la petición que lo abrió
+            run_batch=lambda audios: _timed(None, "emotion_batch", get_pipeline().run("emotion", _stage_classify_batch, audios))
+        )
+    return _emotion_batcher
+
+
+async def _classify_emotion(audio: AudioBuffer) -> Optional[dict]:
+    """Clasifica la emoción; un fallo del clasificador no detiene el turno."""
+    try:
+        return await _get_emotion_batcher().classify(audio)
+    except PipelineBusyError:
+        raise
+    except Exception as e:
+        logger.warning(f"⚠️ Error en clasificación de emoción: {e}")
+        return None
+
+
+async def _none():
+    return None
+
+
+async def _timed(timings: Optional[dict], stage: str, awaitable):
+    """
+    Espera awaitable y registra su duración en ms bajo timings[stage], además
+    de los histogramas de reloj y CPU de la etapa (/metrics).
+    """
+    with stage_timer(stage, timings):
+        return await awaitable
+
+
+def _busy_response(e: PipelineBusyError) -> HTTPException:
+    """Convierte la saturación de una etapa en 503 con Retry-After."""
+    logger.warning(f"⚠️ Pipeline saturado en etapa '{e.stage}'")
+    return HTTPException(
+        status_code=503,
+        detail=f"Servidor ocupado (etapa {e.stage}), reintentar en {e.retry_after}s",
+        headers={"Retry-After": str(e.retry_after)}
+    )
 
 
 class ConversationTurn(BaseModel):
@@ -72,8 +272,227 @@ class ConversationTurn(BaseModel):
     turn_count: int
 
 
+async def _analyze_user_audio(audio_bytes: bytes, stress_level: int, timings: dict) -> dict:
+    """
+    Primera mitad del turno: decodificar, VAD, STT + emoción y nuevo estrés.
+    
+    Returns:
+        dict con user_text, is_silent_clip, is_empty_input, user_emotion,
+        emotion_confidence y new_stress
+    """
+    whisper, emotion_clf, _, _ = get_services()
+    pipeline = get_pipeline()
+    
+    if whisper is None:
+        raise HTTPException(status_code=503, detail="Servicio Whisper no disponible")
+    
+    # 1. Decodificar una sola vez a 16 kHz en memoria (sin archivo temporal)
+    try:
+        audio_buffer = await _timed(timings, "decode", pipeline.run("decode", _stage_decode, audio_bytes))
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Audio inválido: {e}")
+    logger.debug("🎤 Transcribiendo audio: %d bytes, %.2fs", len(audio_bytes), audio_buffer.duration)
+    
+    # 2. VAD: recortar silencio inicial/final y detectar clips sin voz
+    is_silent_clip = False
+    speech_buffer = audio_buffer
+    if vad_enabled():
+        vad_result = await _timed(timings, "vad", pipeline.run("decode", _stage_vad, audio_buffer))
+        is_silent_clip = not vad_result.is_speech
+        speech_buffer = vad_result.trim(audio_buffer)
+    
+    if is_silent_clip:
+        # Sin voz: ni Whisper ni clasificador de emociones
+        logger.info("🔇 Clip sin voz (VAD) - se omiten STT y emoción")
+        transcription, emotion_result = {"text": ""}, None
+    else:
+        # 3. Transcribir y clasificar emoción en paralelo: así el turno
+        #    espera a la más lenta y no a la suma. Whisper recibe el audio
+        #    recortado; el clasificador, el clip completo.
+        stt_task = _timed(timings, "stt", pipeline.run("stt", _stage_transcribe, speech_buffer))
+        if emotion_clf is not None:
+            emotion_task = _timed(timings, "emotion", _classify_emotion(audio_buffer))
+        else:
+            emotion_task = _none()
+        transcription, emotion_result = await asyncio.gather(stt_task, emotion_task)
+    user_text = transcription["text"].strip()
+    logger.debug("📝 Transcripción: '%s'", user_text)
+    
+    # 4. Si la transcripción está vacía, marcar como tal
+    is_empty_input = len(user_text) < 3
+    if is_empty_input:
+        logger.info("⚠️ Transcripción vacía o muy corta - posible audio silencioso")
+        user_text = ""  # Mantener vacío para que el LLM sepa
+    
+    # 5. Emoción (se descarta si no hubo habla)
+    user_emotion = "neutro"
+    emotion_confidence = 0.5
+    
+    if not is_empty_input and emotion_result is not None:
+        user_emotion = emotion_result["emotion"]
+        emotion_confidence = emotion_result["confidence"]
+    
+    # 6. Actualizar estrés basado en emoción
+    stress_delta = {
+        "empatico": -2,
+        "hostil": +2,
+        "neutro": 0,
+        "ansioso": +1
+    }.get(user_emotion, 0)
+    
+    # Si input vacío, no cambiar estrés
+    if is_empty_input:
+        stress_delta = 0
+    
+    return {
+        "user_text": user_text,
+        "is_silent_clip": is_silent_clip,
+        "is_empty_input": is_empty_input,
+        "user_emotion": user_emotion,
+        "emotion_confidence": emotion_confidence,
+        "new_stress": max(0, min(10, stress_level + stress_delta)),
+    }
+
+
+async def _flush_turns():
+    """Espera a que se escriban los turnos encolados en este worker antes de leer turnos de la BD."""
+    writer = get_turn_writer()
+    if not await writer.wait_idle():
+        logger.warning(f"⚠️ {writer.pending} turnos pendientes sin escribir: la lectura puede no incluirlos")
+
+
+async def _load_recent_turns(session_id: str, limit: int) -> List[dict]:
+    from services.database import get_db
+    await _flush_turns()
+    db = await get_db()
+    return await db.get_recent_turns(session_id, limit)
+
+
+async def _sync_history(session_id: str, turn_count: int):
+    """
+    Pone al día el historial del LLM en este worker (si la sesión empezó en
+    otro, se recarga de la BD) y registra el turno actual.
+    """
+    history = get_session_history()
+    try:
+        if await history.sync(session_id, turn_count, _load_recent_turns):
+            logger.info(f"🔄 Historial de la sesión recargado de la BD ({turn_count} turnos previos)")
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo recargar el historial de la sesión: {e}")
+    history.mark_turn(session_id, turn_count + 1)
+
+
+async def _generate_reply(turn: dict, turn_count: int, session_id: Optional[str], timings: dict) -> str:
+    """Respuesta del avatar CON historial de sesión (o de emergencia)."""
+    llm = _get_llm()
+    new_stress = turn["new_stress"]
+    if session_id:
+        await _sync_history(session_id, turn_count)
+    if turn["is_silent_clip"]:
+        # Clip sin voz: directamente al "no te escuché"
+        return _get_emergency_response(new_stress, is_empty=True)
+    if llm is None:
+        MODEL_EVENTS.inc(model="llm", event="unavailable")
+        return _get_emergency_response(new_stress, turn["is_empty_input"])
+    try:
+        # Cliente async: no ocupa un hilo, pero respeta el límite de la etapa "llm"
+        return await _timed(timings, "llm", get_pipeline().run_async(
+            "llm", llm.generate_response_async,
+            user_input=turn["user_text"],
+            stress_level=new_stress,
+            conversation_history=[],  # El LLM ahora maneja el historial internamente
+            turn_count=turn_count + 1,
+            session_id=session_id  # NUEVO: pasar session_id para historial
+        ))
+    except PipelineBusyError:
+        raise
+    except Exception as e:
+        logger.warning(f"⚠️ Error en LLM: {e}")
+        MODEL_EVENTS.inc(model="llm", event="emergency_response")
+        return _get_emergency_response(new_stress, turn["is_empty_input"])
+
+
+async def _reply_deltas(turn: dict, turn_count: int, session_id: Optional[str], timings: dict) -> AsyncIterator[str]:
+    """
+    Respuesta del avatar en fragmentos según la genera el LLM (o la de
+    emergencia de una vez). timings["llm_first_delta"] es la espera hasta el
+    primer fragmento; timings["llm"] llega hasta el último.
+    """
+    llm = _get_llm()
+    new_stress = turn["new_stress"]
+    if session_id:
+        await _sync_history(session_id, turn_count)
+    if turn["is_silent_clip"]:
+        yield _get_emergency_response(new_stress, is_empty=True)
+        return
+    if llm is None:
+        MODEL_EVENTS.inc(model="llm", event="unavailable")
+        yield _get_emergency_response(new_stress, turn["is_empty_input"])
+        return
+    
+    emitted = False
+    start = time.perf_counter()
+    try:
+        with stage_timer("llm", timings):
+            async with get_pipeline().admit("llm"):
+                async for delta in llm.stream_response_async(
+                    user_input=turn["user_text"],
+                    stress_level=new_stress,
+                    conversation_history=[],
+                    turn_count=turn_count + 1,
+                    session_id=session_id
+                ):
+                    if not emitted:
+                        timings["llm_first_delta"] = round((time.perf_counter() - start) * 1000, 1)
+                        emitted = True
+                    yield delta
+    except Exception as e:
+        # Ya se está respondiendo en streaming: no hay 503 posible
+        logger.warning(f"⚠️ Error en LLM (streaming): {e}")
+        if not emitted:
+            MODEL_EVENTS.inc(model="llm", event="emergency_response")
+            yield _get_emergency_response(new_stress, turn["is_empty_input"])
+
+
+async def _save_turn(
+    session_id: Optional[str], turn: dict, turn_count: int, stress_level: int,
+    avatar_response: str, audio_file: Optional[str]
+):
+    """
+    Guarda el turno en BD; un fallo de BD no afecta a la respuesta.
+    
+    Con TURN_WRITE_MODE=behind (por defecto) solo se encola: el lote se
+    escribe en segundo plano. Con SESSION_HISTORY_BACKEND=mongo se escribe
+    siempre antes de responder (otro worker puede recargar el historial).
+    """
+    if not session_id:
+        return
+    turn_data = {
+        "session_id": session_id,
+        "turn_number": turn_count + 1,
+        "user_transcription": turn["user_text"],
+        "user_emotion": turn["user_emotion"],
+        "emotion_confidence": turn["emotion_confidence"],
+        "stress_before": stress_level,
+        "stress_after": turn["new_stress"],
+        "avatar_response": avatar_response,
+        "audio_file": audio_file
+    }
+    try:
+        writer = get_turn_writer()
+        if writer.enabled:
+            writer.enqueue(turn_data)
+            return
+        from services.database import get_db
+        db = await get_db()
+        await db.save_turn(turn_data)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo guardar turno en BD: {e}")
+
+
 @router.post("/process-audio")
 async def process_user_audio(
+    response: Response,
     audio: UploadFile = File(...),
     session_id: str = Query(None),
     stress_level: int = 7,
@@ -83,150 +502,344 @@ async def process_user_audio(
     Endpoint principal: procesar audio del usuario y generar respuesta del avatar.
     """
     temp_id = str(uuid.uuid4())
-    audio_path = f"temp/{temp_id}.wav"
     os.makedirs("temp", exist_ok=True)
-    
-    with open(audio_path, "wb") as f:
-        f.write(await audio.read())
+    timings = {}
+    start = time.perf_counter()
     
     try:
-        whisper, emotion_clf, llm, tts = get_services()
-        
-        if whisper is None:
-            raise HTTPException(status_code=503, detail="Servicio Whisper no disponible")
+        audio_bytes = await _timed(timings, "upload", audio.read())
         
-        # 1. Verificar que el audio no está vacío/silencioso
-        audio_size = os.path.getsize(audio_path)
-        print(f"🎤 Transcribiendo audio: {audio_path} ({audio_size} bytes)")
+        # 1-6. Decodificar, VAD, STT + emoción, estrés
+        turn = await _analyze_user_audio(audio_bytes, stress_level, timings)
+        user_text = turn["user_text"]
+        new_stress = turn["new_stress"]
         
-        # 2. Transcribir
-        transcription = whisper.transcribe(audio_path)
-        user_text = transcription["text"].strip()
-        print(f"📝 Transcripción: '{user_text}'")
+        # 7. Generar respuesta del avatar
+        avatar_response = await _generate_reply(turn, turn_count, session_id, timings)
         
-        # 3. Si la transcripción está vacía, marcar como tal
-        is_empty_input = len(user_text) < 3
-        if is_empty_input:
-            print("⚠️ Transcripción vacía o muy corta - posible audio silencioso")
-            user_text = ""  # Mantener vacío para que el LLM sepa
-        
-        # 4. Clasificar emoción
-        user_emotion = "neutro"
-        emotion_confidence = 0.5
-        
-        if not is_empty_input and emotion_clf is not None:
-            try:
-                emotion_result = emotion_clf.classify(audio_path)
-                user_emotion = emotion_result["emotion"]
-                emotion_confidence = emotion_result["confidence"]
-            except Exception as e:
-                print(f"⚠️ Error en clasificación de emoción: {e}")
-        
-        # 5. Actualizar estrés basado en emoción
-        stress_delta = {
-            "empatico": -2,
-            "hostil": +2,
-            "neutro": 0,
-            "ansioso": +1
-        }.get(user_emotion, 0)
-        
-        # Si input vacío, no cambiar estrés
-        if is_empty_input:
-            stress_delta = 0
-        
-        new_stress = max(0, min(10, stress_level + stress_delta))
-        
-        # 6. Generar respuesta del avatar CON historial de sesión
-        if llm is not None:
-            try:
-                avatar_response = llm.generate_response(
-                    user_input=user_text,
-                    stress_level=new_stress,
-                    conversation_history=[],  # El LLM ahora maneja el historial internamente
-                    turn_count=turn_count + 1,
-                    session_id=session_id  # NUEVO: pasar session_id para historial
-                )
-            except Exception as e:
-                print(f"⚠️ Error en LLM: {e}")
-                avatar_response = _get_emergency_response(new_stress, is_empty_input)
-        else:
-            avatar_response = _get_emergency_response(new_stress, is_empty_input)
-        
-        # 7. Sintetizar voz
-        audio_output_filename = f"{temp_id}_response.mp3"
-        audio_output_path = f"temp/{audio_output_filename}"
+        # 8. Sintetizar voz (las frases fijas salen del caché de TTS)
+        tts = _get_tts()
+        audio_url, audio_output_filename = None, None
+        audio_output_path = f"temp/{temp_id}_response.mp3"
         
         try:
             if tts is not None:
-                tts.synthesize(
+                audio = await _timed(timings, "tts", get_pipeline().run(
+                    "tts", _stage_synthesize,
                     text=avatar_response,
                     stress_level=new_stress,
-                    output_path=audio_output_path
-                )
-            else:
-                audio_output_filename = None
+                    output_path=audio_output_path,
+                    max_memory_bytes=_synthesis_memory_limit()
+                ))
+                audio_url, audio_output_filename = _publish_audio(audio, session_id)
+        except PipelineBusyError:
+            raise
         except Exception as e:
-            print(f"⚠️ Error en TTS: {e}")
-            audio_output_filename = None
+            logger.warning(f"⚠️ Error en TTS: {e}")
+            audio_url, audio_output_filename = None, None
         
-        # 8. Guardar turno en BD
-        if session_id:
-            try:
-                from services.database import get_db
-                db = await get_db()
-                await db.save_turn({
-                    "session_id": session_id,
-                    "turn_number": turn_count + 1,
-                    "user_transcription": user_text,
-                    "user_emotion": user_emotion,
-                    "emotion_confidence": emotion_confidence,
-                    "stress_before": stress_level,
-                    "stress_after": new_stress,
-                    "avatar_response": avatar_response,
-                    "audio_file": audio_output_filename
-                })
-            except Exception as e:
-                print(f"⚠️ No se pudo guardar turno en BD: {e}")
+        # 9. Guardar turno en BD
+        await _timed(timings, "db", _save_turn(
+            session_id, turn, turn_count, stress_level, avatar_response, audio_output_filename
+        ))
         
-        print(f"✅ Procesamiento completado: '{user_text}' -> '{avatar_response}'")
+        TURN_SECONDS.observe(time.perf_counter() - start, endpoint="process-audio")
+        if server_timing_enabled():
+            response.headers["Server-Timing"] = server_timing_header(timings)
+        
+        # El texto del turno solo en DEBUG; en INFO basta con longitudes y tiempos
+        logger.debug("✅ Turno: '%s' -> '%s'", user_text, avatar_response)
+        logger.info(
+            "✅ Turno %d procesado", turn_count + 1,
+            extra={"timings_ms": timings, "emotion": turn["user_emotion"], "stress": new_stress}
+        )
         return {
             "transcription": user_text,
-            "user_emotion": user_emotion,
-            "emotion_confidence": emotion_confidence,
+            "user_emotion": turn["user_emotion"],
+            "emotion_confidence": turn["emotion_confidence"],
             "stress_level_previous": stress_level,
             "stress_level_new": new_stress,
             "avatar_response_text": avatar_response,
-            "audio_url": f"/static/{audio_output_filename}" if audio_output_filename else None,
-            "turn_number": turn_count + 1
+            "audio_url": audio_url,
+            "turn_number": turn_count + 1,
+            "timings_ms": timings
         }
         
     except HTTPException:
         raise
+    except PipelineBusyError as e:
+        raise _busy_response(e)
+    except Exception as e:
+        logger.exception(f"❌ ERROR CRÍTICO en /process-audio: {type(e).__name__}: {e}")
+        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {str(e)}")
+
+
+@router.post("/process-audio/stream")
+async def process_user_audio_stream(
+    audio: UploadFile = File(...),
+    session_id: str = Query(None),
+    stress_level: int = 7,
+    turn_count: int = 0
+):
+    """
+    Igual que /process-audio, pero la respuesta del avatar llega por frases.
+    
+    Respuesta HTTP chunked en NDJSON (un objeto JSON por línea):
+    - {"type": "turn", "transcription", "user_emotion", "emotion_confidence",
+       "stress_level_previous", "stress_level_new", "turn_number"}
+    - {"type": "audio", "index", "text", "format": "mp3", "audio_b64"} por
+      frase, en orden ("audio_b64" es null si falló la síntesis de esa frase)
+    - {"type": "done", "avatar_response_text", "timings_ms"}
+    
+    El texto del LLM llega en streaming: la primera frase se sintetiza
+    mientras Gemini genera el resto. Los errores anteriores a la respuesta
+    (audio inválido, saturación de STT/emoción) siguen devolviendo 400/503
+    como /process-audio; los del LLM se cubren con la respuesta offline o de
+    emergencia.
+    """
+    timings = {}
+    start = time.perf_counter()
+    
+    try:
+        audio_bytes = await _timed(timings, "upload", audio.read())
+        turn = await _analyze_user_audio(audio_bytes, stress_level, timings)
+    except HTTPException:
+        raise
+    except PipelineBusyError as e:
+        raise _busy_response(e)
     except Exception as e:
-        print(f"❌ ERROR CRÍTICO en /process-audio: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ ERROR CRÍTICO en /process-audio/stream: {type(e).__name__}: {e}")
         raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {str(e)}")
+    
+    new_stress = turn["new_stress"]
+    tts = _get_tts()
+    
+    async def synthesize(sentence: str) -> bytes:
+        return await get_pipeline().run(
+            "tts", _stage_synthesize_bytes, text=sentence, stress_level=new_stress
+        )
+    
+    def line(payload: dict) -> bytes:
+        return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+    
+    async def body():
+        yield line({
+            "type": "turn",
+            "transcription": turn["user_text"],
+            "user_emotion": turn["user_emotion"],
+            "emotion_confidence": turn["emotion_confidence"],
+            "stress_level_previous": stress_level,
+            "stress_level_new": new_stress,
+            "turn_number": turn_count + 1
+        })
         
+        # La primera frase del LLM va a TTS mientras se genera el resto
+        deltas = _reply_deltas(turn, turn_count, session_id, timings)
+        sentences = []
+        if tts is not None:
+            async for sentence in stream_sentence_audio(deltas, synthesize):
+                if sentence.index == 0:
+                    timings["first_audio"] = round((time.perf_counter() - start) * 1000, 1)
+                sentences.append(sentence.text)
+                yield line({
+                    "type": "audio",
+                    "index": sentence.index,
+                    "text": sentence.text,
+                    "format": "mp3",
+                    "audio_b64": base64.b64encode(sentence.audio).decode("ascii") if sentence.audio else None
+                })
+        else:
+            # Sin TTS: solo el texto, igualmente por frases
+            async for text in iter_sentences(deltas):
+                sentences.append(text)
+                yield line({"type": "audio", "index": len(sentences) - 1, "text": text, "format": "mp3", "audio_b64": None})
+        response_text = " ".join(sentences)
+        
+        # El turno se guarda (o encola) antes de "done": si el cliente se
+        # desconecta al recibirlo, el generador se cancela y el turno no se
+        # perdería aunque el historial del LLM ya lo tenga. shield() deja
+        # terminar el guardado aunque la cancelación llegue durante el await.
+        # El audio por frases no se guarda en temp/: el turno queda sin archivo
+        await asyncio.shield(_timed(timings, "db", _save_turn(
+            session_id, turn, turn_count, stress_level, response_text, None
+        )))
+        timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+        TURN_SECONDS.observe(time.perf_counter() - start, endpoint="process-audio-stream")
+        
+        yield line({"type": "done", "avatar_response_text": response_text, "timings_ms": timings})
+        logger.info(
+            "✅ Respuesta en streaming: %d frases", len(sentences),
+            extra={"timings_ms": timings}
+        )
+    
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@router.websocket("/ws/transcribe")
+async def stream_transcription(websocket: WebSocket, session_id: str = Query(None)):
+    """
+    Transcripción en streaming mientras el usuario habla.
+    
+    Protocolo:
+    - Cliente → servidor: mensajes binarios con PCM 16 bits little-endian,
+      mono, 16 kHz. Opcionalmente {"type": "end"} al soltar el botón.
+    - Servidor → cliente:
+      {"type": "vad", "event": "start"} al detectar voz
+      {"type": "partial", "text": ...} mientras se habla
+      {"type": "final", "transcription", "user_emotion", "emotion_confidence",
+       "duration_sec", "latency_ms"} al detectar el fin de la voz (o "end").
+       También al llegar a STREAM_MAX_UTTERANCE_S de audio: el enunciado se
+       cierra ahí y lo que siga cuenta como el siguiente
+      {"type": "error", "detail": ..., "retry_after": ...} si el servidor está saturado
+    """
+    # La conexión corre en su propia tarea: el contexto de logs no se filtra a otras
+    request_id_var.set(websocket.headers.get("x-request-id") or new_request_id())
+    session_id_var.set(session_id)
+    await websocket.accept()
+    
+    whisper = _get_whisper()
+    if whisper is None:
+        await websocket.send_json({"type": "error", "detail": "Servicio Whisper no disponible"})
+        await websocket.close(code=1011)
+        return
+    
+    pipeline = get_pipeline()
+    transcriber = StreamingTranscriber(
+        transcribe=lambda audio: pipeline.run("stt", _stage_transcribe, audio)
+    )
+    partial_tasks = set()
+    
+    async def send_partial():
+        try:
+            text = await transcriber.partial()
+            if text:
+                await websocket.send_json({"type": "partial", "text": text})
+        except PipelineBusyError:
+            pass  # Los parciales se omiten bajo carga
+        except Exception as e:
+            logger.warning(f"⚠️ Error en transcripción parcial: {e}")
+    
+    async def send_final():
+        if transcriber.n_samples == 0:
+            return
+        start = time.perf_counter()
+        try:
+            result = await _timed(None, "stt_stream_final", transcriber.finalize())
+            user_emotion, emotion_confidence = "neutro", 0.5
+            is_empty_input = len(result["text"]) < 3
+            if not is_empty_input and _get_emotion_classifier() is not None:
+                try:
+                    emotion = await pipeline.run(
+                        "emotion", _stage_classify_features,
+                        result["features"], result["duration_sec"]
+                    )
+                    user_emotion, emotion_confidence = emotion["emotion"], emotion["confidence"]
+                except PipelineBusyError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"⚠️ Error en clasificación de emoción: {e}")
+            
+            await websocket.send_json({
+                "type": "final",
+                "session_id": session_id,
+                "transcription": result["text"] if not is_empty_input else "",
+                "user_emotion": user_emotion,
+                "emotion_confidence": emotion_confidence,
+                "duration_sec": round(result["duration_sec"], 2),
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)
+            })
+        except PipelineBusyError as e:
+            await websocket.send_json({"type": "error", "detail": str(e), "retry_after": e.retry_after})
+        finally:
+            transcriber.reset()
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            if message.get("bytes") is not None:
+                pcm = np.frombuffer(message["bytes"], dtype="<i2").astype(np.float32) / 32768.0
+                event = transcriber.push(pcm)
+                
+                if event == "start":
+                    await websocket.send_json({"type": "vad", "event": "start"})
+                if event == "end":
+                    await send_final()
+                elif transcriber.full:
+                    # Enunciado demasiado largo: se cierra sin esperar al
+                    # silencio; si aún no hubo voz solo se descarta el audio
+                    if transcriber.had_speech:
+                        logger.warning(f"⚠️ Enunciado de {transcriber.duration:.0f}s: se cierra en el límite")
+                        await send_final()
+                    else:
+                        transcriber.reset()
+                elif transcriber.partial_due() and pipeline.stages["stt"].queue_depth == 0:
+                    # Parcial en segundo plano para no dejar de recibir audio
+                    task = asyncio.create_task(send_partial())
+                    partial_tasks.add(task)
+                    task.add_done_callback(partial_tasks.discard)
+            
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if control.get("type") == "end":
+                    await send_final()
+    except WebSocketDisconnect:
+        pass
     finally:
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
+        for task in partial_tasks:
+            task.cancel()
+
+
+# Respuestas de emergencia (frases fijas, presintetizadas en el caché de TTS)
+EMERGENCY_EMPTY_RESPONSES = [
+    "Perdón... ¿decías algo? Es que estoy un poco distraído.",
+    "No te escuché bien... lo siento, estoy nervioso.",
+]
+EMERGENCY_HIGH_STRESS_RESPONSE = "Es que... no sé cómo explicarlo. Todo me supera últimamente."
+EMERGENCY_MID_STRESS_RESPONSE = "Sí... entiendo. Es difícil hablar de esto."
+EMERGENCY_LOW_STRESS_RESPONSE = "Gracias... creo que hablar de esto me ayuda un poco."
 
 
 def _get_emergency_response(stress_level: int, is_empty: bool) -> str:
     """Respuesta de emergencia cuando ni el LLM ni las offline funcionan."""
     import random
     if is_empty:
-        return random.choice([
-            "Perdón... ¿decías algo? Es que estoy un poco distraído.",
-            "No te escuché bien... lo siento, estoy nervioso.",
-        ])
+        return random.choice(EMERGENCY_EMPTY_RESPONSES)
     if stress_level >= 7:
-        return "Es que... no sé cómo explicarlo. Todo me supera últimamente."
+        return EMERGENCY_HIGH_STRESS_RESPONSE
     elif stress_level >= 4:
-        return "Sí... entiendo. Es difícil hablar de esto."
+        return EMERGENCY_MID_STRESS_RESPONSE
     else:
-        return "Gracias... creo que hablar de esto me ayuda un poco."
+        return EMERGENCY_LOW_STRESS_RESPONSE
+
+
+def canned_utterances() -> List[Tuple[str, range]]:
+    """Frases fijas del avatar con los niveles de estrés en que pueden decirse."""
+    utterances = [(text, range(0, 11)) for text in EMERGENCY_EMPTY_RESPONSES]
+    utterances += [
+        (EMERGENCY_HIGH_STRESS_RESPONSE, range(7, 11)),
+        (EMERGENCY_MID_STRESS_RESPONSE, range(4, 7)),
+        (EMERGENCY_LOW_STRESS_RESPONSE, range(0, 4)),
+    ]
+    try:
+        from services.llm_service import offline_utterances
+        utterances += offline_utterances()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron cargar las respuestas offline del LLM: {e}")
+    return utterances
+
+
+def presynthesize_canned():
+    """Sintetiza en el caché de TTS todas las frases fijas (se llama al arrancar)."""
+    cache, tts = _get_tts_cache(), _get_tts()
+    if cache is None or tts is None:
+        return
+    cache.presynthesize(tts, canned_utterances())
 
 
 @router.get("/session/start")
@@ -245,9 +858,9 @@ async def start_session(user_id: str = Query(None)):
             "initial_stress": initial_stress,
             "total_turns": 0
         })
-        print(f"✅ Sesión creada en BD: {session_id}")
+        logger.info(f"✅ Sesión creada en BD: {session_id}")
     except Exception as e:
-        print(f"⚠️ No se pudo guardar sesión en BD: {e}")
+        logger.warning(f"⚠️ No se pudo guardar sesión en BD: {e}")
     
     return {
         "session_id": session_id,
@@ -259,11 +872,25 @@ async def start_session(user_id: str = Query(None)):
 @router.post("/session/{session_id}/end")
 async def end_session(session_id: str, result: str = "abandoned", final_stress: int = 5):
     """Finaliza una sesión de entrenamiento."""
+    # Los audios de la sesión ya no se van a pedir (aunque falle la BD)
+    removed = get_audio_store().remove_session(session_id) + get_memory_audio().remove_session(session_id)
+    get_session_history().remove(session_id)
+    if removed:
+        logger.info(f"🧹 {removed} audios de la sesión {session_id} eliminados")
+    
     try:
-        from services.database import get_db
+        from services.database import JOURNALED, get_db
+        await _flush_turns()
         db = await get_db()
         success = await db.end_session(session_id, result, final_stress)
         
+        if success == JOURNALED:
+            # BD caída: se guardará al reconectar; /stats aún no la incluye
+            return {
+                "status": "pending",
+                "message": f"Sesión {session_id} finalizada como {result}; se guardará cuando vuelva la BD",
+                "pending": True
+            }
         if success:
             return {"status": "ok", "message": f"Sesión {session_id} finalizada como {result}"}
         else:
@@ -277,6 +904,7 @@ async def get_session(session_id: str):
     """Obtiene información de una sesión."""
     try:
         from services.database import get_db
+        await _flush_turns()  # total_turns al día
         db = await get_db()
         session = await db.get_session(session_id)
         
@@ -291,13 +919,37 @@ async def get_session(session_id: str):
 
 
 @router.get("/session/{session_id}/turns")
-async def get_session_turns(session_id: str):
-    """Obtiene los turnos de conversación de una sesión."""
+async def get_session_turns(
+    session_id: str,
+    after_turn: Optional[int] = Query(None, description="turn_number del último turno recibido"),
+    limit: int = Query(100, ge=1, le=1000),
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Obtiene los turnos de conversación de una sesión.
+    
+    - json: una página de hasta `limit` turnos; `next_after_turn` es el
+      valor de `after_turn` para pedir la siguiente (None si no hay más)
+    - ndjson: todos los turnos desde `after_turn`, uno por línea según los
+      va leyendo el cursor (sin cargarlos todos en memoria)
+    """
     try:
         from services.database import get_db
+        await _flush_turns()
         db = await get_db()
-        turns = await db.get_session_turns(session_id)
-        return {"session_id": session_id, "turns": turns}
+        if format == "ndjson":
+            async def body():
+                async for turn in db.iter_session_turns(session_id, after_turn):
+                    yield (json.dumps(jsonable_encoder(turn), ensure_ascii=False) + "\n").encode("utf-8")
+            
+            return StreamingResponse(body(), media_type="application/x-ndjson")
+        
+        turns = await db.get_session_turns(session_id, after_turn, limit)
+        return {
+            "session_id": session_id,
+            "turns": turns,
+            "next_after_turn": turns[-1]["turn_number"] if len(turns) == limit else None
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -309,11 +961,47 @@ async def get_user_stats(user_id: str):
         from services.database import get_db
         db = await get_db()
         stats = await db.get_user_stats(user_id)
+        if db.pending_writes:
+            # Hay sesiones en el diario: las estadísticas pueden no incluirlas
+            stats = dict(stats, pending=True)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/audio/{audio_id}.mp3")
+async def get_memory_audio_clip(audio_id: str, request: Request):
+    """
+    Sirve un audio de respuesta guardado en memoria (AUDIO_SERVE_MODE=memory).
+    
+    Soporta ETag/If-None-Match (304) y peticiones Range de un solo rango (206).
+    """
+    clip = get_memory_audio().get(audio_id)
+    if clip is None:
+        raise HTTPException(status_code=404, detail="Audio no encontrado o expirado")
+    
+    size = len(clip.data)
+    headers = {
+        "ETag": clip.etag,
+        "Accept-Ranges": "bytes",
+        # El id es único por respuesta: el contenido nunca cambia
+        "Cache-Control": "private, max-age=3600, immutable",
+    }
+    if request.headers.get("if-none-match") == clip.etag:
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range == "unsatisfiable":
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(clip.data[start:end + 1], status_code=206, media_type=clip.media_type, headers=headers)
+    # Response añade Content-Length
+    return Response(clip.data, media_type=clip.media_type, headers=headers)
+
+
 class SynthesizeRequest(BaseModel):
     text: str
     stress_level: int = 5
@@ -323,8 +1011,7 @@ class SynthesizeRequest(BaseModel):
 async def synthesize_text(request: SynthesizeRequest):
     """Sintetizar texto a voz."""
     temp_id = str(uuid.uuid4())
-    audio_output_filename = f"{temp_id}_tts.mp3"
-    audio_output_path = f"temp/{audio_output_filename}"
+    audio_output_path = f"temp/{temp_id}_tts.mp3"
     os.makedirs("temp", exist_ok=True)
     
     try:
@@ -333,19 +1020,24 @@ async def synthesize_text(request: SynthesizeRequest):
         if tts is None:
             raise HTTPException(status_code=503, detail="Servicio TTS no disponible")
         
-        tts.synthesize(
+        audio = await get_pipeline().run(
+            "tts", _stage_synthesize,
             text=request.text,
             stress_level=request.stress_level,
-            output_path=audio_output_path
+            output_path=audio_output_path,
+            max_memory_bytes=_synthesis_memory_limit()
         )
+        audio_url, _ = _publish_audio(audio)
         
         return {
             "text": request.text,
-            "audio_url": f"/static/{audio_output_filename}",
+            "audio_url": audio_url,
             "stress_level": request.stress_level
         }
     except HTTPException:
         raise
+    except PipelineBusyError as e:
+        raise _busy_response(e)
     except Exception as e:
-        print(f"⚠️ Error en TTS: {e}")
+        logger.warning(f"⚠️ Error en TTS: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,91 @@
+"""
+Benchmark de motores STT: factor de tiempo real (RTF) por motor y tamaño de modelo.
+
+RTF = tiempo de transcripción / duración del audio (menor es mejor; < 1 es
+más rápido que tiempo real).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_stt --engines whisper faster-whisper \\
+        --models tiny base small --clips ruta/a/wavs --repeat 3
+
+Sin --clips usa señales sintéticas (solo útil para medir velocidad, no
+calidad de la transcripción). Los motores que no se pueden cargar se omiten.
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from scripts.check_feature_parity import synthetic_signals
+from services.audio_buffer import AudioBuffer
+from services.whisper_stt import ENGINES, create_stt_engine
+
+
+def load_clips(clips_dir):
+    if clips_dir:
+        paths = sorted(glob.glob(os.path.join(clips_dir, "*.wav")))
+        if not paths:
+            raise SystemExit(f"No hay archivos .wav en {clips_dir}")
+        return {os.path.basename(p): AudioBuffer.from_file(p) for p in paths}
+    return {name: AudioBuffer(y) for name, y in synthetic_signals().items()}
+
+
+def bench(engine_name, model_name, clips, repeat):
+    start = time.perf_counter()
+    try:
+        engine = create_stt_engine(engine_name, model_name)
+    except Exception as e:
+        print(f"  {engine_name:<15} {model_name:<8} omitido ({type(e).__name__}: {str(e).splitlines()[0][:80]})")
+        return None
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine.warmup()
+    warmup_s = time.perf_counter() - start
+
+    rtfs = []
+    for _ in range(repeat):
+        for audio in clips.values():
+            start = time.perf_counter()
+            engine._transcribe_samples(audio.samples, "es")
+            rtfs.append((time.perf_counter() - start) / max(audio.duration, 1e-6))
+
+    return {
+        "engine": engine_name,
+        "model": model_name,
+        "load_s": load_s,
+        "warmup_s": warmup_s,
+        "rtf_mean": float(np.mean(rtfs)),
+        "rtf_p95": float(np.percentile(rtfs, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    parser.add_argument("--models", nargs="+", default=["tiny", "base"])
+    parser.add_argument("--clips", help="directorio con archivos .wav")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips)
+    total = sum(a.duration for a in clips.values())
+    print(f"{len(clips)} clips, {total:.1f}s de audio, {args.repeat} repeticiones\n")
+
+    results = []
+    for engine_name in args.engines:
+        for model_name in args.models:
+            result = bench(engine_name, model_name, clips, args.repeat)
+            if result:
+                results.append(result)
+
+    print(f"\n{'motor':<15} {'modelo':<8} {'carga(s)':>9} {'warmup(s)':>10} {'RTF medio':>10} {'RTF p95':>8}")
+    for r in results:
+        print(f"{r['engine']:<15} {r['model']:<8} {r['load_s']:>9.2f} {r['warmup_s']:>10.2f} "
+              f"{r['rtf_mean']:>10.3f} {r['rtf_p95']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Servidor falso compatible con la API REST de Gemini (generateContent y
+streamGenerateContent por SSE).
+
+Sirve para probar sin red ni cuota el cliente de services/llm_client.py:
+latencia configurable, 429 con Retry-After, errores 500 y llamadas colgadas
+(para los plazos). Las respuestas salen del banco offline de LLMService.
+
+Uso (desde backend/):
+    python -m benchmarks.fake_llm_server --port 8090 --latency-ms 600 --rate-429 0.2
+    GEMINI_BASE_URL=http://localhost:8090 GEMINI_API_KEY=x uvicorn main:app
+
+En pruebas se puede usar en el mismo proceso sin abrir puertos:
+    app = create_app(FakeLLMConfig(latency_ms=50))
+    GeminiClient(..., transport=httpx.ASGITransport(app=app))
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from services.llm_service import HIGH_STRESS_RESPONSES, LOW_STRESS_RESPONSES, MID_STRESS_RESPONSES
+
+_STRESS = re.compile(r"estrés actual: (\d+)")
+
+
+@dataclass
+class FakeLLMConfig:
+    latency_ms: float = 400
+    jitter: float = 0.3
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    rate_hang: float = 0.0  # la petición no responde nunca (prueba de plazos)
+    chunk_ms: float = 40  # streaming: pausa entre fragmentos (latency_ms es hasta el primero)
+    retry_after_s: int = 30
+    counts: Dict[str, int] = field(default_factory=dict)
+
+    def count(self, outcome: str):
+        self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+
+def _error(status: int, code: str, message: str, headers=None) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"code": status, "status": code, "message": message}},
+        status_code=status, headers=headers
+    )
+
+
+def _payload(text: str, usage: dict, model: str, finish: bool = True) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate], "usageMetadata": usage, "modelVersion": model}
+
+
+async def _sse_chunks(text: str, usage: dict, model: str, chunk_ms: float):
+    """Texto en fragmentos de unas pocas palabras, como el stream de Gemini."""
+    words = text.split(" ")
+    chunks = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+    chunks[-1] = chunks[-1].rstrip()
+    for i, chunk in enumerate(chunks):
+        if i:
+            await asyncio.sleep(chunk_ms / 1000)
+        payload = _payload(chunk, usage, model, finish=i == len(chunks) - 1)
+        yield f"data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n"
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    app = FastAPI(title="Gemini falso")
+    app.state.config = config
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate(model_action: str, request: Request):
+        model, _, action = model_action.partition(":")
+        if action not in ("generateContent", "streamGenerateContent"):
+            return _error(404, "NOT_FOUND", f"Acción no soportada: {action}")
+        body = await request.json()
+        prompt = body["contents"][-1]["parts"][0]["text"]
+
+        roll = random.random()
+        if roll < config.rate_429:
+            config.count("429")
+            return _error(429, "RESOURCE_EXHAUSTED", "Quota exceeded (fake)",
+                          headers={"Retry-After": str(config.retry_after_s)})
+        roll -= config.rate_429
+        if roll < config.rate_500:
+            config.count("500")
+            return _error(500, "INTERNAL", "Internal error (fake)")
+        roll -= config.rate_500
+        if roll < config.rate_hang:
+            config.count("hang")
+            await asyncio.Event().wait()
+
+        match = _STRESS.search(prompt)
+        stress = int(match.group(1)) if match else 7
+        pool = HIGH_STRESS_RESPONSES if stress >= 7 else MID_STRESS_RESPONSES if stress >= 4 else LOW_STRESS_RESPONSES
+        # Dos frases para que el streaming tenga algo que trocear
+        text = " ".join(random.sample(pool, 2))
+        usage = {"promptTokenCount": len(prompt) // 4}
+
+        await asyncio.sleep(config.latency_ms / 1000 * random.uniform(1 - config.jitter, 1 + config.jitter))
+        config.count("ok")
+        if action == "streamGenerateContent":
+            return StreamingResponse(_sse_chunks(text, usage, model, config.chunk_ms), media_type="text/event-stream")
+        return _payload(text, usage, model)
+
+    @app.get("/stats")
+    async def stats():
+        return config.counts
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fracción de respuestas 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="fracción de respuestas 500")
+    parser.add_argument("--rate-hang", type=float, default=0.0, help="fracción de peticiones que no responden")
+    parser.add_argument("--retry-after", type=int, default=30, help="Retry-After de los 429 (s)")
+    parser.add_argument("--chunk-ms", type=float, default=40, help="pausa entre fragmentos en streaming")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = FakeLLMConfig(
+        latency_ms=args.latency_ms, jitter=args.jitter, rate_429=args.rate_429, rate_500=args.rate_500,
+        rate_hang=args.rate_hang, chunk_ms=args.chunk_ms, retry_after_s=args.retry_after
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Prueba de carga de extremo a extremo del pipeline de conversación.
+
+Cada visor simulado hace GET /api/session/start → N × POST /api/process-audio
+→ POST /api/session/{id}/end, con todos los visores en paralelo. Informa
+p50/p95/p99 por etapa (timings_ms de cada respuesta) y de extremo a extremo,
+peticiones por segundo, 503 por saturación y crecimiento de memoria (RSS).
+
+Por defecto la app se ejecuta en el mismo proceso (sin servidor) con
+sustitutos locales de Gemini, gTTS y MongoDB (benchmarks/standins.py), en un
+directorio temporal para no tocar temp/. STT, VAD y emoción son los reales.
+Con --url se ataca un servidor en marcha (sin sustitutos ni memoria).
+
+Los resultados se pueden guardar como línea base y comparar después: una
+regresión en routes.py o en un servicio aparece como diferencia de p95.
+
+Uso (desde backend/):
+    python -m benchmarks.load_test --headsets 8 --turns 5 --clips ruta/a/wavs
+    python -m benchmarks.load_test --save-baseline
+    python -m benchmarks.load_test --compare        # sale con 1 si hay regresión
+
+Sin --clips usa señales sintéticas tipo voz (no son habla real: Whisper
+devolverá poco o nada, útil para medir el pipeline, no la transcripción).
+"""
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import wave
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from scripts.check_feature_parity import synthetic_signals
+from services.audio_buffer import SAMPLE_RATE
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "load_test.json")
+PERCENTILES = (50, 95, 99)
+
+
+def wav_bytes(samples: np.ndarray, sr: int = SAMPLE_RATE) -> bytes:
+    """Codifica float32 [-1, 1] como WAV PCM de 16 bits (lo que envía Unity)."""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sr)
+        out.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def load_corpus(clips_dir: Optional[str]) -> Dict[str, bytes]:
+    if clips_dir:
+        paths = sorted(glob.glob(os.path.join(clips_dir, "*.wav")))
+        if not paths:
+            raise SystemExit(f"No hay archivos .wav en {clips_dir}")
+        corpus = {}
+        for path in paths:
+            with open(path, "rb") as f:
+                corpus[os.path.basename(path)] = f.read()
+        return corpus
+    return {name: wav_bytes(y) for name, y in synthetic_signals().items()}
+
+
+def rss_bytes() -> int:
+    """RSS actual del proceso (0 si no hay /proc)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 1) for p in PERCENTILES}
+    summary["mean"] = round(float(np.mean(values)), 1)
+    summary["n"] = len(values)
+    return summary
+
+
+class LoadResults:
+    def __init__(self):
+        self.turn_ms: List[float] = []
+        self.stage_ms: Dict[str, List[float]] = {}
+        self.session_start_ms: List[float] = []
+        self.session_end_ms: List[float] = []
+        self.status: Dict[int, int] = {}
+
+    def count(self, status: int):
+        self.status[status] = self.status.get(status, 0) + 1
+
+
+async def run_headset(client, corpus: Dict[str, bytes], turns: int, think_ms: float, results: LoadResults, rng: random.Random):
+    start = time.perf_counter()
+    response = await client.get("/api/session/start")
+    results.session_start_ms.append((time.perf_counter() - start) * 1000)
+    results.count(response.status_code)
+    if response.status_code != 200:
+        return
+    session = response.json()
+    session_id, stress = session["session_id"], session["initial_stress"]
+
+    names = list(corpus)
+    for turn in range(turns):
+        name = rng.choice(names)
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/process-audio",
+            params={"session_id": session_id, "stress_level": stress, "turn_count": turn},
+            files={"audio": (name, corpus[name], "audio/wav")}
+        )
+        elapsed = (time.perf_counter() - start) * 1000
+        results.count(response.status_code)
+        if response.status_code == 200:
+            data = response.json()
+            results.turn_ms.append(elapsed)
+            for stage, ms in data.get("timings_ms", {}).items():
+                results.stage_ms.setdefault(stage, []).append(ms)
+            stress = data["stress_level_new"]
+        if think_ms:
+            await asyncio.sleep(think_ms / 1000 * rng.uniform(0.5, 1.5))
+
+    start = time.perf_counter()
+    response = await client.post(f"/api/session/{session_id}/end", params={"final_stress": stress})
+    results.session_end_ms.append((time.perf_counter() - start) * 1000)
+    results.count(response.status_code)
+
+
+async def run_load(client, corpus, headsets: int, turns: int, think_ms: float, seed: int) -> Dict:
+    results = LoadResults()
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_headset(client, corpus, turns, think_ms, results, random.Random(rng.random()))
+        for _ in range(headsets)
+    ))
+    wall_s = time.perf_counter() - start
+    requests = sum(results.status.values())
+    return {
+        "wall_s": round(wall_s, 2),
+        "requests": requests,
+        "requests_per_s": round(requests / wall_s, 2),
+        "turns_per_s": round(len(results.turn_ms) / wall_s, 2),
+        "status": {str(k): v for k, v in sorted(results.status.items())},
+        "end_to_end_ms": summarize(results.turn_ms),
+        "session_start_ms": summarize(results.session_start_ms),
+        "session_end_ms": summarize(results.session_end_ms),
+        "stages_ms": {stage: summarize(v) for stage, v in sorted(results.stage_ms.items())},
+    }
+
+
+async def run_in_process(args, corpus) -> Dict:
+    import httpx
+
+    # Directorio de trabajo aislado: temp/, caché de TTS y almacén de audio
+    workdir = tempfile.mkdtemp(prefix="avatar-load-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    # Las frases fijas se cachean al primer uso (presintetizarlas tarda más que la prueba)
+    os.environ.setdefault("TTS_PRESYNTH", "false")
+    try:
+        from main import app
+        from benchmarks.standins import install_standins
+
+        standins = install_standins(args.llm_ms, args.tts_ms, args.db_ms)
+        random.seed(args.seed)  # latencias de los sustitutos reproducibles
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+                # Una sesión de calentamiento: carga de modelos y cachés
+                await run_headset(client, corpus, 1, 0, LoadResults(), random.Random(0))
+                rss_before = rss_bytes()
+                report = await run_load(client, corpus, args.headsets, args.turns, args.think_ms, args.seed)
+                report["rss_growth_mb"] = round((rss_bytes() - rss_before) / 2**20, 1)
+                report["rss_mb"] = round(rss_bytes() / 2**20, 1)
+        report["standin_calls"] = {"llm": standins["llm"].calls, "tts": standins["tts"].calls}
+        return report
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def run_remote(args, corpus) -> Dict:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        return await run_load(client, corpus, args.headsets, args.turns, args.think_ms, args.seed)
+
+
+def print_report(report: Dict):
+    print(f"\n{report['requests']} peticiones en {report['wall_s']}s: "
+          f"{report['requests_per_s']} req/s, {report['turns_per_s']} turnos/s, estados {report['status']}")
+    if "rss_growth_mb" in report:
+        print(f"Memoria: RSS {report['rss_mb']} MB, crecimiento {report['rss_growth_mb']} MB")
+    print(f"\n{'etapa':<18} {'p50':>8} {'p95':>8} {'p99':>8} {'n':>6}   (ms)")
+    rows = [("extremo a extremo", report["end_to_end_ms"]),
+            ("session/start", report["session_start_ms"]),
+            ("session/end", report["session_end_ms"])]
+    rows += list(report["stages_ms"].items())
+    for name, s in rows:
+        if s:
+            print(f"{name:<18} {s['p50']:>8.1f} {s['p95']:>8.1f} {s['p99']:>8.1f} {s['n']:>6}")
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """Diferencias de p95 respecto a la línea base; devuelve las regresiones."""
+    regressions = []
+    rows = [("extremo a extremo", report["end_to_end_ms"], baseline.get("end_to_end_ms", {}))]
+    rows += [(stage, s, baseline.get("stages_ms", {}).get(stage, {})) for stage, s in report["stages_ms"].items()]
+    print(f"\n{'p95 (ms)':<18} {'base':>8} {'actual':>8} {'cambio':>8}")
+    for name, current, base in rows:
+        if not current or not base:
+            continue
+        change = (current["p95"] - base["p95"]) / max(base["p95"], 1e-6)
+        # Etapas de pocos ms: el ruido relativo no es una regresión
+        flagged = change > tolerance and current["p95"] - base["p95"] > min_delta_ms
+        print(f"{name:<18} {base['p95']:>8.1f} {current['p95']:>8.1f} {change:>+7.0%}{'  ⚠️' if flagged else ''}")
+        if flagged:
+            regressions.append(name)
+    rps_change = (report["requests_per_s"] - baseline["requests_per_s"]) / max(baseline["requests_per_s"], 1e-6)
+    print(f"{'req/s':<18} {baseline['requests_per_s']:>8.2f} {report['requests_per_s']:>8.2f} {rps_change:>+7.0%}")
+    if rps_change < -tolerance:
+        regressions.append("req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--headsets", type=int, default=8, help="visores simultáneos")
+    parser.add_argument("--turns", type=int, default=5, help="turnos por sesión")
+    parser.add_argument("--think-ms", type=float, default=0, help="pausa media entre turnos")
+    parser.add_argument("--clips", help="directorio con archivos .wav en español")
+    parser.add_argument("--url", help="servidor en marcha (p.ej. http://localhost:8000)")
+    parser.add_argument("--llm-ms", type=float, default=400, help="latencia del sustituto de Gemini")
+    parser.add_argument("--tts-ms", type=float, default=300, help="latencia del sustituto de gTTS")
+    parser.add_argument("--db-ms", type=float, default=2, help="latencia del sustituto de MongoDB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="guardar el informe en este archivo")
+    parser.add_argument("--save-baseline", action="store_true", help=f"guardar como línea base ({BASELINE_PATH})")
+    parser.add_argument("--compare", action="store_true", help="comparar con la línea base")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="empeoramiento de p95 admitido (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=20, help="empeoramiento absoluto mínimo para contar como regresión")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.clips)
+    print(f"{len(corpus)} clips, {args.headsets} visores × {args.turns} turnos")
+
+    runner = run_remote if args.url else run_in_process
+    report = asyncio.run(runner(args, corpus))
+    report["config"] = {
+        "headsets": args.headsets, "turns": args.turns, "think_ms": args.think_ms,
+        "clips": args.clips or "sintéticos", "in_process": not args.url,
+        "llm_ms": args.llm_ms, "tts_ms": args.tts_ms, "db_ms": args.db_ms,
+    }
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nLínea base guardada en {BASELINE_PATH}")
+    if args.compare:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("\n⚠️ La línea base se midió con otra configuración")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ Regresiones: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ Sin regresiones respecto a la línea base")
+
+
+if __name__ == "__main__":
+    main()
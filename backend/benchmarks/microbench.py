@@ -0,0 +1,252 @@
+"""
+Microbenchmarks de cada servicio por separado.
+
+Complementan a benchmarks/load_test.py: cuando la latencia del turno cambia,
+indican qué servicio es el responsable. Cada caso informa operaciones por
+segundo, tiempo medio por operación y memoria asignada por operación
+(tracemalloc: pico y retenido tras la llamada).
+
+Casos:
+- emotion.extract_features / emotion.classify por duración de clip
+- stt.transcribe por tamaño de modelo (se omite si el motor no carga)
+- llm.offline_response, llm.build_prompt y llm.response_cache (sin llamar a Gemini)
+- tts.synthesize con gTTS sustituido (mide archivo y plumbing, no la red)
+- db.save_turn y db.insert_turns (lote de TurnWriter) con una base de Motor en memoria
+  (benchmarks/standins.py)
+
+Uso (desde backend/):
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench -k emotion --min-time 2
+    python -m benchmarks.microbench --models tiny base --json micro.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from scripts.check_feature_parity import synthetic_signals
+from services.audio_buffer import AudioBuffer
+
+CLIP_SECONDS = (0.5, 1.3, 3.0, 7.7)
+
+
+def _measure_allocations(run_batch: Callable[[int], None], n: int) -> Dict[str, float]:
+    """Pico y memoria retenida (KiB por operación) en n llamadas."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run_batch(n)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_kib": round((peak - before) / 1024, 1),
+        "alloc_retained_kib_per_op": round((after - before) / 1024 / n, 2),
+    }
+
+
+def _run(name: str, run_batch: Callable[[int], None], min_time: float, alloc_ops: int) -> Dict:
+    """Calentamiento, calibración del lote y medición hasta min_time."""
+    run_batch(1)
+    batch = 1
+    while True:
+        start = time.perf_counter()
+        run_batch(batch)
+        elapsed = time.perf_counter() - start
+        if elapsed >= 0.05 or batch >= 1_000_000:
+            break
+        batch *= 10
+
+    ops, total = 0, 0.0
+    while total < min_time:
+        start = time.perf_counter()
+        run_batch(batch)
+        total += time.perf_counter() - start
+        ops += batch
+
+    result = {
+        "name": name,
+        "ops": ops,
+        "ops_per_s": round(ops / total, 1),
+        "mean_us": round(total / ops * 1e6, 1),
+    }
+    result.update(_measure_allocations(run_batch, min(alloc_ops, max(batch, 1))))
+    return result
+
+
+def bench(name: str, func: Callable[[], object], min_time: float, alloc_ops: int = 10) -> Dict:
+    def run_batch(n: int):
+        for _ in range(n):
+            func()
+    return _run(name, run_batch, min_time, alloc_ops)
+
+
+def bench_async(name: str, func: Callable[[], Awaitable[object]], min_time: float, alloc_ops: int = 10) -> Dict:
+    """Como bench, pero el lote entero corre dentro de un mismo bucle de eventos."""
+    loop = asyncio.new_event_loop()
+
+    async def batch(n: int):
+        for _ in range(n):
+            await func()
+
+    try:
+        return _run(name, lambda n: loop.run_until_complete(batch(n)), min_time, alloc_ops)
+    finally:
+        loop.close()
+
+
+# === Casos ===
+
+def emotion_cases(min_time: float) -> List[Dict]:
+    from services.emotion_classifier import EmotionClassifier
+
+    classifier = EmotionClassifier()
+    signals = synthetic_signals()
+    results = []
+    for seconds in CLIP_SECONDS:
+        audio = AudioBuffer(signals[f"voz_{seconds}s"])
+        results.append(bench(f"emotion.extract_features[{seconds}s]", lambda: classifier.extract_features(audio), min_time))
+        results.append(bench(f"emotion.classify[{seconds}s]", lambda: classifier.classify(audio), min_time))
+    return results
+
+
+def stt_cases(min_time: float, models: List[str], engine: str) -> List[Dict]:
+    from services.whisper_stt import create_stt_engine
+
+    audio = AudioBuffer(synthetic_signals()["voz_3.0s"])
+    results = []
+    for model_name in models:
+        try:
+            stt = create_stt_engine(engine, model_name)
+        except Exception as e:
+            print(f"  stt.transcribe[{model_name}] omitido ({type(e).__name__}: {str(e).splitlines()[0][:80]})")
+            continue
+        stt.warmup()
+        results.append(bench(f"stt.transcribe[{model_name}]", lambda: stt.transcribe(audio), min_time, alloc_ops=2))
+    return results
+
+
+def llm_cases(min_time: float) -> List[Dict]:
+    # El cliente de Gemini solo se configura: no hay llamadas a la red
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    from services.llm_service import LLMService
+
+    llm = LLMService()
+    history = []
+    for i in range(10):
+        history.append({"role": "user", "content": f"Entiendo que es difícil, cuéntame más sobre el turno {i}."})
+        history.append({"role": "assistant", "content": "Es que... no sé, todo me supera últimamente en el trabajo."})
+    user_input = "Entiendo, debe ser muy difícil sentirse así todos los días."
+    return [
+        bench("llm.offline_response", lambda: llm._get_offline_response(user_input, 6, 3), min_time),
+        bench("llm.build_prompt[history=20]", lambda: llm._build_prompt(user_input, 6, history, 11), min_time),
+        bench("llm.response_cache.key[history=20]", lambda: llm.response_cache.key("¡Hola! ¿Cómo estás?", 6, history), min_time),
+    ]
+
+
+def tts_cases(min_time: float, workdir: str) -> List[Dict]:
+    import services.simple_tts as simple_tts
+
+    class StubGTTS:
+        """gTTS sin red: escribe ~1 s de MP3 de relleno."""
+
+        def __init__(self, text, lang="es", slow=False, tld="com"):
+            self.text = text
+
+        def write_to_fp(self, fp):
+            fp.write(b"ID3" + bytes(16_000))
+
+    original = simple_tts.gTTS
+    simple_tts.gTTS = StubGTTS
+    try:
+        tts = simple_tts.SimpleTTSService()
+        output = os.path.join(workdir, "bench_tts.mp3")
+        text = "No sé... es que siento que todo se me viene encima y no puedo con esto."
+        return [bench("tts.synthesize[stub gTTS]", lambda: tts.synthesize(text, 7, output), min_time)]
+    finally:
+        simple_tts.gTTS = original
+
+
+def db_cases(min_time: float) -> List[Dict]:
+    from benchmarks.standins import FakeMotorDatabase
+    from services.database import DatabaseService
+
+    service = DatabaseService()
+    saved = (service._client, service._db, service._healthy)
+    service._client, service._db, service._healthy = object(), FakeMotorDatabase(), True
+    turn = {
+        "session_id": "bench-session",
+        "turn_number": 1,
+        "user_transcription": "Entiendo, debe ser muy difícil sentirse así.",
+        "user_emotion": "empatico",
+        "emotion_confidence": 0.8,
+        "stress_before": 7,
+        "stress_after": 6,
+        "avatar_response": "Gracias... creo que hablar de esto me ayuda un poco.",
+        "audio_file": None,
+    }
+    try:
+        asyncio.run(service.create_session({"session_id": "bench-session", "total_turns": 0}))
+        # dict(turn): save_turn añade timestamp y el insert añade _id
+        def batch():
+            return [dict(turn, turn_number=i) for i in range(50)]
+
+        return [
+            bench_async("db.save_turn[in-memory motor]", lambda: service.save_turn(dict(turn)), min_time),
+            bench_async("db.insert_turns[50, in-memory motor]", lambda: service.insert_turns(batch()), min_time),
+        ]
+    finally:
+        service._client, service._db, service._healthy = saved
+
+
+def print_results(results: List[Dict]):
+    print(f"\n{'caso':<34} {'ops/s':>11} {'media':>11} {'pico KiB':>9} {'retenido KiB/op':>16}")
+    for r in results:
+        mean = f"{r['mean_us'] / 1000:.2f} ms" if r["mean_us"] >= 1000 else f"{r['mean_us']:.1f} µs"
+        print(f"{r['name']:<34} {r['ops_per_s']:>11,.1f} {mean:>11} {r['alloc_peak_kib']:>9.1f} "
+              f"{r['alloc_retained_kib_per_op']:>16.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filter", help="solo los casos cuyo nombre contiene este texto")
+    parser.add_argument("--min-time", type=float, default=1.0, help="segundos de medición por caso")
+    parser.add_argument("--models", nargs="+", default=["tiny", "base"], help="tamaños de modelo STT")
+    parser.add_argument("--engine", default="auto", help="motor STT (whisper, faster-whisper, auto)")
+    parser.add_argument("--json", help="guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="avatar-micro-")
+    groups: Dict[str, Callable[[], List[Dict]]] = {
+        "emotion": lambda: emotion_cases(args.min_time),
+        "stt": lambda: stt_cases(args.min_time, args.models, args.engine),
+        "llm": lambda: llm_cases(args.min_time),
+        "tts": lambda: tts_cases(args.min_time, workdir),
+        "db": lambda: db_cases(args.min_time),
+    }
+    results = []
+    try:
+        for group, run in groups.items():
+            # -k con nombre de grupo ("emotion", "db.save") evita cargar los demás servicios
+            if args.filter and any(g in args.filter for g in groups) and group not in args.filter:
+                continue
+            results.extend(r for r in run() if not args.filter or args.filter in r["name"])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Sustitutos locales de los servicios externos para los benchmarks.
+
+Reemplazan a Gemini (FakeLLM), gTTS (FakeTTS) y MongoDB (InMemoryDatabase,
+o FakeMotorDatabase / MongomockClient para probar DatabaseService tal cual) con latencias
+configurables, para medir el pipeline sin red ni cuotas. Las
+latencias bloquean el hilo (time.sleep) igual que los clientes reales, así
+que ocupan un worker del pool correspondiente del pipeline.
+
+Uso:
+    from benchmarks.standins import install_standins
+    install_standins(llm_ms=400, tts_ms=300)
+"""
+import asyncio
+import inspect
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from services.llm_service import HIGH_STRESS_RESPONSES, LOW_STRESS_RESPONSES, MID_STRESS_RESPONSES
+
+
+def _jittered_sleep(ms: float, jitter: float):
+    if ms > 0:
+        time.sleep(ms / 1000 * random.uniform(1 - jitter, 1 + jitter))
+
+
+class FakeLLM:
+    """Sustituto de LLMService: respuestas del banco offline tras una latencia."""
+
+    def __init__(self, latency_ms: float = 400, jitter: float = 0.3):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.calls = 0
+
+    async def generate_response_async(self, user_input: str, stress_level: int, conversation_history, turn_count: int, session_id: str = None) -> str:
+        # Como el cliente real de Gemini: espera en el event loop, sin ocupar un hilo
+        self.calls += 1
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000 * random.uniform(1 - self.jitter, 1 + self.jitter))
+        return self.reply(stress_level)
+
+    async def stream_response_async(self, user_input: str, stress_level: int, conversation_history, turn_count: int, session_id: str = None):
+        """Como generate_response_async, en fragmentos de unas pocas palabras."""
+        text = await self.generate_response_async(user_input, stress_level, conversation_history, turn_count, session_id)
+        words = text.split(" ")
+        for i in range(0, len(words), 4):
+            yield " ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "")
+
+    def reply(self, stress_level: int) -> str:
+        if stress_level >= 7:
+            return random.choice(HIGH_STRESS_RESPONSES)
+        if stress_level >= 4:
+            return random.choice(MID_STRESS_RESPONSES)
+        return random.choice(LOW_STRESS_RESPONSES)
+
+
+class FakeTTS:
+    """Sustituto de SimpleTTSService: bytes con tamaño proporcional al texto."""
+
+    def __init__(self, latency_ms: float = 300, jitter: float = 0.3, bytes_per_char: int = 400):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.bytes_per_char = bytes_per_char
+        self.calls = 0
+
+    def synthesize_bytes(self, text: str, stress_level: int) -> bytes:
+        self.calls += 1
+        _jittered_sleep(self.latency_ms, self.jitter)
+        # Cabecera ID3 para que parezca un MP3; el contenido da igual
+        return b"ID3" + bytes(len(text) * self.bytes_per_char)
+
+    def synthesize(self, text: str, stress_level: int, output_path: str = "temp_audio.mp3") -> str:
+        with open(output_path, "wb") as out:
+            out.write(self.synthesize_bytes(text, stress_level))
+        return output_path
+
+    def cache_params(self, stress_level: int) -> dict:
+        return {"engine": "fake"}
+
+
+class InMemoryDatabase:
+    """Sustituto de DatabaseService (misma interfaz, colecciones en dicts)."""
+
+    def __init__(self, latency_ms: float = 2):
+        self.latency_ms = latency_ms
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.turns: List[Dict[str, Any]] = []
+
+    async def _roundtrip(self):
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def available(self) -> bool:
+        return True
+
+    @property
+    def is_connected(self) -> bool:
+        return True
+
+    pending_writes = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"connected": True, "backend": "memory"}
+
+    async def create_session(self, session_data: Dict[str, Any]) -> Optional[str]:
+        await self._roundtrip()
+        session = dict(session_data, _id=uuid.uuid4().hex, created_at=datetime.utcnow())
+        self.sessions[session["session_id"]] = session
+        return session["_id"]
+
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        await self._roundtrip()
+        session = self.sessions.get(session_id)
+        return dict(session) if session else None
+
+    async def update_session(self, session_id: str, updates: Dict[str, Any]) -> bool:
+        await self._roundtrip()
+        if session_id not in self.sessions:
+            return False
+        self.sessions[session_id].update(updates)
+        return True
+
+    async def end_session(self, session_id: str, result: str, final_stress: int) -> bool:
+        session = self.sessions.get(session_id)
+        if not session:
+            return False
+        now = datetime.utcnow()
+        return await self.update_session(session_id, {
+            "ended_at": now,
+            "final_stress": final_stress,
+            "result": result,
+            "duration_seconds": (now - session["created_at"]).total_seconds()
+        })
+
+    async def save_turn(self, turn_data: Dict[str, Any]) -> Optional[str]:
+        await self._roundtrip()
+        turn = dict(turn_data, _id=uuid.uuid4().hex, timestamp=datetime.utcnow())
+        self.turns.append(turn)
+        session = self.sessions.get(turn["session_id"])
+        if session is not None:
+            session["total_turns"] = session.get("total_turns", 0) + 1
+        return turn["_id"]
+
+    async def insert_turns(self, turns: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        await self._roundtrip()
+        # _id en texto, como lo devuelve DatabaseService al leer
+        known = {t["_id"] for t in self.turns}
+        inserted = [t for t in turns if str(t["_id"]) not in known]
+        self.turns.extend(dict(t, _id=str(t["_id"])) for t in inserted)
+        return inserted
+
+    async def increment_session_turns(self, counts: Dict[str, int]) -> bool:
+        await self._roundtrip()
+        for session_id, count in counts.items():
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session["total_turns"] = session.get("total_turns", 0) + count
+        return True
+
+    def _session_turns(self, session_id: str, after_turn: Optional[int]) -> List[Dict]:
+        turns = (t for t in self.turns if t["session_id"] == session_id
+                 and (after_turn is None or t["turn_number"] > after_turn))
+        return sorted(turns, key=lambda t: t["turn_number"])
+
+    async def get_session_turns(self, session_id: str, after_turn: Optional[int] = None, limit: int = 100) -> List[Dict]:
+        await self._roundtrip()
+        return self._session_turns(session_id, after_turn)[:limit]
+
+    async def iter_session_turns(self, session_id: str, after_turn: Optional[int] = None, batch_size: int = 100):
+        turns = self._session_turns(session_id, after_turn)
+        for i, turn in enumerate(turns):
+            if i % batch_size == 0:
+                await self._roundtrip()
+            yield turn
+
+    async def get_recent_turns(self, session_id: str, limit: int) -> List[Dict]:
+        await self._roundtrip()
+        return self._session_turns(session_id, None)[-limit:]
+
+    async def get_user_stats(self, user_id: str) -> Dict[str, Any]:
+        return {"total_sessions": 0, "successes": 0, "success_rate": 0}
+
+
+class _InsertResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class _UpdateResult:
+    def __init__(self, matched: int):
+        self.matched_count = matched
+        self.modified_count = matched
+
+
+class FakeCollection:
+    """Colección en memoria con el subconjunto de la API de Motor que usa DatabaseService."""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.documents: List[Dict[str, Any]] = []
+
+    async def _roundtrip(self):
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    def _matches(self, document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+        return all(document.get(key) == value for key, value in query.items())
+
+    async def insert_one(self, document: Dict[str, Any]) -> _InsertResult:
+        await self._roundtrip()
+        document.setdefault("_id", uuid.uuid4().hex)
+        self.documents.append(document)
+        return _InsertResult(document["_id"])
+
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True):
+        await self._roundtrip()
+        for document in documents:
+            document.setdefault("_id", uuid.uuid4().hex)
+            self.documents.append(document)
+
+    async def bulk_write(self, requests, ordered: bool = True):
+        # Solo UpdateOne de pymongo (_filter/_doc son sus atributos internos)
+        await self._roundtrip()
+        for request in requests:
+            self._update(request._filter, request._doc)
+
+    async def find_one(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        await self._roundtrip()
+        return next((dict(d) for d in self.documents if self._matches(d, query)), None)
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any]) -> _UpdateResult:
+        await self._roundtrip()
+        return self._update(query, update)
+
+    def _update(self, query: Dict[str, Any], update: Dict[str, Any]) -> _UpdateResult:
+        for document in self.documents:
+            if self._matches(document, query):
+                document.update(update.get("$set", {}))
+                for key, amount in update.get("$inc", {}).items():
+                    document[key] = document.get(key, 0) + amount
+                return _UpdateResult(1)
+        return _UpdateResult(0)
+
+
+class FakeMotorDatabase:
+    """Base de datos de Motor en memoria: las colecciones se crean al accederlas."""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self.latency_ms)
+        return self._collections[name]
+
+    __getitem__ = __getattr__
+
+
+class _MongomockCursor:
+    """Cursor de Motor sobre uno de mongomock (sort, limit, to_list, async for)."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args):
+        self._cursor = self._cursor.sort(*args)
+        return self
+
+    def limit(self, limit: int):
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        documents = list(self._cursor)
+        return documents if length is None else documents[:length]
+
+    async def __aiter__(self):
+        for document in self._cursor:
+            yield document
+
+
+class _MongomockCollection:
+    """Colección de Motor sobre una de mongomock: los métodos pasan a ser async."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.name = collection.name
+
+    def find(self, *args, **kwargs) -> _MongomockCursor:
+        return _MongomockCursor(self._collection.find(*args, **kwargs))
+
+    def aggregate(self, pipeline, **kwargs) -> _MongomockCursor:
+        return _MongomockCursor(self._collection.aggregate(pipeline, **kwargs))
+
+    def __getattr__(self, name: str):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class MongomockDatabase:
+    """Base de datos de Motor sobre mongomock."""
+
+    def __init__(self, database):
+        self._db = database
+
+    async def command(self, *args, **kwargs):
+        return self._db.command(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> _MongomockCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _MongomockCollection(self._db[name])
+
+    __getitem__ = __getattr__
+
+
+class MongomockClient:
+    """
+    Sustituto de AsyncIOMotorClient con mongomock (pip install mongomock):
+    consultas, índices, insert_many y bulk_write reales de MongoDB sin
+    servidor (p.ej. para reproducir el diario de BD).
+    """
+
+    def __init__(self):
+        import mongomock
+        _patch_mongomock_bulk(mongomock)
+        self._client = mongomock.MongoClient()
+
+    def __getattr__(self, name: str) -> MongomockDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return MongomockDatabase(self._client[name])
+
+    __getitem__ = __getattr__
+
+    async def drop_database(self, name: str):
+        self._client.drop_database(name)
+
+    def close(self):
+        self._client.close()
+
+
+def _patch_mongomock_bulk(mongomock):
+    """pymongo >= 4.10 pasa `sort` a add_update/add_replace; mongomock 4.x no lo acepta."""
+    builder = mongomock.collection.BulkOperationBuilder
+    for name in ("add_update", "add_replace"):
+        method = getattr(builder, name)
+        if "sort" in inspect.signature(method).parameters:
+            continue
+
+        def compat(self, *args, _method=method, sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+        setattr(builder, name, compat)
+
+
+def install_standins(llm_ms: float = 400, tts_ms: float = 300, db_ms: float = 2, jitter: float = 0.3):
+    """
+    Sustituye LLM, TTS y base de datos en api.routes y services.database.
+
+    STT y emoción siguen siendo los reales (o MockWhisper si Whisper no está
+    instalado). Devuelve los sustitutos para consultar sus contadores.
+    """
+    import services.database as database
+    from api import routes
+
+    llm = FakeLLM(llm_ms, jitter)
+    tts = FakeTTS(tts_ms, jitter)
+    db = InMemoryDatabase(db_ms)
+    routes._llm = llm
+    routes._tts = tts
+    database.db_service = db
+    return {"llm": llm, "tts": tts, "db": db}
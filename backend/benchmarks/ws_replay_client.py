@@ -0,0 +1,102 @@
+"""
+Cliente de prueba para /api/ws/transcribe: reproduce archivos WAV en tiempo
+real por WebSocket y mide la latencia desde el fin de la voz hasta que llega
+la transcripción final.
+
+El fin de la voz de cada archivo se calcula con el VAD del servidor; tras el
+audio se envía silencio (o {"type": "end"} con --manual-end), como haría un
+visor con push-to-talk.
+
+Uso (desde backend/, con el servidor en marcha):
+    python -m benchmarks.ws_replay_client audio1.wav audio2.wav \\
+        --url ws://localhost:8000/api/ws/transcribe --chunk-ms 100
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+import websockets
+
+from services.audio_buffer import AudioBuffer, SAMPLE_RATE
+from services.vad import VoiceActivityDetector
+
+
+async def replay(url: str, path: str, chunk_ms: int, trailing_ms: int, manual_end: bool) -> dict:
+    audio = AudioBuffer.from_file(path)
+    vad = VoiceActivityDetector(pad_ms=0).detect(audio)
+    speech_end = vad.end if vad.is_speech else len(audio.samples)
+
+    pcm = (np.clip(audio.samples, -1, 1) * 32767).astype("<i2")
+    chunk = SAMPLE_RATE * chunk_ms // 1000
+    silence = np.zeros(chunk, dtype="<i2").tobytes()
+
+    result = {"file": path, "duration_s": audio.duration, "partials": 0}
+    async with websockets.connect(url, max_size=None) as ws:
+        final = asyncio.get_running_loop().create_future()
+        speech_end_at = None
+
+        async def receive():
+            async for message in ws:
+                data = json.loads(message)
+                if data["type"] == "partial":
+                    result["partials"] += 1
+                elif data["type"] in ("final", "error") and not final.done():
+                    final.set_result((time.perf_counter(), data))
+
+        receiver = asyncio.create_task(receive())
+        start = time.perf_counter()
+        for i, offset in enumerate(range(0, len(pcm), chunk)):
+            # Ritmo de tiempo real
+            await asyncio.sleep(max(0.0, start + i * chunk_ms / 1000 - time.perf_counter()))
+            await ws.send(pcm[offset:offset + chunk].tobytes())
+            if speech_end_at is None and offset + chunk >= speech_end:
+                speech_end_at = time.perf_counter()
+
+        if manual_end:
+            await ws.send(json.dumps({"type": "end"}))
+        else:
+            sent = 0
+            while not final.done() and sent < trailing_ms:
+                await asyncio.sleep(chunk_ms / 1000)
+                await ws.send(silence)
+                sent += chunk_ms
+            if not final.done():
+                await ws.send(json.dumps({"type": "end"}))
+
+        received_at, data = await asyncio.wait_for(final, timeout=60)
+        receiver.cancel()
+
+    result.update({
+        "end_of_speech_to_final_ms": (received_at - speech_end_at) * 1000,
+        "server_latency_ms": data.get("latency_ms"),
+        "text": data.get("transcription", data.get("detail")),
+    })
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wavs", nargs="+")
+    parser.add_argument("--url", default="ws://localhost:8000/api/ws/transcribe")
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--trailing-ms", type=int, default=3000, help="silencio máximo enviado tras el audio")
+    parser.add_argument("--manual-end", action="store_true", help="enviar 'end' en lugar de esperar al VAD")
+    args = parser.parse_args()
+
+    results = []
+    for path in args.wavs:
+        r = await replay(args.url, path, args.chunk_ms, args.trailing_ms, args.manual_end)
+        results.append(r)
+        print(f"{r['file']}: {r['duration_s']:.1f}s, {r['partials']} parciales, "
+              f"fin de voz→final {r['end_of_speech_to_final_ms']:.0f} ms "
+              f"(servidor {r['server_latency_ms']} ms) → '{r['text']}'")
+
+    latencies = [r["end_of_speech_to_final_ms"] for r in results]
+    print(f"\nfin de voz→final: p50 {np.percentile(latencies, 50):.0f} ms, "
+          f"p95 {np.percentile(latencies, 95):.0f} ms, máx {max(latencies):.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
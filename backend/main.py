@@ -1,16 +1,58 @@
+import asyncio
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
+from services.log import configure_logging, log_context, new_request_id
+
+# Logging antes de importar los servicios (LOG_LEVEL, LOG_FORMAT)
+configure_logging()
+
 # Crear directorio temp si no existe
 os.makedirs("temp", exist_ok=True)
 
-app = FastAPI(title="VR Clinical Training API", version="1.0.0")
+import services.database as database
+from services.audio_store import get_audio_store
+from services.memory_audio import get_memory_audio
+from services.metrics import REGISTRY
+from services.pipeline import get_pipeline
+from services.response_cache import get_response_cache
+from services.session_history import get_session_history
+from services.tts_cache import get_tts_cache
+from services.turn_writer import get_turn_writer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cargar modelos y hacer una inferencia de prueba antes de aceptar peticiones
+    if os.getenv("STT_WARMUP", "true").lower() not in ("false", "0", "no"):
+        from api.routes import warmup_services
+        await asyncio.to_thread(warmup_services)
+    # Sintetizar las frases fijas del avatar en segundo plano (no bloquea el arranque)
+    presynth_task = None
+    if os.getenv("TTS_PRESYNTH", "true").lower() not in ("false", "0", "no"):
+        from api.routes import presynthesize_canned
+        presynth_task = asyncio.create_task(asyncio.to_thread(presynthesize_canned))
+    # Barrido periódico de los audios de temp/ (TTL y tamaño máximo)
+    sweeper_task = asyncio.create_task(get_audio_store().run_sweeper())
+    yield
+    sweeper_task.cancel()
+    if presynth_task is not None:
+        presynth_task.cancel()
+    from api.routes import close_services
+    await close_services()
+    # Liberar los pools de ejecución del pipeline
+    get_pipeline().shutdown(wait=False)
+
+
+app = FastAPI(title="VR Clinical Training API", version="1.0.0", lifespan=lifespan)
 
 # Configurar CORS para Unity
 app.add_middleware(
@@ -21,12 +63,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Asocia un request_id (X-Request-ID) y el session_id a los logs de la petición."""
+    request_id = request.headers.get("x-request-id") or new_request_id()
+    with log_context(request_id=request_id, session_id=request.query_params.get("session_id")):
+        response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 # Importar e incluir el router de IA
 from api.routes import router as api_router
 app.include_router(api_router, prefix="/api", tags=["IA"])
 
+class AudioStaticFiles(StaticFiles):
+    """StaticFiles que marca cada audio servido como recién usado en el almacén."""
+
+    async def get_response(self, path: str, scope):
+        get_audio_store().touch(path)
+        return await super().get_response(path, scope)
+
+
 # Servir archivos estáticos (audio generado)
-app.mount("/static", StaticFiles(directory="temp"), name="static")
+app.mount("/static", AudioStaticFiles(directory="temp"), name="static")
 
 @app.get("/")
 def read_root():
@@ -34,7 +94,45 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    tts_cache = get_tts_cache()
+    return {
+        "status": "healthy",
+        "pipeline": get_pipeline().stats(),
+        "audio_store": get_audio_store().stats(),
+        "memory_audio": get_memory_audio().stats(),
+        "session_history": get_session_history().stats(),
+        "llm_response_cache": get_response_cache().stats(),
+        "turn_writer": get_turn_writer().stats(),
+        "database": database.db_service.stats(),
+        "tts_cache": tts_cache.stats() if tts_cache is not None else None
+    }
+
+def _storage_stats():
+    """Estadísticas numéricas de los almacenes de audio para /metrics."""
+    stores = {
+        "audio_store": get_audio_store().stats(),
+        "memory_audio": get_memory_audio().stats(),
+    }
+    tts_cache = get_tts_cache()
+    if tts_cache is not None:
+        stores["tts_cache"] = tts_cache.stats()
+    return {
+        (store, field): value
+        for store, stats in stores.items()
+        for field, value in stats.items()
+    }
+
+
+REGISTRY.gauge_callback(
+    "avatar_storage", "Archivos, bytes, aciertos y expulsiones de los almacenes de audio",
+    ["store", "field"], _storage_stats
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Métricas en formato de texto de Prometheus."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,134 @@
+"""
+Prueba de extremo a extremo del diario local de MongoDB (services/db_journal.py).
+
+Contra una base de datos de prueba en un mongod local (o, con --mongomock,
+en memoria con benchmarks.standins.MongomockClient, sin servidor):
+1. simula la caída: las escrituras de DatabaseService van al diario
+   (sesiones, turnos sueltos y por lotes, cambios y fin de sesión)
+2. "recupera" la conexión y aplica el diario
+3. comprueba sesiones, turnos, total_turns y user_stats
+4. vuelve a aplicar el mismo diario y comprueba que nada cambia (idempotente)
+
+Uso (desde backend/):
+    python -m scripts.check_db_journal
+    python -m scripts.check_db_journal --db vr_training_journalcheck --keep
+    python -m scripts.check_db_journal --mongomock   # pip install mongomock
+
+Termina con código 1 si alguna comprobación falla.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+from bson import ObjectId
+
+import services.database as database
+from services.database import DatabaseService
+from services.db_journal import DBJournal
+
+
+async def write_while_down(service: DatabaseService, user_id: str) -> dict:
+    """Escrituras con MongoDB "caído" (no se vuelve a probar hasta dentro de una hora)."""
+    service._healthy = False
+    service._retry_at = time.monotonic() + 3600
+    ids = [str(uuid.uuid4()) for _ in range(2)]
+    for session_id in ids:
+        await service.create_session({"session_id": session_id, "user_id": user_id, "initial_stress": 7, "total_turns": 0})
+    turn = {"user_transcription": "hola", "user_emotion": "neutral", "emotion_confidence": 0.5,
+            "stress_before": 7, "stress_after": 6, "avatar_response": "...", "audio_file": None}
+    await service.save_turn(dict(turn, session_id=ids[0], turn_number=1))
+    batch = [dict(turn, _id=ObjectId(), session_id=ids[0], turn_number=n) for n in (2, 3)]
+    await service.insert_turns(batch)
+    await service.increment_session_turns({ids[0]: 2})
+    await service.update_session(ids[1], {"initial_stress": 5})
+    await service.end_session(ids[0], "success", 3)
+    return {"sessions": ids, "turns": {ids[0]: 3, ids[1]: 0}}
+
+
+async def verify(service: DatabaseService, user_id: str, expected: dict) -> int:
+    failures = 0
+
+    def check(ok: bool, message: str):
+        nonlocal failures
+        print(f"{'OK ' if ok else 'ERR'} {message}")
+        failures += not ok
+
+    for session_id in expected["sessions"]:
+        session = await service.get_session(session_id)
+        check(session is not None, f"sesión {session_id[:8]} guardada")
+        if session is None:
+            continue
+        turns = await service.get_session_turns(session_id)
+        want = expected["turns"][session_id]
+        check(len(turns) == want, f"sesión {session_id[:8]}: {len(turns)} turnos (esperados {want})")
+        check(session.get("total_turns") == want, f"sesión {session_id[:8]}: total_turns={session.get('total_turns')}")
+
+    first, second = [await service.get_session(sid) or {} for sid in expected["sessions"]]
+    check(first.get("result") == "success" and (first.get("duration_seconds") or 0) >= 0,
+          f"fin de sesión aplicado (result={first.get('result')}, duración={first.get('duration_seconds')})")
+    check(second.get("initial_stress") == 5, "update_session aplicado")
+    stats = await service.get_user_stats(user_id)
+    check(stats.get("total_sessions") == 1 and stats.get("successes") == 1, f"user_stats: {stats}")
+    return failures
+
+
+async def main(args) -> int:
+    database.DB_NAME = args.db
+    workdir = tempfile.mkdtemp(prefix="db-journal-")
+    service = DatabaseService()
+    service._journal = DBJournal(os.path.join(workdir, "journal.jsonl"))
+    if args.mongomock:
+        from benchmarks.standins import MongomockClient
+        # connect() usa este cliente en vez de crear uno de Motor
+        service._client = MongomockClient()
+        service._db = service._client[args.db]
+    await service.connect()
+    if not service.is_connected:
+        print(f"❌ Sin conexión a MongoDB ({database.MONGODB_URL})")
+        return 1
+
+    user_id = f"journalcheck-{uuid.uuid4().hex[:8]}"
+    try:
+        expected = await write_while_down(service, user_id)
+        journal = service._journal
+        print(f"Diario: {journal.appended} operaciones, {journal.pending_bytes} bytes")
+        shutil.copy(journal.path, os.path.join(workdir, "copy.jsonl"))
+
+        # Vuelve la conexión: available() aplica el diario en segundo plano
+        service._retry_at = 0.0
+        await service.available()
+        if service._replay_task is not None:
+            await service._replay_task
+        failures = await verify(service, user_id, expected)
+        if journal.pending_bytes:
+            print("ERR el diario no quedó vacío")
+            failures += 1
+
+        # Segunda reproducción del mismo diario: no debe cambiar nada
+        shutil.copy(os.path.join(workdir, "copy.jsonl"), journal.path)
+        replayed = await journal.replay(service._db, service.rebuild_user_stats)
+        print(f"-- segunda reproducción ({replayed} operaciones) --")
+        if replayed != journal.appended:
+            print(f"ERR se esperaban {journal.appended} operaciones")
+            failures += 1
+        failures += await verify(service, user_id, expected)
+    finally:
+        if not args.keep:
+            await service._client.drop_database(args.db)
+        await service.disconnect()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=f"{database.DB_NAME}_journalcheck", help="base de datos de prueba (se borra al terminar)")
+    parser.add_argument("--keep", action="store_true", help="no borrar la base de datos de prueba")
+    parser.add_argument("--mongomock", action="store_true", help="sin mongod: base de datos en memoria (mongomock)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,91 @@
+"""
+Verifica que AcousticFeatureExtractor reproduce el vector de 20 características
+de la implementación original de EmotionClassifier (librosa por feature).
+
+Uso (desde backend/):
+    python -m scripts.check_feature_parity [audio1.wav audio2.wav ...]
+
+Sin argumentos usa señales sintéticas de distintas duraciones. Termina con
+código 1 si alguna característica supera la tolerancia.
+"""
+import sys
+
+import librosa
+import numpy as np
+
+from services.acoustic_features import AcousticFeatureExtractor
+from services.audio_buffer import AudioBuffer, SAMPLE_RATE
+
+RTOL = 1e-3
+ATOL = 1e-4
+
+
+def reference_features(y: np.ndarray, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """Implementación original de EmotionClassifier.extract_features."""
+    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    mfcc_mean = np.mean(mfccs, axis=1)
+
+    pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+    pitch_values = []
+    for t in range(pitches.shape[1]):
+        index = magnitudes[:, t].argmax()
+        pitch = pitches[index, t]
+        if pitch > 0:
+            pitch_values.append(pitch)
+    pitch_mean = np.mean(pitch_values) if pitch_values else 0
+    pitch_std = np.std(pitch_values) if pitch_values else 0
+
+    rms = librosa.feature.rms(y=y)
+    zcr = librosa.feature.zero_crossing_rate(y)
+    spectral_centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
+    spectral_rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
+
+    return np.concatenate([
+        mfcc_mean,
+        [pitch_mean, pitch_std, np.mean(rms), np.std(rms),
+         np.mean(zcr), spectral_centroid, spectral_rolloff]
+    ])
+
+
+def synthetic_signals(sr: int = SAMPLE_RATE):
+    """Señales tipo voz: tono con vibrato y armónicos, ruido, silencio parcial."""
+    rng = np.random.default_rng(0)
+    signals = {}
+    for seconds in (0.5, 1.3, 3.0, 7.7):
+        t = np.arange(int(sr * seconds)) / sr
+        f0 = 140 + 40 * np.sin(2 * np.pi * 3 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+        envelope = np.clip(np.sin(np.pi * t / seconds) * 1.5, 0, 1)
+        y = 0.2 * voice * envelope + 0.005 * rng.standard_normal(len(t))
+        signals[f"voz_{seconds}s"] = y.astype(np.float32)
+    signals["ruido_2s"] = (0.05 * rng.standard_normal(2 * sr)).astype(np.float32)
+    gap = np.zeros(sr, dtype=np.float32)
+    signals["voz_con_silencio"] = np.concatenate([gap, signals["voz_1.3s"], gap])
+    return signals
+
+
+def main(paths):
+    if paths:
+        signals = {p: AudioBuffer.from_file(p).samples for p in paths}
+    else:
+        signals = synthetic_signals()
+
+    extractor = AcousticFeatureExtractor()
+    batch = extractor.extract_batch(list(signals.values()))
+
+    failures = 0
+    for (name, y), fast in zip(signals.items(), batch):
+        ref = reference_features(y)
+        single = extractor.extract(y)
+        ok = np.allclose(fast, ref, rtol=RTOL, atol=ATOL) and np.allclose(single, fast)
+        worst = int(np.argmax(np.abs(fast - ref) / (np.abs(ref) + ATOL)))
+        print(f"{'OK ' if ok else 'ERR'} {name:<20} peor feature #{worst}: "
+              f"ref={ref[worst]:.5f} nuevo={fast[worst]:.5f}")
+        failures += not ok
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
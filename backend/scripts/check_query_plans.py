@@ -0,0 +1,299 @@
+"""
+Comprueba con explain() que ninguna consulta de DatabaseService recorre la
+colección entera (COLLSCAN).
+
+Ejecuta todos los métodos públicos de DatabaseService contra una base de
+datos de prueba con los índices de services/database.py (INDEXES), registra
+cada consulta que hacen (find, find_one, aggregate, update, bulk_write...) y
+pide a MongoDB el plan de cada una. Si se añade un método a DatabaseService
+hay que ejercitarlo aquí: el script falla si alguno queda sin cubrir.
+
+Uso (desde backend/, con un mongod accesible en MONGODB_URL):
+    python -m scripts.check_query_plans
+    python -m scripts.check_query_plans --db vr_training_plancheck --keep
+
+Termina con código 1 si algún plan usa COLLSCAN o falta algún método.
+"""
+import argparse
+import asyncio
+import inspect
+import sys
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+
+import services.database as database
+from services.database import DatabaseService
+
+# Métodos que no consultan la BD (o solo insertan). replay_journal solo corre
+# tras una caída y sus consultas van por session_id
+NOT_QUERIES = {"connect", "disconnect", "ensure_indexes", "create_session", "insert_turns",
+               "available", "replay_journal"}
+
+
+class _RecordingCursor:
+    """Cursor de Motor que apunta sort/limit en la consulta registrada."""
+
+    def __init__(self, cursor, entry: Dict[str, Any]):
+        self._cursor = cursor
+        self._entry = entry
+
+    def sort(self, key, direction=None):
+        self._entry["sort"] = dict([(key, direction)] if direction is not None else key)
+        self._cursor = self._cursor.sort(key, direction) if direction is not None else self._cursor.sort(key)
+        return self
+
+    def limit(self, limit: int):
+        self._entry["limit"] = limit
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+
+class _RecordingCollection:
+    """Colección de Motor que registra las consultas antes de ejecutarlas."""
+
+    def __init__(self, collection, log: List[Dict[str, Any]]):
+        self._collection = collection
+        self._log = log
+
+    def _record(self, op: str, **entry) -> Dict[str, Any]:
+        entry.update(op=op, collection=self._collection.name, caller=_caller())
+        self._log.append(entry)
+        return entry
+
+    def find(self, filter=None, projection=None, **kwargs):
+        entry = self._record("find", filter=filter or {})
+        return _RecordingCursor(self._collection.find(filter, projection, **kwargs), entry)
+
+    async def find_one(self, filter=None, *args, **kwargs):
+        self._record("find", filter=filter or {}, limit=1)
+        return await self._collection.find_one(filter, *args, **kwargs)
+
+    async def count_documents(self, filter, **kwargs):
+        self._record("find", filter=filter)
+        return await self._collection.count_documents(filter, **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        self._record("aggregate", pipeline=pipeline)
+        return self._collection.aggregate(pipeline, **kwargs)
+
+    async def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        self._record("update", filter=filter, update=replacement, upsert=upsert)
+        return await self._collection.replace_one(filter, replacement, upsert=upsert, **kwargs)
+
+    async def update_one(self, filter, update, upsert=False, **kwargs):
+        self._record("update", filter=filter, update=update, upsert=upsert)
+        return await self._collection.update_one(filter, update, upsert=upsert, **kwargs)
+
+    async def update_many(self, filter, update, upsert=False, **kwargs):
+        self._record("update", filter=filter, update=update, upsert=upsert, multi=True)
+        return await self._collection.update_many(filter, update, upsert=upsert, **kwargs)
+
+    async def find_one_and_update(self, filter, update, sort=None, upsert=False, **kwargs):
+        self._record("findAndModify", filter=filter, update=update, sort=dict(sort) if sort else None, upsert=upsert)
+        return await self._collection.find_one_and_update(filter, update, sort=sort, upsert=upsert, **kwargs)
+
+    async def delete_one(self, filter, **kwargs):
+        self._record("delete", filter=filter, limit=1)
+        return await self._collection.delete_one(filter, **kwargs)
+
+    async def delete_many(self, filter, **kwargs):
+        self._record("delete", filter=filter, limit=0)
+        return await self._collection.delete_many(filter, **kwargs)
+
+    async def bulk_write(self, requests, **kwargs):
+        for request in requests:
+            entry = bulk_entry(request)
+            if entry is not None:
+                self._record(**entry)
+        return await self._collection.bulk_write(requests, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class RecordingDatabase:
+    """Base de datos de Motor cuyas colecciones registran las consultas en `log`."""
+
+    def __init__(self, db):
+        self._db = db
+        self.log: List[Dict[str, Any]] = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _RecordingCollection(self._db[name], self.log)
+
+    __getitem__ = __getattr__
+
+
+def bulk_entry(request) -> Optional[Dict[str, Any]]:
+    """
+    Consulta de una operación de bulk_write (None si es una inserción).
+
+    pymongo no expone el filtro ni el update de UpdateOne y compañía: se leen
+    sus atributos internos y, si cambian en otra versión, se falla en vez de
+    dejar la operación sin comprobar.
+    """
+    if isinstance(request, InsertOne):
+        return None
+    try:
+        if isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+            return {"op": "update", "filter": request._filter, "update": request._doc,
+                    "upsert": bool(request._upsert), "multi": isinstance(request, UpdateMany)}
+        if isinstance(request, (DeleteOne, DeleteMany)):
+            return {"op": "delete", "filter": request._filter, "limit": 1 if isinstance(request, DeleteOne) else 0}
+    except AttributeError as e:
+        raise RuntimeError(
+            f"{type(request).__name__} de pymongo ya no tiene {e.name}: actualiza bulk_entry() en "
+            f"scripts/check_query_plans.py"
+        ) from e
+    raise RuntimeError(f"Operación de bulk_write sin soporte: {type(request).__name__}")
+
+
+def _caller() -> Optional[str]:
+    """Método público de DatabaseService que hizo la consulta."""
+    for frame in inspect.stack()[2:]:
+        if isinstance(frame.frame.f_locals.get("self"), DatabaseService) and not frame.function.startswith("_"):
+            return frame.function
+    return None
+
+
+def explain_command(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Comando explain equivalente a la consulta registrada."""
+    collection, op = entry["collection"], entry["op"]
+    if op == "find":
+        command = {"find": collection, "filter": entry["filter"]}
+        if entry.get("sort"):
+            command["sort"] = entry["sort"]
+        if entry.get("limit"):
+            command["limit"] = entry["limit"]
+    elif op == "aggregate":
+        command = {"aggregate": collection, "pipeline": entry["pipeline"], "cursor": {}}
+    elif op == "update":
+        command = {"update": collection, "updates": [{
+            "q": entry["filter"], "u": entry["update"],
+            "upsert": entry.get("upsert", False), "multi": entry.get("multi", False)
+        }]}
+    elif op == "findAndModify":
+        command = {"findAndModify": collection, "query": entry["filter"], "update": entry["update"],
+                   "upsert": entry.get("upsert", False)}
+        if entry.get("sort"):
+            command["sort"] = entry["sort"]
+    elif op == "delete":
+        command = {"delete": collection, "deletes": [{"q": entry["filter"], "limit": entry["limit"]}]}
+    else:
+        raise ValueError(f"Operación sin explain: {op}")
+    return {"explain": command, "verbosity": "queryPlanner"}
+
+
+def winning_stages(explain: Any) -> Iterator[str]:
+    """Etapas de todos los planes ganadores de una salida de explain."""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield from _stages(value)
+            elif key != "rejectedPlans":
+                yield from winning_stages(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from winning_stages(item)
+
+
+def _stages(plan: Any) -> Iterator[str]:
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+async def exercise(service: DatabaseService) -> set:
+    """Llama a cada método de DatabaseService con datos de prueba. Devuelve los nombres."""
+    from bson import ObjectId
+
+    user_id = f"plancheck-{uuid.uuid4().hex[:8]}"
+    session_ids = [str(uuid.uuid4()) for _ in range(3)]
+    for session_id in session_ids:
+        await service.create_session({"session_id": session_id, "user_id": user_id, "initial_stress": 7, "total_turns": 0})
+    turn = {"user_transcription": "hola", "user_emotion": "neutral", "emotion_confidence": 0.5,
+            "stress_before": 7, "stress_after": 7, "avatar_response": "...", "audio_file": None}
+
+    await service.save_turn(dict(turn, session_id=session_ids[0], turn_number=1))
+    await service.insert_turns([dict(turn, _id=ObjectId(), session_id=session_ids[1], turn_number=n) for n in (1, 2)])
+    await service.increment_session_turns({session_ids[1]: 2})
+    await service.get_session(session_ids[0])
+    await service.update_session(session_ids[2], {"initial_stress": 6})
+    await service.get_session_turns(session_ids[0])
+    await service.get_session_turns(session_ids[1], after_turn=1, limit=10)
+    async for _ in service.iter_session_turns(session_ids[1]):
+        pass
+    await service.get_recent_turns(session_ids[1], 5)
+    await service.end_session(session_ids[0], "success", 3)
+    await service.end_session(session_ids[0], "failure", 5)  # ya terminada: descuenta lo anterior
+    await service.get_user_stats(user_id)
+    # Solo por usuario: la reconstrucción completa recorre todas las sesiones a propósito
+    await service.aggregate_user_stats(user_id)
+    await service.rebuild_user_stats(user_id)
+    return {"save_turn", "insert_turns", "increment_session_turns", "get_session", "update_session",
+            "get_session_turns", "get_recent_turns", "end_session", "get_user_stats", "create_session",
+            "aggregate_user_stats", "rebuild_user_stats", "iter_session_turns"}
+
+
+def public_methods() -> set:
+    return {
+        name for name, member in inspect.getmembers(DatabaseService)
+        if (inspect.iscoroutinefunction(member) or inspect.isasyncgenfunction(member)) and not name.startswith("_")
+    }
+
+
+async def main(args) -> int:
+    database.DB_NAME = args.db
+    service = DatabaseService()
+    await service.connect()
+    if not service.is_connected:
+        print(f"❌ Sin conexión a MongoDB ({database.MONGODB_URL})")
+        return 1
+
+    real_db = service._db
+    recorder = RecordingDatabase(real_db)
+    service._db = recorder
+    failures = 0
+    try:
+        covered = await exercise(service)
+        missing = public_methods() - covered - NOT_QUERIES
+        for name in sorted(missing):
+            print(f"ERR {name:<26} no se ejercita en scripts/check_query_plans.py")
+            failures += 1
+
+        for entry in recorder.log:
+            explain = await real_db.command(explain_command(entry))
+            stages = list(winning_stages(explain))
+            ok = "COLLSCAN" not in stages
+            failures += not ok
+            print(f"{'OK ' if ok else 'ERR'} {entry['caller'] or '?':<26} {entry['op']:<13} "
+                  f"{entry['collection']:<10} {' > '.join(dict.fromkeys(stages)) or '-'}")
+    finally:
+        service._db = real_db
+        if not args.keep:
+            await service._client.drop_database(args.db)
+        await service.disconnect()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=f"{database.DB_NAME}_plancheck", help="base de datos de prueba (se borra al terminar)")
+    parser.add_argument("--keep", action="store_true", help="no borrar la base de datos de prueba")
+    sys.exit(asyncio.run(main(parser.parse_args())))
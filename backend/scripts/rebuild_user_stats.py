@@ -0,0 +1,74 @@
+"""
+Recalcula la colección user_stats a partir de las sesiones terminadas.
+
+end_session mantiene user_stats al día de forma incremental, y los usuarios
+sin documento (sesiones anteriores al cambio) se calculan la primera vez que
+se leen o terminan una sesión. Este script sirve para rellenarla de una vez,
+comprobar que no se ha desviado y borrar documentos de usuarios que ya no
+tienen sesiones.
+
+Uso (desde backend/):
+    python -m scripts.rebuild_user_stats              # reescribe todos los usuarios
+    python -m scripts.rebuild_user_stats --user u123  # solo uno
+    python -m scripts.rebuild_user_stats --check      # compara sin escribir
+
+Con --check termina con código 1 si algún documento difiere del recalculado.
+"""
+import argparse
+import asyncio
+import math
+import sys
+from typing import Any, Dict, Optional
+
+from services.database import STATS_FIELDS, DatabaseService
+
+TOLERANCE = 1e-6
+
+
+def differences(stored: Optional[Dict[str, Any]], computed: Dict[str, Any]) -> Dict[str, tuple]:
+    """Campos de user_stats cuyo valor guardado no coincide con el recalculado."""
+    stored = stored or {}
+    return {
+        field: (stored.get(field, 0), computed.get(field, 0))
+        for field in STATS_FIELDS
+        if not math.isclose(stored.get(field, 0), computed.get(field, 0), rel_tol=TOLERANCE, abs_tol=TOLERANCE)
+    }
+
+
+async def check(service: DatabaseService, user_id: Optional[str]) -> int:
+    computed = {doc["_id"]: doc for doc in await service.aggregate_user_stats(user_id)}
+    query = {"_id": user_id} if user_id is not None else {}
+    stored = {doc["_id"]: doc for doc in await service._db.user_stats.find(query).to_list(length=None)}
+
+    mismatches = 0
+    for uid in sorted(set(computed) | set(stored), key=str):
+        diff = differences(stored.get(uid), computed.get(uid, {}))
+        if diff:
+            mismatches += 1
+            detail = ", ".join(f"{field}: guardado={old} real={new}" for field, (old, new) in diff.items())
+            print(f"ERR {uid}: {detail}")
+    print(f"{len(computed)} usuarios comprobados, {mismatches} con diferencias")
+    return 1 if mismatches else 0
+
+
+async def main(args) -> int:
+    service = DatabaseService()
+    await service.connect()
+    if not service.is_connected:
+        print("❌ Sin conexión a MongoDB")
+        return 1
+    try:
+        if args.check:
+            return await check(service, args.user)
+        written = await service.rebuild_user_stats(args.user)
+        print(f"✅ user_stats reescrito para {written} usuarios")
+        return 0
+    finally:
+        await service.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", help="solo este user_id")
+    parser.add_argument("--check", action="store_true", help="comparar con las sesiones sin escribir")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,290 @@
+"""
+Extractor vectorizado de características acústicas para EmotionClassifier.
+
+Calcula un único espectrograma de magnitud por enunciado y deriva de él todas
+las características (MFCCs, pitch, centroide y rolloff espectral) con NumPy
+vectorizado. RMS y ZCR se calculan en el dominio temporal sobre las mismas
+tramas del STFT. Varios enunciados se procesan juntos rellenándolos con ceros
+en un único array 2-D; las tramas de relleno se enmascaran.
+
+El vector resultante (20 dimensiones) reproduce el de la implementación
+original con librosa (mfcc, piptrack, rms, zero_crossing_rate,
+spectral_centroid, spectral_rolloff con sus parámetros por defecto).
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import scipy.fft
+from numpy.lib.stride_tricks import sliding_window_view
+
+FEATURE_DIM = 20
+PITCH_MEAN_INDEX = 13
+ENERGY_MEAN_INDEX = 15
+
+
+@lru_cache(maxsize=4)
+def _mel_basis(sr: int, n_fft: int, n_mels: int) -> np.ndarray:
+    import librosa
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+
+
+class AcousticFeatureExtractor:
+    """Características acústicas de uno o varios enunciados con un solo STFT."""
+
+    def __init__(
+        self,
+        sr: int = 16000,
+        n_fft: int = 2048,
+        hop_length: int = 512,
+        n_mfcc: int = 13,
+        n_mels: int = 128,
+        fmin: float = 150.0,
+        fmax: float = 4000.0,
+        pitch_threshold: float = 0.1,
+        roll_percent: float = 0.85,
+        top_db: float = 80.0,
+    ):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mfcc = n_mfcc
+        self.n_mels = n_mels
+        self.pitch_threshold = pitch_threshold
+        self.roll_percent = roll_percent
+        self.top_db = top_db
+
+        # Ventana Hann periódica (igual que scipy.signal.get_window('hann'))
+        n = np.arange(n_fft)
+        self.window = (0.5 - 0.5 * np.cos(2 * np.pi * n / n_fft)).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(n_fft, d=1.0 / sr)
+        fmax = min(fmax, sr / 2)
+        self.pitch_band = (self.freqs >= max(fmin, 0)) & (self.freqs < fmax)
+
+    def extract(self, y: np.ndarray) -> np.ndarray:
+        """Vector de características (FEATURE_DIM,) de un enunciado."""
+        return self.extract_batch([y])[0]
+
+    def extract_batch(self, signals: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        Vectores de características de varios enunciados.
+
+        Returns:
+            np.ndarray: (len(signals), FEATURE_DIM)
+        """
+        if len(signals) == 0:
+            return np.empty((0, FEATURE_DIM))
+
+        pad = self.n_fft // 2
+        lengths = np.array([len(y) for y in signals])
+        max_len = int(lengths.max())
+
+        # Un array 2-D con padding central "constant" (para STFT y RMS) y otro
+        # con padding "edge" solo en los bordes de cada señal (para ZCR)
+        padded = np.zeros((len(signals), max_len + 2 * pad), dtype=np.float32)
+        padded_edge = np.zeros_like(padded)
+        for i, y in enumerate(signals):
+            n = len(y)
+            padded[i, pad:pad + n] = y
+            padded_edge[i, pad:pad + n] = y
+            if n > 0:
+                padded_edge[i, :pad] = y[0]
+                padded_edge[i, pad + n:2 * pad + n] = y[-1]
+
+        # (B, T, n_fft): vistas sin copia de las tramas
+        frames = sliding_window_view(padded, self.n_fft, axis=-1)[:, ::self.hop_length]
+        frames_edge = sliding_window_view(padded_edge, self.n_fft, axis=-1)[:, ::self.hop_length]
+        n_frames = 1 + lengths // self.hop_length
+        mask = np.arange(frames.shape[1])[None, :] < n_frames[:, None]  # (B, T)
+
+        return self.reduce(self.frame_features(frames, frames_edge), mask)
+
+    def frame_features(self, frames: np.ndarray, frames_edge: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Características de cada trama (B, T[, M]).
+
+        frames_edge son las mismas tramas con padding "edge" en los bordes de
+        la señal (solo lo usa el ZCR, igual que librosa).
+        """
+        # Espectrograma de magnitud (B, T, F): el único FFT del pipeline
+        S = np.abs(scipy.fft.rfft(frames * self.window, axis=-1))
+
+        mel = (S ** 2) @ _mel_basis(self.sr, self.n_fft, self.n_mels).T  # (B, T, M)
+        return {
+            "log_mel": 10.0 * np.log10(np.maximum(mel, 1e-10)),
+            "pitch": self._frame_pitch(S),
+            "rms": np.sqrt(np.mean(frames ** 2, axis=-1)),
+            "zcr": self._zcr(frames_edge),
+            "centroid": self._spectral_centroid(S),
+            "rolloff": self._spectral_rolloff(S),
+        }
+
+    def reduce(self, per_frame: Dict[str, np.ndarray], mask: np.ndarray) -> np.ndarray:
+        """Agrega las características por trama en vectores (B, FEATURE_DIM)."""
+        mfcc_mean = self._mfcc_mean(per_frame["log_mel"], mask)
+
+        pitch = per_frame["pitch"]
+        voiced = mask & (pitch > 0)
+
+        return np.column_stack([
+            mfcc_mean,
+            _masked_mean(pitch, voiced), _masked_std(pitch, voiced),
+            _masked_mean(per_frame["rms"], mask), _masked_std(per_frame["rms"], mask),
+            _masked_mean(per_frame["zcr"], mask),
+            _masked_mean(per_frame["centroid"], mask),
+            _masked_mean(per_frame["rolloff"], mask)
+        ])
+
+    def _mfcc_mean(self, log_mel: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        # top_db relativo al máximo de cada enunciado (solo tramas válidas)
+        peak = np.where(mask[..., None], log_mel, -np.inf).max(axis=(1, 2))
+        log_mel = np.maximum(log_mel, (peak - self.top_db)[:, None, None])
+
+        # La DCT es lineal: DCT de la media == media de las DCT por trama
+        mean_log_mel = _masked_mean(log_mel, mask)
+        return scipy.fft.dct(mean_log_mel, type=2, norm="ortho", axis=-1)[:, :self.n_mfcc]
+
+    def _frame_pitch(self, S: np.ndarray) -> np.ndarray:
+        """Pitch por trama como en piptrack + argmax de magnitud (0 = sin pitch)."""
+        # Interpolación parabólica entre bins vecinos
+        prev, center, nxt = S[..., :-2], S[..., 1:-1], S[..., 2:]
+        a = nxt + prev - 2 * center
+        b = (nxt - prev) / 2
+        shift = np.zeros_like(S)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shift[..., 1:-1] = np.where(np.abs(b) >= np.abs(a), 0.0, -b / a)
+        dskew = 0.5 * np.gradient(S, axis=-1) * shift
+
+        # Máximos locales por encima del umbral relativo al pico de cada trama
+        ref = self.pitch_threshold * S.max(axis=-1, keepdims=True)
+        thresholded = S * (S > ref)
+        edge = np.pad(thresholded, [(0, 0), (0, 0), (1, 1)], mode="edge")
+        localmax = (thresholded > edge[..., :-2]) & (thresholded >= edge[..., 2:])
+        candidates = localmax & self.pitch_band
+
+        mags = np.where(candidates, S + dskew, 0.0)
+        pitches = np.where(
+            candidates, (np.arange(S.shape[-1]) + shift) * self.sr / self.n_fft, 0.0
+        )
+
+        best = mags.argmax(axis=-1)
+        return np.take_along_axis(pitches, best[..., None], axis=-1)[..., 0]
+
+    @staticmethod
+    def _zcr(frames: np.ndarray) -> np.ndarray:
+        signs = np.signbit(np.where(np.abs(frames) <= 1e-10, 0.0, frames))
+        crossings = signs[..., 1:] != signs[..., :-1]
+        return crossings.sum(axis=-1) / frames.shape[-1]
+
+    def _spectral_centroid(self, S: np.ndarray) -> np.ndarray:
+        norm = S.sum(axis=-1)
+        norm = np.where(norm < np.finfo(S.dtype).tiny, 1.0, norm)
+        return (S @ self.freqs) / norm
+
+    def _spectral_rolloff(self, S: np.ndarray) -> np.ndarray:
+        energy = np.cumsum(S, axis=-1)
+        threshold = self.roll_percent * energy[..., -1:]
+        return self.freqs[np.argmax(energy >= threshold, axis=-1)]
+
+
+class IncrementalFeatures:
+    """
+    Características de un enunciado que llega por fragmentos (streaming).
+
+    Cada push() calcula el STFT solo de las tramas nuevas que ya están
+    completas y guarda sus características por trama; finalize() aplica el
+    padding final y la misma agregación que extract(), con idéntico resultado.
+    """
+
+    def __init__(self, extractor: Optional[AcousticFeatureExtractor] = None):
+        self.extractor = extractor or get_feature_extractor()
+        self.reset()
+
+    def reset(self):
+        self.n_samples = 0
+        self._next_frame = 0
+        self._offset = 0  # índice (en coordenadas con padding) de _const[0]
+        self._const: Optional[np.ndarray] = None
+        self._edge: Optional[np.ndarray] = None
+        self._last_sample = 0.0
+        self._per_frame: List[Dict[str, np.ndarray]] = []
+
+    def push(self, samples: np.ndarray):
+        if len(samples) == 0:
+            return
+        samples = samples.astype(np.float32, copy=False)
+        pad = self.extractor.n_fft // 2
+        if self._const is None:
+            self._const = np.concatenate([np.zeros(pad, np.float32), samples])
+            self._edge = np.concatenate([np.full(pad, samples[0], np.float32), samples])
+        else:
+            self._const = np.concatenate([self._const, samples])
+            self._edge = np.concatenate([self._edge, samples])
+        self.n_samples += len(samples)
+        self._last_sample = float(samples[-1])
+        self._compute_frames()
+
+    def _compute_frames(self, limit: Optional[int] = None):
+        n_fft, hop = self.extractor.n_fft, self.extractor.hop_length
+        start = self._next_frame * hop - self._offset
+        available = len(self._const) - start - n_fft
+        if available < 0:
+            return
+        count = available // hop + 1
+        if limit is not None:
+            count = min(count, limit)
+        if count <= 0:
+            return
+
+        frames = sliding_window_view(self._const[start:], n_fft)[::hop][:count]
+        frames_edge = sliding_window_view(self._edge[start:], n_fft)[::hop][:count]
+        self._per_frame.append(self.extractor.frame_features(frames[None], frames_edge[None]))
+        self._next_frame += count
+
+        # Descartar las muestras que ya no necesita ninguna trama futura
+        drop = self._next_frame * hop - self._offset
+        self._const = self._const[drop:]
+        self._edge = self._edge[drop:]
+        self._offset += drop
+
+    def finalize(self) -> np.ndarray:
+        """Vector de características (FEATURE_DIM,) del audio recibido."""
+        if self._const is None:
+            return self.extractor.extract(np.zeros(0, np.float32))
+
+        pad = self.extractor.n_fft // 2
+        self._const = np.concatenate([self._const, np.zeros(pad, np.float32)])
+        self._edge = np.concatenate([self._edge, np.full(pad, self._last_sample, np.float32)])
+        total_frames = 1 + self.n_samples // self.extractor.hop_length
+        self._compute_frames(limit=total_frames - self._next_frame)
+
+        per_frame = {
+            key: np.concatenate([block[key] for block in self._per_frame], axis=1)
+            for key in self._per_frame[0]
+        }
+        mask = np.ones((1, self._next_frame), dtype=bool)
+        return self.extractor.reduce(per_frame, mask)[0]
+
+
+def _masked_mean(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Media sobre el eje de tramas (1) considerando solo tramas con mask."""
+    weights = mask.reshape(mask.shape + (1,) * (values.ndim - mask.ndim))
+    count = mask.sum(axis=1).reshape((-1,) + (1,) * (values.ndim - 2))
+    total = np.where(weights, values, 0.0).sum(axis=1)
+    return np.where(count > 0, total / np.maximum(count, 1), 0.0)
+
+
+def _masked_std(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    mean = _masked_mean(values, mask)
+    return np.sqrt(_masked_mean((values - mean[:, None]) ** 2, mask))
+
+
+# Instancia compartida (los filtros mel y la ventana se calculan una vez)
+_extractor = None
+
+
+def get_feature_extractor() -> AcousticFeatureExtractor:
+    global _extractor
+    if _extractor is None:
+        _extractor = AcousticFeatureExtractor()
+    return _extractor
@@ -0,0 +1,81 @@
+"""
+Buffer de audio compartido entre las etapas del pipeline.
+
+Cada subida se decodifica una sola vez, en memoria, a mono float32 a 16 kHz
+(el formato que esperan Whisper y el extractor de características). Las etapas
+reciben el mismo array de NumPy sin copias ni archivos temporales.
+"""
+import io
+import subprocess
+from dataclasses import dataclass
+
+import numpy as np
+import soundfile as sf
+
+SAMPLE_RATE = 16000
+
+
+class AudioDecodeError(ValueError):
+    """El contenido subido no se pudo decodificar como audio."""
+
+
+@dataclass(frozen=True)
+class AudioBuffer:
+    """Audio mono float32 a SAMPLE_RATE Hz, decodificado una única vez."""
+
+    samples: np.ndarray
+    sample_rate: int = SAMPLE_RATE
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "AudioBuffer":
+        """Decodifica y remuestrea los bytes de un archivo de audio."""
+        if not data:
+            raise AudioDecodeError("Audio vacío")
+
+        try:
+            # WAV/FLAC/OGG se decodifican en memoria con libsndfile
+            y, sr = sf.read(io.BytesIO(data), dtype="float32", always_2d=False)
+        except RuntimeError:
+            # Otros formatos (mp3, webm...) pasan por ffmpeg vía pipes
+            y, sr = _decode_with_ffmpeg(data), SAMPLE_RATE
+
+        if y.ndim > 1:
+            y = y.mean(axis=1)
+
+        if sr != SAMPLE_RATE:
+            import librosa
+            y = librosa.resample(y, orig_sr=sr, target_sr=SAMPLE_RATE)
+
+        return cls(np.ascontiguousarray(y, dtype=np.float32))
+
+    @classmethod
+    def from_file(cls, path: str) -> "AudioBuffer":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    @property
+    def duration(self) -> float:
+        """Duración en segundos."""
+        return len(self.samples) / self.sample_rate
+
+    @property
+    def max_amplitude(self) -> float:
+        return float(np.max(np.abs(self.samples))) if len(self.samples) > 0 else 0.0
+
+
+def _decode_with_ffmpeg(data: bytes) -> np.ndarray:
+    """Decodifica con ffmpeg (stdin → stdout) a PCM 16 bits mono 16 kHz."""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "pipe:1"
+    ]
+    try:
+        out = subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+    except FileNotFoundError as e:
+        raise AudioDecodeError("ffmpeg no disponible para decodificar el audio") from e
+    except subprocess.CalledProcessError as e:
+        raise AudioDecodeError(f"No se pudo decodificar el audio: {e.stderr.decode(errors='ignore')[-200:]}") from e
+
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
@@ -0,0 +1,205 @@
+"""
+Almacén de los audios generados por petición en temp/.
+
+Cada respuesta del avatar que no sale del caché de TTS se escribe como
+temp/{uuid}_response.mp3 (o {uuid}_tts.mp3) y se sirve en /static/. El
+almacén registra cada archivo con su sesión y los borra:
+- al terminar la sesión (/session/{id}/end)
+- cuando superan AUDIO_STORE_TTL_S desde su último uso
+- por LRU cuando el total supera AUDIO_STORE_MAX_MB
+
+El índice vive en memoria: el barrido periódico no lista el directorio.
+Solo al arrancar se recorre temp/ una vez para adoptar los archivos que
+dejó una ejecución anterior. El caché de TTS (temp/tts_cache) tiene su
+propia expulsión y no se toca.
+
+Configuración:
+- AUDIO_STORE_TTL_S: vida de un audio sin usarse (por defecto 3600)
+- AUDIO_STORE_MAX_MB: tamaño máximo del conjunto de audios (por defecto 512)
+- AUDIO_STORE_SWEEP_S: intervalo del barrido en segundo plano (por defecto 60)
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg")
+
+
+@dataclass
+class StoredAudio:
+    session_id: Optional[str]
+    size: int
+    last_used: float
+
+
+class AudioStore:
+    """Índice de los audios de temp/ con expulsión por TTL, tamaño y sesión."""
+
+    def __init__(
+        self,
+        directory: str = "temp",
+        ttl_s: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        exclude: Iterable[str] = ("tts_cache",)
+    ):
+        self.directory = directory
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.getenv("AUDIO_STORE_TTL_S", 3600))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("AUDIO_STORE_MAX_MB", 512)) * 1024 * 1024)
+        self.exclude = set(exclude)
+        self._lock = threading.Lock()
+        # nombre de archivo → datos, del menos al más recientemente usado
+        self._files: "OrderedDict[str, StoredAudio]" = OrderedDict()
+        self._sessions: Dict[str, set] = {}
+        self._total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.session_deletions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._adopt_existing()
+
+    def _adopt_existing(self):
+        """Registra (sin sesión) los audios que quedaron de ejecuciones anteriores."""
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(AUDIO_EXTENSIONS) and entry.name not in self.exclude:
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, name, size in sorted(found):
+            self._files[name] = StoredAudio(None, size, mtime)
+            self._total_bytes += size
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def register(self, filename: str, session_id: Optional[str] = None, size: Optional[int] = None):
+        """
+        Registra un audio ya escrito en temp/ (filename relativo a temp/).
+
+        Si el total supera el límite se expulsan los menos usados de inmediato.
+        """
+        if filename.split("/", 1)[0] in self.exclude:
+            return
+        if size is None:
+            try:
+                size = os.path.getsize(self.path(filename))
+            except FileNotFoundError:
+                return
+        with self._lock:
+            self._forget(filename)
+            self._files[filename] = StoredAudio(session_id, size, time.time())
+            self._total_bytes += size
+            if session_id:
+                self._sessions.setdefault(session_id, set()).add(filename)
+            evicted = self._evict_over_size(keep=filename)
+        self._delete(evicted)
+
+    def touch(self, filename: str):
+        """Marca un audio como recién usado (lo aleja de la expulsión)."""
+        with self._lock:
+            stored = self._files.get(filename)
+            if stored is not None:
+                stored.last_used = time.time()
+                self._files.move_to_end(filename)
+
+    def remove_session(self, session_id: str) -> int:
+        """Borra todos los audios de una sesión. Devuelve cuántos se borraron."""
+        with self._lock:
+            filenames = list(self._sessions.pop(session_id, ()))
+            for filename in filenames:
+                self._forget(filename)
+            self.session_deletions += len(filenames)
+        self._delete(filenames)
+        return len(filenames)
+
+    def sweep(self) -> int:
+        """Expulsa los audios caducados y los que exceden el tamaño máximo."""
+        now = time.time()
+        expired = []
+        with self._lock:
+            for filename, stored in self._files.items():
+                if now - stored.last_used < self.ttl_s:
+                    break  # orden LRU: el resto es más reciente
+                expired.append(filename)
+            for filename in expired:
+                self._forget(filename)
+            self.expirations += len(expired)
+            evicted = self._evict_over_size()
+        self._delete(expired + evicted)
+        return len(expired) + len(evicted)
+
+    def _forget(self, filename: str):
+        """Quita un archivo del índice (con el lock tomado)."""
+        stored = self._files.pop(filename, None)
+        if stored is None:
+            return
+        self._total_bytes -= stored.size
+        if stored.session_id:
+            session_files = self._sessions.get(stored.session_id)
+            if session_files is not None:
+                session_files.discard(filename)
+                if not session_files:
+                    del self._sessions[stored.session_id]
+
+    def _evict_over_size(self, keep: Optional[str] = None) -> List[str]:
+        evicted = []
+        for filename in list(self._files):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if filename == keep:
+                continue
+            self._forget(filename)
+            evicted.append(filename)
+        self.evictions += len(evicted)
+        return evicted
+
+    def _delete(self, filenames: List[str]):
+        for filename in filenames:
+            try:
+                os.remove(self.path(filename))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"⚠️ No se pudo borrar {filename}: {e}")
+
+    async def run_sweeper(self, interval_s: Optional[float] = None):
+        """Barrido periódico; se lanza como tarea en el lifespan de FastAPI."""
+        interval_s = interval_s if interval_s is not None else float(os.getenv("AUDIO_STORE_SWEEP_S", 60))
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                removed = await asyncio.to_thread(self.sweep)
+                if removed:
+                    logger.info(f"🧹 Audios expulsados de temp/: {removed}")
+            except Exception as e:
+                logger.warning(f"⚠️ Error en el barrido de temp/: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "sessions": len(self._sessions),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "session_deletions": self.session_deletions,
+            }
+
+
+# Instancia compartida
+_audio_store: Optional[AudioStore] = None
+
+
+def get_audio_store() -> AudioStore:
+    global _audio_store
+    if _audio_store is None:
+        _audio_store = AudioStore()
+    return _audio_store
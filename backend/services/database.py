@@ -1,16 +1,108 @@
 """
 Servicio de base de datos MongoDB para persistencia de sesiones.
+
+Si MongoDB no responde, el servicio lo recuerda: las llamadas siguientes no
+vuelven a esperar la conexión, sino que fallan enseguida (lecturas) o se
+apuntan en el diario local (escrituras, services/db_journal.py). Se vuelve a
+probar con espera exponencial (DB_RECONNECT_BASE_S, hasta DB_RECONNECT_MAX_S)
+y, además, el monitor del driver avisa en cuanto el servidor vuelve. Al
+recuperar la conexión el diario se aplica por lotes.
+
+Configuración:
+- MONGODB_URL, DB_NAME
+- MONGODB_MAX_POOL_SIZE / MONGODB_MIN_POOL_SIZE: conexiones del pool (por defecto 50 / 0)
+- MONGODB_TIMEOUT_MS: plazo de selección de servidor y de conexión (por defecto 2000)
+- MONGODB_SOCKET_TIMEOUT_MS: plazo por operación (por defecto 10000)
+  (las opciones que ya vengan en MONGODB_URL tienen prioridad)
+- DB_RECONNECT_BASE_S / DB_RECONNECT_MAX_S: espera entre reconexiones (por defecto 1 / 60)
+- DB_CREATE_INDEXES: crear los índices al conectar (por defecto true)
+- DB_JOURNAL_ENABLED: apuntar las escrituras en el diario si MongoDB no está (por defecto true)
 """
+import asyncio
 import os
+import time
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+from urllib.parse import parse_qs, urlsplit
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+from pymongo.monitoring import TopologyListener
+
+from services.db_journal import DUPLICATE_KEY, DBJournal, end_session_update, get_db_journal
+from services.log import get_logger
+
+logger = get_logger(__name__)
 
 # Configuración
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "vr_training")
+# Crear los índices al conectar (idempotente; desactivar si los gestiona otro)
+DB_CREATE_INDEXES = os.getenv("DB_CREATE_INDEXES", "true").lower() not in ("false", "0", "no")
+DB_JOURNAL_ENABLED = os.getenv("DB_JOURNAL_ENABLED", "true").lower() not in ("false", "0", "no")
+RECONNECT_BASE_S = float(os.getenv("DB_RECONNECT_BASE_S", 1))
+RECONNECT_MAX_S = float(os.getenv("DB_RECONNECT_MAX_S", 60))
+
+# end_session: la sesión no se pudo terminar en MongoDB, quedó en el diario
+JOURNALED = "journaled"
+
+
+def client_options(url: str) -> Dict[str, Any]:
+    """Tamaño del pool y plazos para AsyncIOMotorClient (sin pisar los de la URL)."""
+    timeout_ms = int(os.getenv("MONGODB_TIMEOUT_MS", 2000))
+    options = {
+        "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE", 50)),
+        "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", 0)),
+        "serverSelectionTimeoutMS": timeout_ms,
+        "connectTimeoutMS": timeout_ms,
+        "socketTimeoutMS": int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", 10000)),
+    }
+    in_url = {key.lower() for key in parse_qs(urlsplit(url).query)}
+    return {key: value for key, value in options.items() if key.lower() not in in_url}
+
+
+# Índices que necesitan las consultas de DatabaseService
+# (scripts/check_query_plans.py comprueba que ninguna hace COLLSCAN)
+INDEXES = {
+    "sessions": [
+        IndexModel([("session_id", ASCENDING)], unique=True, name="session_id_unique"),
+        IndexModel([("user_id", ASCENDING), ("ended_at", ASCENDING)], name="user_id_ended_at"),
+    ],
+    "turns": [
+        IndexModel([("session_id", ASCENDING), ("turn_number", ASCENDING)], name="session_id_turn_number"),
+    ],
+}
+
+
+class TurnWriteError(Exception):
+    """insert_many parcial: algunos turnos se guardaron y otros no."""
+
+    def __init__(self, message: str, inserted: List[Dict[str, Any]], failed: List[Dict[str, Any]]):
+        super().__init__(message)
+        self.inserted = inserted
+        self.failed = failed
+
+
+# Campos acumulados de user_stats (las medias se calculan al leer). Como $avg,
+# las medias ignoran las sesiones sin el dato: n_* cuenta las que lo tienen
+STATS_FIELDS = ("total_sessions", "successes", "sum_duration", "n_duration", "sum_final_stress", "n_final_stress")
+
+
+def stats_contribution(session: Dict[str, Any]) -> Dict[str, float]:
+    """Lo que aporta una sesión a user_stats (nada si no ha terminado)."""
+    if session.get("ended_at") is None:
+        return {}
+    duration, final_stress = session.get("duration_seconds"), session.get("final_stress")
+    return {
+        "total_sessions": 1,
+        "successes": 1 if session.get("result") == "success" else 0,
+        "sum_duration": duration or 0,
+        "n_duration": 0 if duration is None else 1,
+        "sum_final_stress": final_stress or 0,
+        "n_final_stress": 0 if final_stress is None else 1,
+    }
 
 
 class PyObjectId(str):
@@ -69,61 +161,193 @@ class ConversationTurnModel(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class _TopologyMonitor(TopologyListener):
+    """Avisa al servicio cuando el driver ve aparecer o desaparecer un servidor escribible."""
+
+    def __init__(self, service: "DatabaseService"):
+        self.service = service
+
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        # Se llama desde los hilos de monitorización del driver
+        self.service._set_healthy(event.new_description.has_writable_server())
+
+    def closed(self, event):
+        pass
+
+
 class DatabaseService:
     """Servicio singleton para operaciones de base de datos."""
     
     _instance = None
     _client: Optional[AsyncIOMotorClient] = None
     _db = None
+    # Estado de salud cacheado: no se espera a MongoDB en cada llamada si está caído
+    _healthy = False
+    _retry_at = 0.0
+    _backoff_s = 0.0
+    _indexes_ready = False
+    _journal: Optional[DBJournal] = None
+    _replay_task: Optional[asyncio.Task] = None
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
+            cls._instance._journal = get_db_journal() if DB_JOURNAL_ENABLED else None
         return cls._instance
     
     async def connect(self):
-        """Conecta a MongoDB."""
-        if self._client is None:
-            try:
-                self._client = AsyncIOMotorClient(MONGODB_URL)
+        """Conecta a MongoDB (o vuelve a comprobar la conexión si estaba caída)."""
+        try:
+            if self._client is None:
+                self._client = AsyncIOMotorClient(
+                    MONGODB_URL, event_listeners=[_TopologyMonitor(self)], **client_options(MONGODB_URL)
+                )
                 self._db = self._client[DB_NAME]
-                # Verificar conexión
-                await self._client.admin.command('ping')
-                print(f"✅ Conectado a MongoDB: {DB_NAME}")
+            # Verificar conexión
+            await self._client.admin.command('ping')
+        except Exception as e:
+            self._mark_down(e)
+            return
+        was_down = not self._healthy or self._backoff_s > 0
+        self._set_healthy(True)
+        self._backoff_s = 0.0
+        if was_down:
+            logger.info(f"✅ Conectado a MongoDB: {DB_NAME}")
+        if DB_CREATE_INDEXES and not self._indexes_ready:
+            await self.ensure_indexes()
+            self._indexes_ready = True
+        self._schedule_replay()
+    
+    async def available(self) -> bool:
+        """
+        True si se puede usar MongoDB. Si está caído solo se vuelve a probar
+        cuando vence la espera; mientras tanto responde al instante.
+        """
+        if self._healthy and self._db is not None:
+            self._schedule_replay()
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        # Mientras se prueba, las demás llamadas no esperan a la misma conexión
+        self._retry_at = time.monotonic() + max(self._backoff_s, RECONNECT_BASE_S)
+        await self.connect()
+        return self.is_connected
+    
+    def _set_healthy(self, healthy: bool):
+        if healthy:
+            self._healthy = True
+            self._retry_at = 0.0
+        elif self._healthy:
+            # El monitor del driver vio caer el servidor: no probar hasta la próxima espera
+            self._healthy = False
+            self._retry_at = time.monotonic() + max(self._backoff_s, RECONNECT_BASE_S)
+            logger.error("❌ MongoDB dejó de responder")
+    
+    def _mark_down(self, error: Exception):
+        """Recuerda que MongoDB no responde y programa el próximo intento."""
+        self._healthy = False
+        self._backoff_s = min(RECONNECT_MAX_S, self._backoff_s * 2 if self._backoff_s else RECONNECT_BASE_S)
+        self._retry_at = time.monotonic() + self._backoff_s
+        logger.error(f"❌ MongoDB no disponible (reintento en {self._backoff_s:.1f}s): {error}")
+    
+    def _schedule_replay(self):
+        """Aplica el diario en segundo plano si tiene operaciones pendientes."""
+        if self._journal is None or not self._journal.pending_bytes:
+            return
+        if self._replay_task is not None and not self._replay_task.done():
+            return
+        self._replay_task = asyncio.get_running_loop().create_task(self.replay_journal())
+    
+    async def replay_journal(self) -> int:
+        """Aplica las escrituras apuntadas mientras MongoDB estaba caído."""
+        if self._journal is None or not self.is_connected:
+            return 0
+        applied = 0
+        try:
+            # Lo apuntado durante una reproducción queda para la siguiente vuelta
+            while self._journal.pending_bytes:
+                replayed = await self._journal.replay(self._db, self.rebuild_user_stats)
+                if not replayed:
+                    break  # vacío, o lo está aplicando otro worker
+                applied += replayed
+        except Exception as e:
+            logger.error(f"❌ No se pudo aplicar el diario de BD: {e}")
+            if isinstance(e, ConnectionFailure):
+                self._mark_down(e)
+        return applied
+    
+    async def _wait_replay(self):
+        """Espera a que se aplique el diario pendiente (sin cancelar la reproducción)."""
+        self._schedule_replay()
+        if self._replay_task is not None and not self._replay_task.done():
+            await asyncio.shield(self._replay_task)
+    
+    async def ensure_indexes(self):
+        """Crea los índices de INDEXES si no existen; un fallo no impide usar la BD."""
+        for collection, indexes in INDEXES.items():
+            try:
+                await self._db[collection].create_indexes(indexes)
             except Exception as e:
-                print(f"❌ Error conectando a MongoDB: {e}")
-                self._client = None
-                self._db = None
+                # P.ej. session_id duplicados de antes del índice único
+                logger.error(f"❌ No se pudieron crear los índices de {collection}: {e}")
     
     async def disconnect(self):
         """Desconecta de MongoDB."""
+        if self._replay_task is not None and not self._replay_task.done():
+            await self._replay_task
         if self._client:
             self._client.close()
             self._client = None
             self._db = None
+            self._healthy = False
     
     @property
     def is_connected(self) -> bool:
-        return self._client is not None and self._db is not None
+        return self._client is not None and self._db is not None and self._healthy
+    
+    @property
+    def pending_writes(self) -> bool:
+        """True si hay escrituras en el diario que aún no están en MongoDB."""
+        return self._journal is not None and self._journal.pending_bytes > 0
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self.is_connected,
+            "retry_in_s": round(max(0.0, self._retry_at - time.monotonic()), 1),
+            "journal": self._journal.stats() if self._journal is not None else None,
+        }
+    
+    def _journal_write(self, op: str, *args) -> bool:
+        """Apunta la escritura en el diario (MongoDB no disponible). False si no hay diario."""
+        if self._journal is None:
+            return False
+        getattr(self._journal, op)(*args)
+        return True
     
     # === Operaciones de Sesión ===
     
     async def create_session(self, session_data: Dict[str, Any]) -> Optional[str]:
-        """Crea una nueva sesión."""
-        if not self.is_connected:
-            await self.connect()
-        if not self.is_connected:
-            return None
-        
+        """Crea una nueva sesión (o la apunta en el diario si MongoDB no está)."""
         session_data["created_at"] = datetime.utcnow()
-        result = await self._db.sessions.insert_one(session_data)
-        return str(result.inserted_id)
+        # _id propio: la sesión conserva el mismo si pasa por el diario
+        session_data.setdefault("_id", ObjectId())
+        if await self.available():
+            try:
+                await self._db.sessions.insert_one(session_data)
+                return str(session_data["_id"])
+            except ConnectionFailure as e:
+                self._mark_down(e)
+        
+        if not self._journal_write("create_session", session_data):
+            return None
+        return str(session_data["_id"])
     
     async def get_session(self, session_id: str) -> Optional[Dict]:
         """Obtiene una sesión por su ID."""
-        if not self.is_connected:
-            await self.connect()
-        if not self.is_connected:
+        if not await self.available():
             return None
         
         session = await self._db.sessions.find_one({"session_id": session_id})
@@ -133,96 +357,334 @@ class DatabaseService:
     
     async def update_session(self, session_id: str, updates: Dict[str, Any]) -> bool:
         """Actualiza una sesión existente."""
-        if not self.is_connected:
-            await self.connect()
-        if not self.is_connected:
-            return False
+        if await self.available():
+            try:
+                result = await self._db.sessions.update_one(
+                    {"session_id": session_id},
+                    {"$set": updates}
+                )
+                return result.modified_count > 0
+            except ConnectionFailure as e:
+                self._mark_down(e)
         
-        result = await self._db.sessions.update_one(
-            {"session_id": session_id},
-            {"$set": updates}
-        )
-        return result.modified_count > 0
+        return self._journal_write("update_session", session_id, updates)
     
-    async def end_session(self, session_id: str, result: str, final_stress: int) -> bool:
-        """Finaliza una sesión."""
-        session = await self.get_session(session_id)
-        if not session:
-            return False
+    async def end_session(self, session_id: str, result: str, final_stress: int) -> Union[bool, str]:
+        """
+        Finaliza una sesión y actualiza las estadísticas de su usuario.
         
-        duration = (datetime.utcnow() - session["created_at"]).total_seconds()
+        Devuelve True, False (no existe) o JOURNALED si MongoDB no está
+        disponible y el fin quedó en el diario (se aplicará al reconectar).
         
-        return await self.update_session(session_id, {
-            "ended_at": datetime.utcnow(),
-            "final_stress": final_stress,
-            "result": result,
-            "duration_seconds": duration
-        })
+        Un solo find_one_and_update con pipeline: la duración se calcula en
+        el servidor a partir de created_at. ended_at es la hora de la app,
+        igual que created_at (create_session) y que los fines del diario, para
+        que un desfase entre los relojes de la app y de mongod no entre en
+        duration_seconds. Si la sesión ya estaba terminada (se
+        vuelve a terminar), otro find_one_and_update devuelve el documento
+        anterior para descontar lo que aportaba a user_stats: dos fines
+        simultáneos descuentan cada uno el estado que reemplazó.
+        
+        Si no la encuentra pero el diario tiene escrituras pendientes (MongoDB
+        acaba de volver y aún no se aplicó), la sesión puede existir solo en
+        el diario: se espera a la reproducción y se reintenta. Si el diario
+        sigue pendiente (lo aplica otro worker), el fin también va al diario.
+        """
+        if await self.available():
+            try:
+                if await self._end_session(session_id, result, final_stress):
+                    return True
+                if not self.pending_writes:
+                    return False
+                await self._wait_replay()
+                if await self._end_session(session_id, result, final_stress):
+                    return True
+                if not self.pending_writes:
+                    return False
+            except ConnectionFailure as e:
+                self._mark_down(e)
+        
+        # Al reproducir el diario también se reconstruye user_stats del usuario
+        if self._journal_write("end_session", session_id, result, final_stress):
+            return JOURNALED
+        return False
+    
+    async def _end_session(self, session_id: str, result: str, final_stress: int) -> bool:
+        # MongoDB guarda las fechas con milisegundos: se trunca para que la
+        # duración calculada aquí coincida con la del servidor
+        now = datetime.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        ended = await self._db.sessions.find_one_and_update(
+            {"session_id": session_id, "ended_at": None},
+            end_session_update(result, final_stress, now, count_stats=True),
+            return_document=ReturnDocument.AFTER
+        )
+        if ended is not None:
+            before = {}
+        else:
+            # Con la misma hora el documento nuevo se conoce sin volver a leerlo
+            before = await self._db.sessions.find_one_and_update(
+                {"session_id": session_id},
+                end_session_update(result, final_stress, now, count_stats=True),
+                return_document=ReturnDocument.BEFORE
+            )
+            if before is None:
+                return False
+            created_at = before.get("created_at")
+            ended = dict(
+                before, ended_at=now, result=result, final_stress=final_stress,
+                duration_seconds=(now - created_at).total_seconds() if created_at else None
+            )
+        
+        if ended.get("user_id"):
+            await self._update_user_stats(ended["user_id"], before, ended)
+        return True
     
     # === Operaciones de Turnos ===
     
     async def save_turn(self, turn_data: Dict[str, Any]) -> Optional[str]:
         """Guarda un turno de conversación."""
-        if not self.is_connected:
-            await self.connect()
-        if not self.is_connected:
+        turn_data["timestamp"] = datetime.utcnow()
+        turn_data.setdefault("_id", ObjectId())
+        if await self.available():
+            try:
+                await self._db.turns.insert_one(turn_data)
+                
+                # Actualizar contador de turnos en la sesión
+                await self._db.sessions.update_one(
+                    {"session_id": turn_data["session_id"]},
+                    {"$inc": {"total_turns": 1}}
+                )
+                return str(turn_data["_id"])
+            except ConnectionFailure as e:
+                self._mark_down(e)
+        
+        # Al reproducir se ignora si ya estaba y se recuenta total_turns
+        if not self._journal_write("insert_turns", [turn_data]):
             return None
+        return str(turn_data["_id"])
+    
+    async def insert_turns(self, turns: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Inserta varios turnos en un solo insert_many (sin orden).
         
-        turn_data["timestamp"] = datetime.utcnow()
-        result = await self._db.turns.insert_one(turn_data)
+        Los turnos deben traer `_id` para poder reintentar: los que ya se
+        guardaron en un intento anterior (clave duplicada) se ignoran.
+        Devuelve los turnos insertados ahora (o apuntados en el diario), o
+        None si no hay conexión ni diario.
         
-        # Actualizar contador de turnos en la sesión
-        await self._db.sessions.update_one(
-            {"session_id": turn_data["session_id"]},
-            {"$inc": {"total_turns": 1}}
-        )
+        Raises:
+            TurnWriteError: parte del lote falló por otro motivo
+        """
+        if await self.available():
+            try:
+                await self._db.turns.insert_many(turns, ordered=False)
+                return turns
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                duplicates = {err["index"] for err in errors if err.get("code") == DUPLICATE_KEY}
+                failed = {err["index"] for err in errors} - duplicates
+                inserted = [t for i, t in enumerate(turns) if i not in duplicates and i not in failed]
+                if failed:
+                    raise TurnWriteError(
+                        f"{len(failed)} de {len(turns)} turnos no se guardaron",
+                        inserted, [turns[i] for i in sorted(failed)]
+                    ) from e
+                return inserted
+            except ConnectionFailure as e:
+                self._mark_down(e)
         
-        return str(result.inserted_id)
+        if not self._journal_write("insert_turns", turns):
+            return None
+        return turns
     
-    async def get_session_turns(self, session_id: str) -> List[Dict]:
-        """Obtiene todos los turnos de una sesión."""
-        if not self.is_connected:
-            await self.connect()
-        if not self.is_connected:
+    async def increment_session_turns(self, counts: Dict[str, int]) -> bool:
+        """Suma turnos a total_turns de varias sesiones en un solo bulk_write."""
+        if await self.available():
+            try:
+                await self._db.sessions.bulk_write(
+                    [UpdateOne({"session_id": session_id}, {"$inc": {"total_turns": count}})
+                     for session_id, count in counts.items()],
+                    ordered=False
+                )
+                return True
+            except ConnectionFailure as e:
+                self._mark_down(e)
+        
+        return self._journal_write("increment_session_turns", counts)
+    
+    def _turns_cursor(self, session_id: str, after_turn: Optional[int], limit: Optional[int] = None):
+        query: Dict[str, Any] = {"session_id": session_id}
+        if after_turn is not None:
+            query["turn_number"] = {"$gt": after_turn}
+        cursor = self._db.turns.find(query).sort("turn_number", 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+    
+    async def get_session_turns(
+        self, session_id: str, after_turn: Optional[int] = None, limit: int = 100
+    ) -> List[Dict]:
+        """
+        Turnos de una sesión en orden, por páginas: hasta `limit` turnos con
+        turn_number mayor que `after_turn` (el último de la página anterior).
+        """
+        if not await self.available():
             return []
         
-        cursor = self._db.turns.find({"session_id": session_id}).sort("turn_number", 1)
-        turns = await cursor.to_list(length=100)
+        turns = await self._turns_cursor(session_id, after_turn, limit).to_list(length=limit)
         
         for turn in turns:
             turn["_id"] = str(turn["_id"])
         
         return turns
     
+    async def iter_session_turns(
+        self, session_id: str, after_turn: Optional[int] = None, batch_size: int = 100
+    ) -> AsyncIterator[Dict]:
+        """Todos los turnos de una sesión, según los va entregando el cursor."""
+        if not await self.available():
+            return
+        
+        async for turn in self._turns_cursor(session_id, after_turn).batch_size(batch_size):
+            turn["_id"] = str(turn["_id"])
+            yield turn
+    
+    async def get_recent_turns(self, session_id: str, limit: int) -> List[Dict]:
+        """Últimos `limit` turnos de una sesión, del más antiguo al más reciente."""
+        if not await self.available():
+            return []
+        
+        cursor = self._db.turns.find(
+            {"session_id": session_id},
+            {"_id": 0, "turn_number": 1, "user_transcription": 1, "avatar_response": 1}
+        ).sort("turn_number", -1).limit(limit)
+        turns = await cursor.to_list(length=limit)
+        turns.reverse()
+        return turns
+    
     # === Estadísticas ===
     
+    async def _update_user_stats(self, user_id: str, before: Dict[str, Any], after: Dict[str, Any]):
+        """
+        Suma al documento de user_stats lo que cambia la sesión al terminar
+        (si ya estaba terminada, resta lo que aportaba antes).
+        
+        Si el usuario aún no tiene documento se siembra primero (ver
+        _seed_user_stats). La semilla no incluye esta sesión (ya está marcada
+        con stats_counted), así que entonces se suma entera.
+        """
+        old, new = stats_contribution(before), stats_contribution(after)
+        delta = {key: new.get(key, 0) - old.get(key, 0) for key in STATS_FIELDS}
+        updated = await self._db.user_stats.update_one(
+            {"_id": user_id},
+            {"$inc": delta, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        if updated.matched_count:
+            return
+        await self._seed_user_stats(user_id)
+        await self._db.user_stats.update_one(
+            {"_id": user_id},
+            {"$inc": {key: new.get(key, 0) for key in STATS_FIELDS}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+    
+    async def _seed_user_stats(self, user_id: str):
+        """
+        Crea el documento de user_stats de un usuario que no lo tiene con sus
+        sesiones aún no contadas una a una (stats_counted: las de antes de
+        user_stats o aplicadas desde el diario). Con $setOnInsert: si otro
+        worker lo crea a la vez, gana uno y los $inc de cada fin se suman
+        después sin pisarse.
+        """
+        computed = await self.aggregate_user_stats(user_id, uncounted_only=True)
+        seed = {key: computed[0].get(key, 0) if computed else 0 for key in STATS_FIELDS}
+        await self._db.user_stats.update_one(
+            {"_id": user_id},
+            {"$setOnInsert": dict(seed, updated_at=datetime.utcnow())},
+            upsert=True
+        )
+    
     async def get_user_stats(self, user_id: str) -> Dict[str, Any]:
-        """Obtiene estadísticas de un usuario."""
-        if not self.is_connected:
-            await self.connect()
-        if not self.is_connected:
+        """
+        Obtiene estadísticas de un usuario (documento de user_stats). Si no
+        tiene documento se siembra con sus sesiones (ver _seed_user_stats).
+        """
+        if not await self.available():
             return {}
         
+        stats = await self._db.user_stats.find_one({"_id": user_id})
+        if stats is None:
+            await self._seed_user_stats(user_id)
+            stats = await self._db.user_stats.find_one({"_id": user_id})
+        if not stats or not stats.get("total_sessions"):
+            return {"total_sessions": 0, "successes": 0, "success_rate": 0}
+        
+        total = stats["total_sessions"]
+        # Documentos sin n_*: cada sesión contaba en la media
+        n_duration = stats.get("n_duration", total)
+        n_final_stress = stats.get("n_final_stress", total)
+        return {
+            "_id": user_id,
+            "total_sessions": total,
+            "successes": stats["successes"],
+            "avg_duration": stats["sum_duration"] / n_duration if n_duration else None,
+            "avg_final_stress": stats["sum_final_stress"] / n_final_stress if n_final_stress else None,
+            "success_rate": stats["successes"] / total
+        }
+    
+    async def aggregate_user_stats(self, user_id: Optional[str] = None, uncounted_only: bool = False) -> List[Dict[str, Any]]:
+        """
+        Recalcula user_stats a partir de las sesiones terminadas (de un
+        usuario o de todos). No escribe nada. Con uncounted_only, solo las
+        que end_session no ha sumado ya a user_stats.
+        """
+        if not await self.available():
+            return []
+        
+        match: Dict[str, Any] = {"ended_at": {"$ne": None}}
+        if user_id is not None:
+            match = {"user_id": user_id, **match}
+        else:
+            match["user_id"] = {"$ne": None}
+        if uncounted_only:
+            match["stats_counted"] = {"$ne": True}
         pipeline = [
-            {"$match": {"user_id": user_id, "ended_at": {"$ne": None}}},
+            {"$match": match},
             {"$group": {
                 "_id": "$user_id",
                 "total_sessions": {"$sum": 1},
                 "successes": {"$sum": {"$cond": [{"$eq": ["$result", "success"]}, 1, 0]}},
-                "avg_duration": {"$avg": "$duration_seconds"},
-                "avg_final_stress": {"$avg": "$final_stress"}
+                "sum_duration": {"$sum": {"$ifNull": ["$duration_seconds", 0]}},
+                "n_duration": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$duration_seconds", None]}, None]}, 0, 1]}},
+                "sum_final_stress": {"$sum": {"$ifNull": ["$final_stress", 0]}},
+                "n_final_stress": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$final_stress", None]}, None]}, 0, 1]}}
             }}
         ]
-        
-        cursor = self._db.sessions.aggregate(pipeline)
-        results = await cursor.to_list(length=1)
-        
-        if results:
-            stats = results[0]
-            stats["success_rate"] = stats["successes"] / stats["total_sessions"] if stats["total_sessions"] > 0 else 0
-            return stats
-        
-        return {"total_sessions": 0, "successes": 0, "success_rate": 0}
+        return await self._db.sessions.aggregate(pipeline).to_list(length=None)
+    
+    async def rebuild_user_stats(self, user_id: Optional[str] = None) -> int:
+        """
+        Reescribe user_stats con aggregate_user_stats y borra los documentos
+        de usuarios sin sesiones terminadas. Devuelve los usuarios escritos.
+        """
+        computed = await self.aggregate_user_stats(user_id)
+        if not self.is_connected:
+            return 0
+        now = await self._write_user_stats(computed)
+        if user_id is not None:
+            if not computed:
+                await self._db.user_stats.delete_one({"_id": user_id})
+        else:
+            # Los reescritos llevan updated_at >= now; el resto ya no tiene sesiones
+            await self._db.user_stats.delete_many({"updated_at": {"$lt": now}})
+        return len(computed)
+    
+    async def _write_user_stats(self, computed: List[Dict[str, Any]]) -> datetime:
+        """Guarda documentos de aggregate_user_stats. Devuelve su updated_at."""
+        now = datetime.utcnow()
+        for stats in computed:
+            await self._db.user_stats.replace_one({"_id": stats["_id"]}, dict(stats, updated_at=now), upsert=True)
+        return now
 
 
 # Instancia singleton
@@ -230,7 +692,9 @@ db_service = DatabaseService()
 
 
 async def get_db() -> DatabaseService:
-    """Obtiene la instancia del servicio de base de datos."""
-    if not db_service.is_connected:
-        await db_service.connect()
+    """
+    Obtiene la instancia del servicio de base de datos (conectando si hace
+    falta; si MongoDB está caído no espera, ver DatabaseService.available).
+    """
+    await db_service.available()
     return db_service
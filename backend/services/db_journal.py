@@ -0,0 +1,292 @@
+"""
+Diario local (append-only) de escrituras pendientes de MongoDB.
+
+Mientras MongoDB no está disponible, DatabaseService apunta aquí las
+escrituras de sesiones y turnos en vez de perderlas: una línea JSON (formato
+extendido de BSON: fechas y ObjectId se conservan) por operación. Cuando la
+conexión vuelve, replay() las aplica por lotes en este orden:
+
+1. sesiones nuevas: un insert_many (las que ya existían se ignoran)
+2. turnos: un insert_many (ídem, cada turno lleva su `_id`)
+3. cambios de sesión ($set y fin de sesión): un bulk_write en el orden del diario
+4. total_turns de las sesiones afectadas: se recalcula contando sus turnos
+5. user_stats de los usuarios con sesiones terminadas: se reconstruye
+
+Todos los pasos son idempotentes, así que si la reproducción se corta se
+puede repetir entera. Antes de empezar el diario se renombra a
+`<ruta>.replay`: lo que se apunte mientras tanto va a un archivo nuevo.
+
+Los workers de uvicorn comparten el archivo. Cada línea se escribe con un
+bloqueo entre procesos (`<ruta>.lock`, flock o msvcrt.locking en Windows) y
+solo un worker a la vez reproduce el diario (`<ruta>.replay.lock`, sin
+esperar: si otro lo tiene, ese se encarga). El tamaño pendiente se lleva en
+memoria; lo que apunten otros workers se ve al reproducir.
+
+Configuración:
+- DB_JOURNAL_PATH: archivo del diario (por defecto data/db_journal.jsonl)
+- DB_JOURNAL_MAX_BYTES: tamaño máximo; lo que no cabe se descarta (por defecto 100 MB)
+- DB_JOURNAL_ENABLED: "false" para no guardar nada si MongoDB no está (por defecto true)
+"""
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import json_util
+from bson.json_util import JSONOptions, JSONMode
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.log import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = get_logger(__name__)
+
+DUPLICATE_KEY = 11000
+_JSON_OPTIONS = JSONOptions(json_mode=JSONMode.RELAXED, tz_aware=False)
+
+
+def end_session_update(result: str, final_stress: int, ended_at: Any, count_stats: bool = False) -> List[Dict[str, Any]]:
+    """
+    Update con pipeline que cierra una sesión con la hora `ended_at` (de la
+    app, como created_at). count_stats marca la sesión como ya sumada a
+    user_stats.
+    """
+    fields = {
+        "ended_at": ended_at,
+        "final_stress": final_stress,
+        "result": {"$literal": result},
+        "duration_seconds": {"$divide": [{"$subtract": [ended_at, "$created_at"]}, 1000]}
+    }
+    if count_stats:
+        fields["stats_counted"] = True
+    return [{"$set": fields}]
+
+
+class _FileLock:
+    """Bloqueo exclusivo entre procesos sobre un archivo auxiliar."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._pid: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if self._file is None or self._pid != os.getpid():
+            # Tras un fork el descriptor heredado compartiría el bloqueo con el padre
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a+b")
+            self._pid = os.getpid()
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            return False
+        return True
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class DBJournal:
+    """Archivo JSONL de operaciones pendientes y su reproducción en MongoDB."""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or os.getenv("DB_JOURNAL_PATH", os.path.join("data", "db_journal.jsonl"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("DB_JOURNAL_MAX_BYTES", 100 * 1024 * 1024))
+        self.replay_path = self.path + ".replay"
+        self._lock = threading.Lock()
+        self._append_lock = _FileLock(self.path + ".lock")
+        self._replay_lock = _FileLock(self.replay_path + ".lock")
+        self._replaying = False
+        # Tamaños conocidos (sin stat en cada append ni en /health)
+        self._bytes = self._size(self.path)
+        self._replay_bytes = self._size(self.replay_path)
+        self.appended = 0
+        self.dropped = 0
+        self.replayed = 0
+
+    # === Escritura ===
+
+    def append(self, op: str, **data):
+        """Apunta una operación (una línea). Si el diario está lleno se descarta."""
+        line = (json_util.dumps(dict(data, op=op), json_options=_JSON_OPTIONS) + "\n").encode("utf-8")
+        with self._lock, self._append_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as f:
+                # Abierto en modo append: tell() es el tamaño actual (con lo de otros workers)
+                size = f.tell()
+                if size + len(line) > self.max_bytes:
+                    self._bytes = size
+                    self.dropped += 1
+                    logger.error(f"❌ Diario de BD lleno ({self.max_bytes} bytes): operación {op} descartada")
+                    return
+                f.write(line)
+            self._bytes = size + len(line)
+            self.appended += 1
+
+    def create_session(self, session: Dict[str, Any]):
+        self.append("session", doc=session)
+
+    def insert_turns(self, turns: List[Dict[str, Any]]):
+        self.append("turns", docs=turns)
+
+    def increment_session_turns(self, counts: Dict[str, int]):
+        # total_turns se recalcula al reproducir: basta con saber qué sesiones
+        self.append("recount", session_ids=list(counts))
+
+    def update_session(self, session_id: str, updates: Dict[str, Any]):
+        self.append("update", session_id=session_id, updates=updates)
+
+    def end_session(self, session_id: str, result: str, final_stress: int):
+        self.append("end", session_id=session_id, result=result, final_stress=final_stress,
+                    ended_at=datetime.utcnow())
+
+    # === Lectura y reproducción ===
+
+    @staticmethod
+    def _size(path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._bytes + self._replay_bytes
+
+    def _read(self, path: str) -> List[Dict[str, Any]]:
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json_util.loads(line, json_options=_JSON_OPTIONS))
+                except ValueError:
+                    # Línea a medio escribir (corte de luz): se salta
+                    logger.warning(f"⚠️ Línea {number} del diario de BD ilegible, se ignora")
+        return records
+
+    async def replay(self, db, rebuild_user_stats=None) -> int:
+        """
+        Aplica el diario a la base de datos `db` (de Motor) y lo borra.
+
+        `rebuild_user_stats(user_id)` recalcula las estadísticas de un usuario
+        (DatabaseService.rebuild_user_stats). Devuelve las operaciones aplicadas.
+        Si falla, el archivo .replay se conserva para el siguiente intento.
+        Si otro worker lo está reproduciendo no hace nada y devuelve 0.
+        """
+        if self._replaying or not self._replay_lock.acquire(blocking=False):
+            return 0
+        self._replaying = True
+        try:
+            return await self._replay(db, rebuild_user_stats)
+        finally:
+            with self._lock:
+                self._bytes = self._size(self.path)
+                self._replay_bytes = self._size(self.replay_path)
+            self._replaying = False
+            self._replay_lock.release()
+
+    async def _replay(self, db, rebuild_user_stats) -> int:
+        with self._lock, self._append_lock:
+            if os.path.exists(self.path) and not os.path.exists(self.replay_path):
+                os.replace(self.path, self.replay_path)
+        if not os.path.exists(self.replay_path):
+            return 0
+
+        records = self._read(self.replay_path)
+        sessions = [r["doc"] for r in records if r["op"] == "session"]
+        turns = [t for r in records if r["op"] == "turns" for t in r["docs"]]
+        recount = {t["session_id"] for t in turns}
+        recount.update(sid for r in records if r["op"] == "recount" for sid in r["session_ids"])
+        ended = {r["session_id"] for r in records if r["op"] == "end"}
+        updates = []
+        for r in records:
+            if r["op"] == "update":
+                updates.append(UpdateOne({"session_id": r["session_id"]}, {"$set": r["updates"]}))
+            elif r["op"] == "end":
+                updates.append(UpdateOne(
+                    {"session_id": r["session_id"]},
+                    end_session_update(r["result"], r["final_stress"], r["ended_at"])
+                ))
+
+        await _insert_ignoring_duplicates(db.sessions, sessions)
+        await _insert_ignoring_duplicates(db.turns, turns)
+        if updates:
+            await db.sessions.bulk_write(updates, ordered=True)
+        if recount:
+            counted = await db.turns.aggregate([
+                {"$match": {"session_id": {"$in": sorted(recount)}}},
+                {"$group": {"_id": "$session_id", "total_turns": {"$sum": 1}}}
+            ]).to_list(length=None)
+            if counted:
+                await db.sessions.bulk_write(
+                    [UpdateOne({"session_id": c["_id"]}, {"$set": {"total_turns": c["total_turns"]}}) for c in counted],
+                    ordered=False
+                )
+        if ended and rebuild_user_stats is not None:
+            users = await db.sessions.distinct("user_id", {"session_id": {"$in": sorted(ended)}})
+            for user_id in users:
+                if user_id:
+                    await rebuild_user_stats(user_id)
+
+        os.remove(self.replay_path)
+        self.replayed += len(records)
+        logger.info(
+            f"✅ Diario de BD aplicado: {len(sessions)} sesiones, {len(turns)} turnos, "
+            f"{len(updates)} cambios de sesión"
+        )
+        return len(records)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_bytes": self.pending_bytes,
+            "appended": self.appended,
+            "dropped": self.dropped,
+            "replayed": self.replayed,
+        }
+
+
+async def _insert_ignoring_duplicates(collection, documents: List[Dict[str, Any]]):
+    """insert_many sin orden; los documentos que ya existen (mismo _id) se ignoran."""
+    if not documents:
+        return
+    try:
+        await collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+            raise
+
+
+# Instancia compartida
+_db_journal: Optional[DBJournal] = None
+
+
+def get_db_journal() -> DBJournal:
+    global _db_journal
+    if _db_journal is None:
+        _db_journal = DBJournal()
+    return _db_journal
@@ -0,0 +1,86 @@
+"""
+Micro-batching de la clasificación de emociones.
+
+Las peticiones que llegan con pocos milisegundos de diferencia se agrupan y
+se clasifican con una sola llamada a EmotionClassifier.classify_batch (un
+scaler.transform y un predict_proba sobre la matriz apilada).
+
+Configuración:
+- EMOTION_BATCH_MAX: tamaño máximo de un lote (por defecto 16)
+- EMOTION_BATCH_WAIT_MS: espera máxima para completar un lote (por defecto 5)
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from services.audio_buffer import AudioBuffer
+
+RunBatch = Callable[[List[AudioBuffer]], Awaitable[List[dict]]]
+
+
+class EmotionMicroBatcher:
+    """Agrupa clasificaciones concurrentes en lotes."""
+
+    def __init__(
+        self,
+        run_batch: RunBatch,
+        max_batch: Optional[int] = None,
+        max_wait_ms: Optional[float] = None
+    ):
+        self.run_batch = run_batch
+        self.max_batch = max_batch or int(os.getenv("EMOTION_BATCH_MAX", 16))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv("EMOTION_BATCH_WAIT_MS", 5))
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[AudioBuffer, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    async def classify(self, audio: AudioBuffer) -> dict:
+        """Encola un audio y espera el resultado de su lote."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((audio, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            # Mantener referencia hasta que termine
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[AudioBuffer, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.run_batch([audio for audio, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "pending": len(self._pending),
+        }
@@ -1,8 +1,16 @@
-import librosa
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 import joblib
 import os
+from typing import List, Union
+
+from services.acoustic_features import (
+    get_feature_extractor, PITCH_MEAN_INDEX, ENERGY_MEAN_INDEX
+)
+from services.audio_buffer import AudioBuffer
+from services.log import get_logger
+
+logger = get_logger(__name__)
 
 class EmotionClassifier:
     def __init__(self, model_path: str = "models/emotion_classifier.pkl"):
@@ -11,12 +19,12 @@ class EmotionClassifier:
             self.model = joblib.load(model_path)
             self.scaler = joblib.load(model_path.replace('.pkl', '_scaler.pkl'))
         else:
-            print(f"Modelo no encontrado en {model_path}")
-            print("Usar modo fallback (reglas heurísticas)")
+            logger.info(f"Modelo no encontrado en {model_path}")
+            logger.info("Usar modo fallback (reglas heurísticas)")
             self.model = None
             self.scaler = None
     
-    def extract_features(self, audio_path: str) -> np.ndarray:
+    def extract_features(self, audio: Union[AudioBuffer, str]) -> np.ndarray:
         """
         Extraer características acústicas del audio.
         
@@ -27,47 +35,18 @@ class EmotionClassifier:
         - Zero Crossing Rate
         - Spectral features
         """
-        # Cargar audio
-        y, sr = librosa.load(audio_path, sr=16000)
-        
-        # MFCCs
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        mfcc_mean = np.mean(mfccs, axis=1)
-        
-        # Pitch (usando YIN algorithm)
-        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-        pitch_values = []
-        for t in range(pitches.shape[1]):
-            index = magnitudes[:, t].argmax()
-            pitch = pitches[index, t]
-            if pitch > 0:
-                pitch_values.append(pitch)
-        pitch_mean = np.mean(pitch_values) if pitch_values else 0
-        pitch_std = np.std(pitch_values) if pitch_values else 0
-        
-        # Energy (RMS)
-        rms = librosa.feature.rms(y=y)
-        energy_mean = np.mean(rms)
-        energy_std = np.std(rms)
+        # Usar el buffer ya decodificado a 16 kHz (o cargar el archivo)
+        if isinstance(audio, str):
+            audio = AudioBuffer.from_file(audio)
         
-        # Zero Crossing Rate
-        zcr = librosa.feature.zero_crossing_rate(y)
-        zcr_mean = np.mean(zcr)
-        
-        # Spectral features
-        spectral_centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-        spectral_rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
-        
-        # Concatenar todas las features
-        features = np.concatenate([
-            mfcc_mean,
-            [pitch_mean, pitch_std, energy_mean, energy_std, 
-             zcr_mean, spectral_centroid, spectral_rolloff]
-        ])
-        
-        return features
+        # Un solo STFT vectorizado para todas las features
+        return get_feature_extractor().extract(audio.samples)
+    
+    def extract_features_batch(self, audios: List[AudioBuffer]) -> np.ndarray:
+        """Características de varios audios en una sola pasada: (n, 20)."""
+        return get_feature_extractor().extract_batch([a.samples for a in audios])
     
-    def classify(self, audio_path: str) -> dict:
+    def classify(self, audio: Union[AudioBuffer, str]) -> dict:
         """
         Clasificar emoción del audio.
         
@@ -78,34 +57,64 @@ class EmotionClassifier:
                 "features": dict
             }
         """
-        features = self.extract_features(audio_path)
+        if isinstance(audio, str):
+            audio = AudioBuffer.from_file(audio)
+        return self.classify_batch([audio])[0]
+    
+    def classify_batch(self, audios: List[AudioBuffer]) -> List[dict]:
+        """
+        Clasificar varios audios con una sola llamada a scaler y modelo.
+        
+        Returns:
+            list: un dict por audio, con el mismo formato que classify()
+        """
+        if not audios:
+            return []
         
+        features = self.extract_features_batch(audios)
+        return self.classify_features(features, [audio.duration for audio in audios])
+    
+    def classify_features(self, features: np.ndarray, durations: List[float]) -> List[dict]:
+        """
+        Clasificar vectores de características ya calculados (n, 20), por
+        ejemplo los acumulados en streaming.
+        """
         # Extraer valores para análisis
-        pitch_mean = features[13]
-        energy_mean = features[15]
+        pitch_means = features[:, PITCH_MEAN_INDEX]
+        energy_means = features[:, ENERGY_MEAN_INDEX]
         
         if self.model is not None:
-            # Usar modelo entrenado
-            features_scaled = self.scaler.transform(features.reshape(1, -1))
-            prediction = self.model.predict(features_scaled)[0]
-            probabilities = self.model.predict_proba(features_scaled)[0]
-            confidence = float(np.max(probabilities))
-            emotion = prediction
+            # Usar modelo entrenado: la etiqueta sale del argmax de las
+            # probabilidades, sin una segunda llamada a predict()
+            features_scaled = self.scaler.transform(features)
+            probabilities = self.model.predict_proba(features_scaled)
+            best = np.argmax(probabilities, axis=1)
+            emotions = self.model.classes_[best].tolist()
+            confidences = probabilities[np.arange(len(best)), best]
+            predictions = [
+                (emotion, float(confidence))
+                for emotion, confidence in zip(emotions, confidences)
+            ]
         else:
             # Fallback: reglas heurísticas simples
-            emotion, confidence = self._heuristic_classification(
-                pitch_mean, energy_mean
-            )
+            predictions = [
+                self._heuristic_classification(pitch, energy)
+                for pitch, energy in zip(pitch_means, energy_means)
+            ]
         
-        return {
-            "emotion": emotion,
-            "confidence": confidence,
-            "features": {
-                "pitch_hz": float(pitch_mean),
-                "energy_rms": float(energy_mean),
-                "duration_sec": librosa.get_duration(path=audio_path)
+        return [
+            {
+                "emotion": emotion,
+                "confidence": confidence,
+                "features": {
+                    "pitch_hz": float(pitch_mean),
+                    "energy_rms": float(energy_mean),
+                    "duration_sec": duration
+                }
             }
-        }
+            for (emotion, confidence), pitch_mean, energy_mean, duration
+            in zip(predictions, pitch_means, energy_means, durations)
+        ]
     
     def _heuristic_classification(self, pitch: float, energy: float) -> tuple:
         """Clasificación simple basada en umbrales."""
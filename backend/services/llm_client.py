@@ -0,0 +1,369 @@
+"""
+Cliente asíncrono de Gemini (API REST generateContent) con:
+
+- una sola conexión HTTP reutilizada (pool de httpx) en lugar de una llamada
+  bloqueante del SDK por turno
+- plazo por llamada: si Gemini no responde en LLM_TIMEOUT_S se abandona
+- circuit breaker: tras LLM_BREAKER_FAILURES fallos seguidos (429, timeouts,
+  5xx, errores de red) las llamadas se cortan durante LLM_BREAKER_COOLDOWN_S
+  (o lo que pida Retry-After) y LLMService pasa directamente a las respuestas
+  offline. Al terminar el enfriamiento se deja pasar una llamada de prueba.
+  Los errores de la petición concreta (otros 4xx, respuesta bloqueada, vacía
+  o no JSON: LLMRequestError) no cuentan: solo ese turno usa la respuesta
+  offline.
+- streaming (streamGenerateContent por SSE) para empezar a sintetizar la
+  primera frase mientras Gemini sigue generando
+- petición de cobertura (hedging) opcional: si la primera no ha respondido
+  en LLM_HEDGE_AFTER_S se lanza una segunda y gana la primera que termine.
+  Duplica el consumo de cuota en las llamadas lentas; desactivada por defecto.
+
+GEMINI_BASE_URL permite apuntar a un servidor compatible, p.ej. el falso de
+benchmarks/fake_llm_server.py para probar todo esto sin red.
+
+Configuración:
+- GEMINI_BASE_URL (por defecto https://generativelanguage.googleapis.com)
+- LLM_TIMEOUT_S: plazo por llamada (por defecto 8)
+- LLM_HEDGE_AFTER_S: 0 = sin hedging (por defecto)
+- LLM_BREAKER_FAILURES: fallos seguidos que abren el circuito (por defecto 2)
+- LLM_BREAKER_COOLDOWN_S: duración del corte (por defecto 60)
+- LLM_MAX_CONNECTIONS: conexiones simultáneas a Gemini (por defecto 16)
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from services.log import get_logger
+from services.metrics import MODEL_EVENTS
+
+logger = get_logger(__name__)
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+
+class LLMError(Exception):
+    """Fallo de la llamada al LLM (cuenta para el circuit breaker)."""
+
+
+class LLMRequestError(LLMError):
+    """
+    Gemini respondió, pero no sirve para esta petición (4xx salvo 429,
+    bloqueada, sin texto, no JSON). Reintentar no ayuda y no cuenta para el
+    circuit breaker.
+    """
+
+
+class LLMRateLimited(LLMError):
+    """429 / RESOURCE_EXHAUSTED."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeout(LLMError):
+    """La llamada superó su plazo."""
+
+
+class CircuitOpenError(LLMError):
+    """El circuito está abierto: no se llama al LLM hasta que se enfríe."""
+
+
+class CircuitBreaker:
+    """
+    Estados: cerrado (llamadas normales), abierto (se rechazan hasta
+    open_until) y semiabierto (una única llamada de prueba).
+    """
+
+    def __init__(self, failure_threshold: Optional[int] = None, cooldown_s: Optional[float] = None):
+        self.failure_threshold = failure_threshold if failure_threshold is not None else int(os.getenv("LLM_BREAKER_FAILURES", 2))
+        self.cooldown_s = cooldown_s if cooldown_s is not None else float(os.getenv("LLM_BREAKER_COOLDOWN_S", 60))
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._open_until == 0.0:
+            return "closed"
+        return "open" if time.monotonic() < self._open_until else "half-open"
+
+    def allow(self) -> bool:
+        """True si se puede llamar (en semiabierto solo a la primera llamada)."""
+        with self._lock:
+            if self._open_until == 0.0:
+                return True
+            if time.monotonic() < self._open_until or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0.0
+            self._probing = False
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self._failures += 1
+            # Una prueba fallida en semiabierto vuelve a abrir de inmediato
+            if self._failures >= self.failure_threshold or self._probing:
+                cooldown = max(self.cooldown_s, retry_after or 0.0)
+                self._open_until = time.monotonic() + cooldown
+                self._probing = False
+                self.opened += 1
+                logger.warning(f"⚠️ Circuito del LLM abierto durante {cooldown:.0f}s ({self._failures} fallos seguidos)")
+
+    def release_probe(self):
+        """La llamada de prueba terminó sin resultado (p.ej. cancelada): se permite otra."""
+        with self._lock:
+            self._probing = False
+
+    def remaining_s(self) -> float:
+        return max(0.0, self._open_until - time.monotonic())
+
+
+class GeminiClient:
+    """Cliente async de generateContent con plazo, breaker y hedging."""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        base_url: Optional[str] = None,
+        timeout_s: Optional[float] = None,
+        hedge_after_s: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_connections: Optional[int] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = (base_url or os.getenv("GEMINI_BASE_URL", DEFAULT_BASE_URL)).rstrip("/")
+        self.timeout_s = timeout_s if timeout_s is not None else float(os.getenv("LLM_TIMEOUT_S", 8))
+        self.hedge_after_s = hedge_after_s if hedge_after_s is not None else float(os.getenv("LLM_HEDGE_AFTER_S", 0))
+        self.breaker = breaker or CircuitBreaker()
+        self.max_connections = max_connections if max_connections is not None else int(os.getenv("LLM_MAX_CONNECTIONS", 16))
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        """Cliente HTTP del event loop actual (uno por loop, reutilizado entre llamadas)."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"x-goog-api-key": self.api_key},
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.timeout_s, connect=min(self.timeout_s, 5.0)),
+                transport=self._transport,
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def request_body(self, prompt: str, system_instruction: Optional[str] = None) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        return body
+
+    async def generate(
+        self, prompt: str, system_instruction: Optional[str] = None, timeout_s: Optional[float] = None
+    ) -> str:
+        """
+        Texto generado para el prompt.
+
+        Raises:
+            CircuitOpenError: el circuito está abierto (no se llamó a Gemini)
+            LLMRateLimited, LLMTimeout, LLMError: fallo de la llamada (cuenta para el breaker)
+            LLMRequestError: Gemini rechazó esta petición (no cuenta)
+        """
+        if not self.breaker.allow():
+            MODEL_EVENTS.inc(model="gemini", event="circuit_open")
+            raise CircuitOpenError(f"Circuito abierto ({self.breaker.remaining_s():.0f}s restantes)")
+
+        body = self.request_body(prompt, system_instruction)
+        deadline = timeout_s if timeout_s is not None else self.timeout_s
+        try:
+            text = await asyncio.wait_for(self._hedged(body), timeout=deadline)
+        except asyncio.TimeoutError:
+            raise self._failed(LLMTimeout(f"Gemini no respondió en {deadline:.1f}s"))
+        except LLMError as e:
+            raise self._failed(e)
+        except BaseException:
+            # Cancelada (cliente desconectado, hedge) o error inesperado: sin
+            # resultado, pero el circuito no puede quedarse esperando la prueba
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        return text
+
+    async def stream(
+        self, prompt: str, system_instruction: Optional[str] = None, timeout_s: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Fragmentos de texto según los genera Gemini (streamGenerateContent, SSE).
+
+        El plazo se aplica a cada fragmento: al primero y a la espera entre
+        fragmentos. Mismas excepciones que generate(); sin hedging.
+        """
+        if not self.breaker.allow():
+            MODEL_EVENTS.inc(model="gemini", event="circuit_open")
+            raise CircuitOpenError(f"Circuito abierto ({self.breaker.remaining_s():.0f}s restantes)")
+
+        body = self.request_body(prompt, system_instruction)
+        deadline = timeout_s if timeout_s is not None else self.timeout_s
+        received = False
+        failed = False
+        try:
+            async with self._http().stream(
+                "POST", f"/v1beta/models/{self.model}:streamGenerateContent", params={"alt": "sse"}, json=body
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise_for_status(response)
+                lines = response.aiter_lines()
+                while True:
+                    try:
+                        line = await asyncio.wait_for(lines.__anext__(), timeout=deadline)
+                    except StopAsyncIteration:
+                        break
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        text = chunk_text(json.loads(line[5:]))
+                    except ValueError as e:
+                        raise LLMRequestError(f"Fragmento no JSON: {line[:200]}") from e
+                    if text:
+                        received = True
+                        yield text
+        except asyncio.TimeoutError:
+            failed = True
+            raise self._failed(LLMTimeout(f"Gemini no envió texto en {deadline:.1f}s"))
+        except httpx.TimeoutException as e:
+            failed = True
+            raise self._failed(LLMTimeout(f"Timeout HTTP: {e}"))
+        except httpx.HTTPError as e:
+            failed = True
+            raise self._failed(LLMError(f"{type(e).__name__}: {e}"))
+        except LLMError as e:
+            failed = True
+            raise self._failed(e)
+        finally:
+            if not failed:
+                if received:
+                    # Gemini respondió (aunque el consumidor cortara el stream antes)
+                    self.breaker.record_success()
+                else:
+                    self.breaker.release_probe()
+
+    def _failed(self, error: LLMError) -> LLMError:
+        """Cuenta el fallo (métricas y breaker) y devuelve el error para relanzarlo."""
+        if isinstance(error, LLMTimeout):
+            MODEL_EVENTS.inc(model="gemini", event="timeout")
+            self.breaker.record_failure()
+        elif isinstance(error, LLMRateLimited):
+            MODEL_EVENTS.inc(model="gemini", event="rate_limited")
+            self.breaker.record_failure(error.retry_after)
+        elif isinstance(error, LLMRequestError):
+            # Gemini está bien: solo falla este turno
+            MODEL_EVENTS.inc(model="gemini", event="rejected")
+            self.breaker.release_probe()
+        elif not isinstance(error, CircuitOpenError):
+            MODEL_EVENTS.inc(model="gemini", event="error")
+            self.breaker.record_failure()
+        return error
+
+    async def _hedged(self, body: Dict[str, Any]) -> str:
+        if self.hedge_after_s <= 0:
+            return await self._call(body)
+
+        first = asyncio.create_task(self._call(body))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after_s)
+            if not done:
+                MODEL_EVENTS.inc(model="gemini", event="hedged")
+                tasks.add(asyncio.create_task(self._call(body)))
+            # Gana la primera que termine bien; si una falla se espera a la otra
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not tasks:
+                    raise next(iter(done)).exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _call(self, body: Dict[str, Any]) -> str:
+        try:
+            response = await self._http().post(f"/v1beta/models/{self.model}:generateContent", json=body)
+        except httpx.TimeoutException as e:
+            raise LLMTimeout(f"Timeout HTTP: {e}") from e
+        except httpx.HTTPError as e:
+            raise LLMError(f"{type(e).__name__}: {e}") from e
+
+        raise_for_status(response)
+        try:
+            payload = response.json()
+        except ValueError as e:
+            raise LLMRequestError(f"Respuesta no JSON: {response.text[:200]}") from e
+        return extract_text(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "timeout_s": self.timeout_s,
+            "hedge_after_s": self.hedge_after_s,
+        }
+
+
+def raise_for_status(response: httpx.Response):
+    """Traduce los errores HTTP de Gemini a LLMRateLimited / LLMRequestError / LLMError."""
+    if response.status_code == 429:
+        retry_after = response.headers.get("retry-after")
+        raise LLMRateLimited(
+            f"429 RESOURCE_EXHAUSTED: {response.text[:200]}",
+            float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None
+        )
+    if response.status_code >= 500:
+        raise LLMError(f"HTTP {response.status_code}: {response.text[:200]}")
+    if response.status_code >= 400:
+        raise LLMRequestError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+def chunk_text(payload: Dict[str, Any]) -> str:
+    """Texto de un fragmento del stream ("" si solo trae metadatos)."""
+    if isinstance(payload, dict) and "candidates" not in payload:
+        reason = (payload.get("promptFeedback") or {}).get("blockReason")
+        if reason:
+            raise LLMRequestError(f"Respuesta bloqueada: {reason}")
+        return ""
+    return extract_text(payload)
+
+
+def extract_text(payload: Dict[str, Any]) -> str:
+    """Texto del primer candidato de una respuesta de generateContent."""
+    try:
+        parts = payload["candidates"][0]["content"]["parts"]
+    except (KeyError, IndexError, TypeError):
+        reason = (payload.get("promptFeedback") or {}).get("blockReason") if isinstance(payload, dict) else None
+        raise LLMRequestError(f"Respuesta sin texto{f' (bloqueada: {reason})' if reason else ''}")
+    return "".join(part.get("text", "") for part in parts)
@@ -1,32 +1,69 @@
-import google.generativeai as genai
 import os
 import random
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
-class LLMService:
-    def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY no configurada")
-        
-        genai.configure(api_key=api_key)
-        
-        # IMPORTANT: Usar modelo explícito para evitar migración automática
-        # gemini-1.5-flash tiene quota separada de gemini-2.0-flash
-        model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-        self.model = genai.GenerativeModel(model_name)
-        print(f"✅ LLMService inicializado con modelo: {model_name}")
-        
-        # Historial de conversación por sesión
-        self._session_histories: Dict[str, List[Dict]] = {}
-        
-        # System prompt para el avatar paciente
-        self.system_prompt = """Eres un paciente virtual en crisis de ansiedad siendo entrevistado por un estudiante de salud.
+from services.llm_client import CircuitOpenError, GeminiClient, LLMError
+from services.log import get_logger
+from services.metrics import MODEL_EVENTS
+from services.reply_stream import iter_sentences
+from services.response_cache import get_response_cache
+from services.session_history import get_session_history
 
-CONTEXTO ACTUAL:
-- Nivel de estrés actual: {stress_level}/10
-- Turno de conversación: {turn_count}
-- El estudiante acaba de decir: "{user_input}"
+logger = get_logger(__name__)
+
+# Respuestas offline (fallback cuando Gemini no está disponible).
+# Son frases fijas: el caché de TTS las sintetiza una sola vez.
+
+# Respuestas según estrés alto (7-10)
+HIGH_STRESS_RESPONSES = [
+    "No sé... es que siento que todo se me viene encima y no puedo con esto.",
+    "Es que... no duermo bien, no como bien... todo es demasiado últimamente.",
+    "A veces siento que nadie entiende lo que me pasa... es muy frustrante.",
+    "No puedo dejar de pensar en el trabajo... las fechas, los reportes... es demasiado.",
+    "Siento como un nudo aquí en el pecho que no se va... no sé qué hacer.",
+]
+
+# Respuestas según estrés medio (4-6)
+MID_STRESS_RESPONSES = [
+    "Bueno... supongo que sí necesito hablar de esto. Últimamente ha sido difícil.",
+    "Es que en el trabajo me presionan mucho... pero gracias por preguntar.",
+    "A veces me siento mejor, pero luego vuelve esa sensación de agobio.",
+    "Creo que lo que más me afecta es sentir que no llego a todo lo que me piden.",
+    "Hoy ha sido un poco mejor que otros días... pero sigo preocupado.",
+]
+
+# Respuestas según estrés bajo (0-3)
+LOW_STRESS_RESPONSES = [
+    "Sabes qué... creo que hablar de esto me está ayudando. Gracias.",
+    "Me siento un poco más tranquilo ahora. Es bueno que alguien escuche.",
+    "Creo que puedo manejar esto si no me lo guardo todo para mí.",
+    "Gracias por escucharme... de verdad hacía falta.",
+]
+
+# Respuestas a empatía (el usuario hizo algo bien)
+EMPATHY_RESPONSES = [
+    "Gracias por decir eso... no mucha gente se toma el tiempo de escuchar.",
+    "Es reconfortante saber que alguien entiende... a veces me siento muy solo con esto.",
+    "Eso que dices me hace sentir un poco mejor... como que no estoy loco por sentirme así.",
+]
+
+# Respuestas a hostilidad
+HOSTILE_RESPONSES = [
+    "Eso... eso no ayuda. No es tan fácil como parece desde afuera.",
+    "Ya... todos dicen lo mismo. Si fuera tan fácil ya lo hubiera hecho.",
+    "Mejor no hubiera dicho nada... sabía que no iban a entender.",
+]
+
+# Input vacío (micrófono silencioso)
+EMPTY_INPUT_RESPONSES = [
+    "Perdón... ¿decías algo? Es que estoy un poco distraído con todo esto.",
+    "No te escuché bien... es que a veces me pierdo en mis pensamientos.",
+    "¿Podrías repetir? Lo siento, estoy un poco nervioso.",
+]
+
+
+# Persona e instrucciones del avatar: iguales en todas las llamadas
+PERSONA_INSTRUCTION = """Eres un paciente virtual en crisis de ansiedad siendo entrevistado por un estudiante de salud.
 
 TU PERSONALIDAD:
 - Tienes 28 años, trabajas en marketing
@@ -46,25 +83,53 @@ Responde EN PRIMERA PERSONA como este paciente.
 - Si estrés 4-7: habla con más calma pero aún preocupado
 - Si estrés < 4: muestra alivio y gratitud
 - NO menciones tu nivel de estrés numéricamente
-- NO uses comillas ni formato especial
+- NO uses comillas ni formato especial"""
+
+
+def offline_utterances() -> List[Tuple[str, range]]:
+    """Frases offline con los niveles de estrés en que pueden decirse."""
+    pools = [
+        (HIGH_STRESS_RESPONSES, range(7, 11)),
+        (MID_STRESS_RESPONSES, range(4, 7)),
+        (LOW_STRESS_RESPONSES, range(0, 4)),
+        (EMPATHY_RESPONSES, range(4, 11)),
+        (HOSTILE_RESPONSES, range(0, 11)),
+        (EMPTY_INPUT_RESPONSES, range(0, 11)),
+    ]
+    return [(text, levels) for pool, levels in pools for text in pool]
 
-RESPUESTA:"""
+class LLMService:
+    def __init__(self):
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY no configurada")
+        
+        # IMPORTANT: Usar modelo explícito para evitar migración automática
+        # gemini-1.5-flash tiene quota separada de gemini-2.0-flash
+        model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+        # Cliente async: conexión reutilizada, plazo por llamada y circuit breaker
+        self.client = GeminiClient(api_key, model_name)
+        logger.info(f"✅ LLMService inicializado con modelo: {model_name}")
+        
+        # Historial de conversación por sesión (TTL, LRU y borrado al terminar)
+        self.histories = get_session_history()
+        
+        # Caché de respuestas para aperturas frecuentes ("hola", "¿cómo estás?")
+        self.response_cache = get_response_cache()
+        
+        # Persona e instrucciones fijas: van como systemInstruction, el prompt
+        # de cada turno solo lleva el estado actual y el historial
+        self.system_instruction = PERSONA_INSTRUCTION
     
     def get_history(self, session_id: str) -> List[Dict]:
         """Obtiene el historial de conversación de una sesión."""
-        if session_id not in self._session_histories:
-            self._session_histories[session_id] = []
-        return self._session_histories[session_id]
+        return self.histories.get(session_id)
     
     def add_to_history(self, session_id: str, role: str, content: str):
-        """Agrega un turno al historial."""
-        history = self.get_history(session_id)
-        history.append({"role": role, "content": content})
-        # Mantener solo los últimos 10 turnos para no exceder el contexto
-        if len(history) > 10:
-            self._session_histories[session_id] = history[-10:]
+        """Agrega un turno al historial (se conservan los últimos mensajes)."""
+        self.histories.append(session_id, role, content)
     
-    def generate_response(
+    async def generate_response_async(
         self,
         user_input: str,
         stress_level: int,
@@ -82,11 +147,20 @@ RESPUESTA:"""
         else:
             history = conversation_history
         
+        cache_key = self.response_cache.key(user_input, stress_level, history)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            MODEL_EVENTS.inc(model="llm_cache", event="hit")
+            if session_id:
+                self.add_to_history(session_id, "assistant", cached)
+            return cached
+        
         # Intentar generar con Gemini
         try:
-            response_text = self._generate_with_gemini(
+            response_text = await self._generate_with_gemini(
                 user_input, stress_level, history, turn_count
             )
+            self.response_cache.put(cache_key, response_text)
             
             # Guardar respuesta en historial
             if session_id:
@@ -94,47 +168,126 @@ RESPUESTA:"""
             
             return response_text
             
-        except Exception as e:
-            error_msg = str(e)
-            print(f"⚠️ Error en Gemini: {error_msg}")
-            
-            # Si es error de quota, usar respuestas offline
-            if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                print("🔄 Usando respuestas offline (quota agotada)")
-                return self._get_offline_response(user_input, stress_level, turn_count)
+        except CircuitOpenError:
+            # Cuota agotada o Gemini caído hace poco: ni siquiera se intenta
+            logger.debug("🔄 Circuito de Gemini abierto: respuesta offline")
+            MODEL_EVENTS.inc(model="gemini", event="fallback_offline")
+            return self._get_offline_response(user_input, stress_level, turn_count)
             
-            # Para otros errores, también usar offline
+        except LLMError as e:
+            # 429, timeout o error de la API: respuestas offline
+            logger.warning(f"⚠️ Error en Gemini: {e}")
+            MODEL_EVENTS.inc(model="gemini", event="fallback_offline")
             return self._get_offline_response(user_input, stress_level, turn_count)
     
-    def _generate_with_gemini(
+    async def stream_response_async(
+        self,
+        user_input: str,
+        stress_level: int,
+        conversation_history: List[Dict[str, str]],
+        turn_count: int,
+        session_id: str = None
+    ) -> AsyncIterator[str]:
+        """
+        Respuesta del avatar en fragmentos de texto según la genera Gemini.
+        
+        Si Gemini falla antes del primer fragmento se entrega la respuesta
+        offline completa; si falla a mitad, la respuesta queda cortada. El
+        historial registra el texto completo entregado al terminar.
+        """
+        if session_id:
+            history = self.get_history(session_id)
+            self.add_to_history(session_id, "user", user_input)
+        else:
+            history = conversation_history
+        
+        cache_key = self.response_cache.key(user_input, stress_level, history)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            MODEL_EVENTS.inc(model="llm_cache", event="hit")
+            if session_id:
+                self.add_to_history(session_id, "assistant", cached)
+            yield cached
+            return
+        
+        prompt = self._build_prompt(user_input, stress_level, history, turn_count)
+        parts: List[str] = []
+        completed = False
+        try:
+            async for delta in self.client.stream(prompt, self.system_instruction):
+                if not parts:
+                    # Limpiar comillas iniciales si las hay
+                    delta = delta.lstrip().lstrip('"').lstrip("'")
+                    if not delta:
+                        continue
+                parts.append(delta)
+                yield delta
+            completed = True
+        except LLMError as e:
+            if not isinstance(e, CircuitOpenError):
+                logger.warning(f"⚠️ Error en Gemini (streaming): {e}")
+            if not parts:
+                MODEL_EVENTS.inc(model="gemini", event="fallback_offline")
+                yield self._get_offline_response(user_input, stress_level, turn_count)
+        finally:
+            if parts:
+                text = "".join(parts).strip().strip('"').strip("'")
+                if completed:
+                    self.response_cache.put(cache_key, text)
+                if session_id:
+                    self.add_to_history(session_id, "assistant", text)
+    
+    async def stream_sentences(
+        self,
+        user_input: str,
+        stress_level: int,
+        conversation_history: List[Dict[str, str]],
+        turn_count: int,
+        session_id: str = None
+    ) -> AsyncIterator[str]:
+        """Como stream_response_async, pero por frases completas."""
+        deltas = self.stream_response_async(
+            user_input, stress_level, conversation_history, turn_count, session_id
+        )
+        async for sentence in iter_sentences(deltas):
+            yield sentence
+    
+    async def _generate_with_gemini(
         self, user_input: str, stress_level: int,
         history: List[Dict], turn_count: int
     ) -> str:
         """Genera respuesta usando Gemini API."""
-        prompt = self.system_prompt.format(
-            stress_level=stress_level,
-            turn_count=turn_count,
-            user_input=user_input
-        )
-        
-        # Construir historial para contexto
-        if history:
-            history_text = "\n".join([
-                f"{'Estudiante' if msg['role'] == 'user' else 'Paciente'}: {msg['content']}"
-                for msg in history[-6:]  # Últimos 6 turnos
-            ])
-            prompt += f"\n\nHISTORIAL RECIENTE:\n{history_text}"
-        
-        prompt += "\n\nRespuesta del paciente:"
-        
-        response = self.model.generate_content(prompt)
-        text = response.text.strip()
+        prompt = self._build_prompt(user_input, stress_level, history, turn_count)
+        text = (await self.client.generate(prompt, self.system_instruction)).strip()
         
         # Limpiar comillas si las hay
         text = text.strip('"').strip("'")
         
         return text
     
+    def _build_prompt(
+        self, user_input: str, stress_level: int,
+        history: List[Dict], turn_count: int
+    ) -> str:
+        """Prompt del turno: estado actual + historial reciente (la persona va aparte)."""
+        lines = [
+            "CONTEXTO ACTUAL:",
+            f"- Nivel de estrés actual: {stress_level}/10",
+            f"- Turno de conversación: {turn_count}",
+            f'- El estudiante acaba de decir: "{user_input}"',
+        ]
+        
+        # Historial para contexto
+        if history:
+            lines.append("\nHISTORIAL RECIENTE:")
+            lines.extend(
+                f"{'Estudiante' if msg['role'] == 'user' else 'Paciente'}: {msg['content']}"
+                for msg in history[-6:]  # Últimos 6 mensajes
+            )
+        
+        lines.append("\nRespuesta del paciente:")
+        return "\n".join(lines)
+    
     def _get_offline_response(
         self, user_input: str, stress_level: int, turn_count: int
     ) -> str:
@@ -156,63 +309,18 @@ RESPUESTA:"""
             "deja de", "ya basta", "ridícul", "tonto", "problema tuyo"
         ])
         
-        # Respuestas según estrés alto (7-10)
-        high_stress = [
-            "No sé... es que siento que todo se me viene encima y no puedo con esto.",
-            "Es que... no duermo bien, no como bien... todo es demasiado últimamente.",
-            "A veces siento que nadie entiende lo que me pasa... es muy frustrante.",
-            "No puedo dejar de pensar en el trabajo... las fechas, los reportes... es demasiado.",
-            "Siento como un nudo aquí en el pecho que no se va... no sé qué hacer.",
-        ]
-        
-        # Respuestas según estrés medio (4-6)
-        mid_stress = [
-            "Bueno... supongo que sí necesito hablar de esto. Últimamente ha sido difícil.",
-            "Es que en el trabajo me presionan mucho... pero gracias por preguntar.",
-            "A veces me siento mejor, pero luego vuelve esa sensación de agobio.",
-            "Creo que lo que más me afecta es sentir que no llego a todo lo que me piden.",
-            "Hoy ha sido un poco mejor que otros días... pero sigo preocupado.",
-        ]
-        
-        # Respuestas según estrés bajo (0-3)
-        low_stress = [
-            "Sabes qué... creo que hablar de esto me está ayudando. Gracias.",
-            "Me siento un poco más tranquilo ahora. Es bueno que alguien escuche.",
-            "Creo que puedo manejar esto si no me lo guardo todo para mí.",
-            "Gracias por escucharme... de verdad hacía falta.",
-        ]
-        
-        # Respuestas a empatía (el usuario hizo algo bien)
-        empathy_responses = [
-            "Gracias por decir eso... no mucha gente se toma el tiempo de escuchar.",
-            "Es reconfortante saber que alguien entiende... a veces me siento muy solo con esto.",
-            "Eso que dices me hace sentir un poco mejor... como que no estoy loco por sentirme así.",
-        ]
-        
-        # Respuestas a hostilidad
-        hostile_responses = [
-            "Eso... eso no ayuda. No es tan fácil como parece desde afuera.",
-            "Ya... todos dicen lo mismo. Si fuera tan fácil ya lo hubiera hecho.",
-            "Mejor no hubiera dicho nada... sabía que no iban a entender.",
-        ]
-        
         # Input vacío (micrófono silencioso)
         if not user_input or len(user_input.strip()) < 3:
-            empty_responses = [
-                "Perdón... ¿decías algo? Es que estoy un poco distraído con todo esto.",
-                "No te escuché bien... es que a veces me pierdo en mis pensamientos.",
-                "¿Podrías repetir? Lo siento, estoy un poco nervioso.",
-            ]
-            return random.choice(empty_responses)
+            return random.choice(EMPTY_INPUT_RESPONSES)
         
         # Seleccionar respuesta
         if is_empathetic and stress_level > 3:
-            return random.choice(empathy_responses)
+            return random.choice(EMPATHY_RESPONSES)
         elif is_hostile:
-            return random.choice(hostile_responses)
+            return random.choice(HOSTILE_RESPONSES)
         elif stress_level >= 7:
-            return random.choice(high_stress)
+            return random.choice(HIGH_STRESS_RESPONSES)
         elif stress_level >= 4:
-            return random.choice(mid_stress)
+            return random.choice(MID_STRESS_RESPONSES)
         else:
-            return random.choice(low_stress)
+            return random.choice(LOW_STRESS_RESPONSES)
@@ -0,0 +1,111 @@
+"""
+Logging estructurado del backend.
+
+Cada módulo usa su propio logger (get_logger(__name__)) con niveles en
+lugar de print(). Los ids de petición y de sesión viajan en contextvars: el
+middleware de main.py los fija por petición y todos los registros de esa
+petición los incluyen, también los emitidos desde los pools del pipeline.
+
+Lo que solo sirve para depurar (p.ej. la amplitud máxima del audio) se
+calcula únicamente si DEBUG está activo: logger.isEnabledFor(logging.DEBUG).
+
+Configuración:
+- LOG_LEVEL: DEBUG, INFO (por defecto), WARNING, ERROR
+- LOG_FORMAT: "text" (por defecto, legible en consola) o "json" (una línea
+  JSON por registro, para producción)
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+session_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("session_id", default=None)
+
+# Atributos estándar de LogRecord: lo demás viene de extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def log_context(request_id: Optional[str] = None, session_id: Optional[str] = None):
+    """Asocia request_id/session_id a los registros emitidos dentro del bloque."""
+    tokens = []
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    if session_id is not None:
+        tokens.append((session_id_var, session_id_var.set(session_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Añade request_id y session_id del contexto actual a cada registro."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.session_id = session_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        ids = " ".join(
+            f"{key}={value}" for key, value in (
+                ("req", getattr(record, "request_id", None)),
+                ("session", getattr(record, "session_id", None)),
+            ) if value
+        )
+        return f"{text} [{ids}]" if ids else text
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Configura el logger raíz una sola vez (se llama al arrancar main.py)."""
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "text")).lower()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(ContextFilter())
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    # Las librerías ruidosas solo a partir de WARNING
+    for noisy in ("pymongo", "urllib3", "numba", "httpx", "asyncio", "multipart"):
+        logging.getLogger(noisy).setLevel(max(logging.WARNING, root.level))
@@ -0,0 +1,151 @@
+"""
+Audios de respuesta servidos desde memoria.
+
+Con AUDIO_SERVE_MODE=memory el TTS escribe el MP3 en un buffer
+(synthesize_bytes) y los bytes se guardan aquí. GET /api/audio/{id}.mp3 los
+sirve directamente, sin escritura ni lectura en temp/ (y sin fsync en
+volúmenes de red). Los clips que superan AUDIO_MEMORY_MAX_CLIP_KB siguen
+yendo a disco.
+
+Configuración:
+- AUDIO_SERVE_MODE: "disk" (por defecto) o "memory"
+- AUDIO_MEMORY_MAX_MB: memoria máxima de audios, se expulsa por LRU (por defecto 64)
+- AUDIO_MEMORY_MAX_CLIP_KB: tamaño máximo de un clip en memoria (por defecto 512)
+- AUDIO_MEMORY_TTL_S: vida de un clip desde que se genera (por defecto 600)
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass(frozen=True)
+class MemoryAudio:
+    data: bytes
+    etag: str
+    media_type: str
+    session_id: Optional[str]
+    created: float
+
+
+def memory_mode() -> bool:
+    return os.getenv("AUDIO_SERVE_MODE", "disk").lower() == "memory"
+
+
+class MemoryAudioStore:
+    """Caché LRU acotado en bytes de audios generados."""
+
+    def __init__(self, max_bytes: Optional[int] = None, max_clip_bytes: Optional[int] = None, ttl_s: Optional[float] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("AUDIO_MEMORY_MAX_MB", 64)) * 1024 * 1024)
+        self.max_clip_bytes = max_clip_bytes if max_clip_bytes is not None else int(float(os.getenv("AUDIO_MEMORY_MAX_CLIP_KB", 512)) * 1024)
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.getenv("AUDIO_MEMORY_TTL_S", 600))
+        self._lock = threading.Lock()
+        self._clips: "OrderedDict[str, MemoryAudio]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def fits(self, size: int) -> bool:
+        return size <= self.max_clip_bytes
+
+    def put(self, data: bytes, session_id: Optional[str] = None, media_type: str = "audio/mpeg") -> str:
+        """Guarda un clip y devuelve su id."""
+        audio_id = uuid.uuid4().hex
+        # ETag fuerte: depende solo del contenido
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        now = time.time()
+        with self._lock:
+            # Los caducados se retiran al guardar (del más antiguo en uso),
+            # sin necesidad de un barrido aparte
+            while self._clips:
+                oldest_id, oldest = next(iter(self._clips.items()))
+                if now - oldest.created <= self.ttl_s:
+                    break
+                self._remove(oldest_id)
+            self._clips[audio_id] = MemoryAudio(data, etag, media_type, session_id, now)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and len(self._clips) > 1:
+                _, old = self._clips.popitem(last=False)
+                self._total_bytes -= len(old.data)
+                self.evictions += 1
+        return audio_id
+
+    def get(self, audio_id: str) -> Optional[MemoryAudio]:
+        with self._lock:
+            clip = self._clips.get(audio_id)
+            if clip is not None and time.time() - clip.created > self.ttl_s:
+                self._remove(audio_id)
+                clip = None
+            if clip is None:
+                self.misses += 1
+                return None
+            self._clips.move_to_end(audio_id)
+            self.hits += 1
+            return clip
+
+    def remove_session(self, session_id: str) -> int:
+        with self._lock:
+            ids = [audio_id for audio_id, clip in self._clips.items() if clip.session_id == session_id]
+            for audio_id in ids:
+                self._remove(audio_id)
+        return len(ids)
+
+    def _remove(self, audio_id: str):
+        clip = self._clips.pop(audio_id, None)
+        if clip is not None:
+            self._total_bytes -= len(clip.data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "clips": len(self._clips),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def parse_range(header: Optional[str], size: int):
+    """
+    Interpreta una cabecera Range de un único rango de bytes.
+
+    Returns:
+        None si no hay rango (o no se soporta, p.ej. varios rangos): se sirve
+        todo. (start, end) inclusivo si es válido. "unsatisfiable" si está
+        fuera del contenido (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s == "":
+            # bytes=-N: los últimos N bytes
+            length = int(end_s)
+            if length <= 0:
+                return "unsatisfiable"
+            return max(0, size - length), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, min(end, size - 1)
+
+
+# Instancia compartida
+_memory_audio: Optional[MemoryAudioStore] = None
+
+
+def get_memory_audio() -> MemoryAudioStore:
+    global _memory_audio
+    if _memory_audio is None:
+        _memory_audio = MemoryAudioStore()
+    return _memory_audio
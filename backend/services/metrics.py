@@ -0,0 +1,237 @@
+"""
+Métricas del backend en formato de texto de Prometheus (GET /metrics).
+
+Registro mínimo sin dependencias: contadores, histogramas y gauges
+calculados al exportar. Las etapas de cada turno (upload, decode, vad, stt,
+emotion, llm, tts, db) registran tiempo de reloj y tiempo de CPU.
+
+El tiempo de CPU lo mide el propio hilo/proceso del pool del pipeline
+(time.thread_time) y se acumula en la etapa activa mediante contextvars,
+así que no incluye la espera en cola ni el trabajo de otras peticiones.
+
+Configuración:
+- METRICS_SERVER_TIMING: "true" para añadir la cabecera Server-Timing a
+  /process-audio (por defecto false)
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Buckets en segundos: de 5 ms (VAD) a 30 s (LLM/TTS lentos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas → (conteos por bucket, suma, total)
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', _format_value(bound)))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """Gauge cuyo valor se calcula al exportar (p.ej. profundidad de colas)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str], collect: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        try:
+            values = self.collect()
+        except Exception:
+            return []
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in sorted(values.items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge_callback(self, name: str, help_text: str, labels: Iterable[str], collect) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help_text, labels, collect))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "avatar_stage_seconds", "Tiempo de reloj por etapa del turno", ["stage"]
+)
+STAGE_CPU_SECONDS = REGISTRY.histogram(
+    "avatar_stage_cpu_seconds", "Tiempo de CPU por etapa del turno (hilo del pool)", ["stage"]
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "avatar_pipeline_queue_wait_seconds", "Espera hasta obtener un worker del pool", ["pool"]
+)
+TURN_SECONDS = REGISTRY.histogram(
+    "avatar_turn_seconds", "Duración total de un turno", ["endpoint"]
+)
+MODEL_EVENTS = REGISTRY.counter(
+    "avatar_model_events_total",
+    "Eventos por modelo (fallbacks a offline/mock, 429, aciertos de caché...)",
+    ["model", "event"]
+)
+PIPELINE_REJECTED = REGISTRY.counter(
+    "avatar_pipeline_rejected_total", "Peticiones rechazadas con 503 por cola llena", ["pool"]
+)
+
+# Acumulador de CPU de la etapa activa (lista para poder sumarle desde otra corrutina)
+_stage_cpu: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("stage_cpu", default=None)
+
+
+def add_stage_cpu(seconds: float):
+    """Suma CPU a la etapa activa de esta petición (si la hay)."""
+    accumulator = _stage_cpu.get()
+    if accumulator is not None:
+        accumulator[0] += seconds
+
+
+@contextmanager
+def stage_timer(stage: str, timings: Optional[dict] = None):
+    """
+    Mide una etapa: histograma de reloj y de CPU, y timings[stage] en ms.
+    """
+    accumulator = [0.0]
+    token = _stage_cpu.set(accumulator)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stage_cpu.reset(token)
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if accumulator[0] > 0:
+            STAGE_CPU_SECONDS.observe(accumulator[0], stage=stage)
+        if timings is not None:
+            timings[stage] = round(elapsed * 1000, 1)
+
+
+def call_with_cpu_time(func, *args, **kwargs):
+    """
+    Ejecuta func en el worker y devuelve (resultado, segundos de CPU del hilo).
+    Función de módulo: serializable para pools de procesos.
+    """
+    start = time.thread_time()
+    result = func(*args, **kwargs)
+    return result, time.thread_time() - start
+
+
+def server_timing_enabled() -> bool:
+    return os.getenv("METRICS_SERVER_TIMING", "false").lower() in ("true", "1", "yes")
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Cabecera Server-Timing a partir de los tiempos en ms del turno."""
+    return ", ".join(f"{stage};dur={ms}" for stage, ms in timings.items())
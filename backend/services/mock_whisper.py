@@ -2,12 +2,15 @@
 Mock Whisper service para pruebas sin el modelo completo.
 Retorna una transcripción de prueba.
 """
+from services.log import get_logger
+
+logger = get_logger(__name__)
 
 class MockWhisperSTT:
     def __init__(self):
-        print("⚠️ MockWhisperSTT inicializado (solo para pruebas)")
+        logger.warning("⚠️ MockWhisperSTT inicializado (solo para pruebas)")
     
-    def transcribe(self, audio_path: str, language: str = "es") -> dict:
+    def transcribe(self, audio, language: str = "es") -> dict:
         """
         Transcripción mock para pruebas.
         """
@@ -16,6 +19,9 @@ class MockWhisperSTT:
             "language": language,
             "segments": []
         }
+    
+    def warmup(self):
+        pass
 
 def get_mock_whisper_service() -> MockWhisperSTT:
     return MockWhisperSTT()
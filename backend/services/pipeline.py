@@ -0,0 +1,214 @@
+"""
+Capa de ejecución del pipeline de IA.
+
+Las etapas del pipeline (decodificación, STT, emoción, LLM, TTS) son
+bloqueantes. Cada etapa se ejecuta en su propio executor (hilos o procesos)
+fuera del event loop, con un límite de concurrencia y una cola acotada. Si la cola de una etapa está
+llena se lanza PipelineBusyError y la API responde 503 con Retry-After.
+
+Configuración por variables de entorno (por etapa, p.ej. STT):
+- PIPELINE_STT_EXECUTOR: "thread" (por defecto) o "process"
+- PIPELINE_STT_WORKERS: número de ejecuciones simultáneas
+- PIPELINE_STT_QUEUE: peticiones que pueden esperar turno
+- PIPELINE_RETRY_AFTER: segundos sugeridos al cliente cuando hay saturación
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.metrics import (
+    PIPELINE_REJECTED, QUEUE_WAIT_SECONDS, REGISTRY, add_stage_cpu, call_with_cpu_time
+)
+
+# Valores por defecto por etapa: (workers, tamaño de cola)
+DEFAULT_STAGES = {
+    "decode": (2, 16),
+    "stt": (2, 8),
+    "emotion": (2, 8),
+    "llm": (8, 32),
+    "tts": (4, 16),
+}
+
+
+class PipelineBusyError(Exception):
+    """La cola de una etapa está llena; el cliente debe reintentar."""
+
+    def __init__(self, stage: str, retry_after: int):
+        super().__init__(f"Etapa '{stage}' saturada, reintentar en {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class StageExecutor:
+    """Executor de una etapa con concurrencia limitada y cola acotada."""
+
+    def __init__(self, name: str, workers: int, max_queue: int, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Tipo de executor no soportado para '{name}': {kind}")
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._running = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix=f"pipeline-{self.name}"
+                )
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """Peticiones esperando turno (sin contar las que se ejecutan)."""
+        return self._pending - self._running
+
+    @asynccontextmanager
+    async def _admit(self, retry_after: int):
+        """Reserva un hueco de la etapa (o PipelineBusyError si la cola está llena)."""
+        if self._pending >= self.workers + self.max_queue:
+            PIPELINE_REJECTED.inc(pool=self.name)
+            raise PipelineBusyError(self.name, retry_after)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        self._pending += 1
+        queued_at = time.perf_counter()
+        try:
+            async with self._semaphore:
+                QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued_at, pool=self.name)
+                self._running += 1
+                try:
+                    yield
+                finally:
+                    self._running -= 1
+        finally:
+            self._pending -= 1
+
+    async def run(self, func: Callable[..., Any], *args, retry_after: int = 2, **kwargs) -> Any:
+        """
+        Ejecuta func(*args, **kwargs) en el executor de la etapa.
+
+        En modo "process" func y sus argumentos deben ser serializables
+        (funciones a nivel de módulo).
+        """
+        async with self._admit(retry_after):
+            loop = asyncio.get_running_loop()
+            # El worker mide su propio tiempo de CPU (no incluye la cola)
+            call = functools.partial(call_with_cpu_time, func, *args, **kwargs)
+            if self.kind != "process":
+                # Los logs del worker llevan el request_id/session_id de la petición
+                call = functools.partial(contextvars.copy_context().run, call)
+            result, cpu_seconds = await loop.run_in_executor(self.executor, call)
+            add_stage_cpu(cpu_seconds)
+            return result
+
+    async def run_async(self, func: Callable[..., Awaitable[Any]], *args, retry_after: int = 2, **kwargs) -> Any:
+        """
+        Ejecuta la corrutina func(*args, **kwargs) en el event loop con los
+        mismos límites de concurrencia y cola (para clientes async, p.ej. el LLM).
+        """
+        async with self._admit(retry_after):
+            return await func(*args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queued": self.queue_depth,
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+class PipelineExecutor:
+    """Conjunto de executors, uno por etapa del pipeline."""
+
+    def __init__(self, stages: Optional[Dict[str, StageExecutor]] = None):
+        self.retry_after = int(os.getenv("PIPELINE_RETRY_AFTER", 2))
+        self.stages: Dict[str, StageExecutor] = stages or self._stages_from_env()
+
+    @staticmethod
+    def _stages_from_env() -> Dict[str, StageExecutor]:
+        stages = {}
+        for name, (workers, max_queue) in DEFAULT_STAGES.items():
+            prefix = f"PIPELINE_{name.upper()}"
+            stages[name] = StageExecutor(
+                name,
+                workers=int(os.getenv(f"{prefix}_WORKERS", workers)),
+                max_queue=int(os.getenv(f"{prefix}_QUEUE", max_queue)),
+                kind=os.getenv(f"{prefix}_EXECUTOR", "thread").lower()
+            )
+        return stages
+
+    async def run(self, stage: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Ejecuta func en el pool de la etapa indicada."""
+        return await self.stages[stage].run(
+            func, *args, retry_after=self.retry_after, **kwargs
+        )
+
+    async def run_async(self, stage: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Ejecuta la corrutina func con los límites de la etapa indicada."""
+        return await self.stages[stage].run_async(
+            func, *args, retry_after=self.retry_after, **kwargs
+        )
+
+    def admit(self, stage: str):
+        """
+        Reserva un hueco de la etapa mientras dura el bloque `async with`
+        (p.ej. durante un stream del LLM). PipelineBusyError si está llena.
+        """
+        return self.stages[stage]._admit(self.retry_after)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    def shutdown(self, wait: bool = True):
+        for stage in self.stages.values():
+            stage.shutdown(wait=wait)
+
+
+# Instancia singleton
+_pipeline: Optional[PipelineExecutor] = None
+
+
+def get_pipeline() -> PipelineExecutor:
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = PipelineExecutor()
+    return _pipeline
+
+
+def _pool_gauge(field: str):
+    def collect():
+        if _pipeline is None:
+            return {}
+        return {(name,): stats[field] for name, stats in _pipeline.stats().items()}
+    return collect
+
+
+REGISTRY.gauge_callback(
+    "avatar_pipeline_queue_depth", "Peticiones esperando worker por pool", ["pool"], _pool_gauge("queued")
+)
+REGISTRY.gauge_callback(
+    "avatar_pipeline_running", "Ejecuciones en curso por pool", ["pool"], _pool_gauge("running")
+)
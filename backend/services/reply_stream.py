@@ -0,0 +1,148 @@
+"""
+Respuesta del avatar por frases, con síntesis de voz encadenada.
+
+El texto del LLM se corta en frases a medida que llega. Cada frase se envía a
+TTS en cuanto se completa, mientras se sigue generando la siguiente, y los
+audios se entregan al cliente en orden. El primer audio llega tras la primera
+frase en lugar de tras la respuesta completa.
+
+Configuración:
+- REPLY_MIN_SENTENCE_CHARS: longitud mínima de una frase; las más cortas
+  ("No sé...") se unen a la siguiente para no pagar una llamada TTS por cada
+  una (por defecto 20)
+- REPLY_TTS_LOOKAHEAD: frases que pueden sintetizarse por delante de la que
+  se está enviando (por defecto 2)
+"""
+import asyncio
+import os
+import re
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+# Fin de frase: puntuación final (incluye "..." y "…"), cierres opcionales
+# y un espacio. Sin el espacio no se sabe si la frase terminó ("..." → "....").
+_SENTENCE_END = re.compile(r'[.!?…]+["\'»)\]]*\s+')
+
+
+class SentenceSplitter:
+    """Corta en frases un texto que llega por fragmentos."""
+
+    def __init__(self, min_chars: Optional[int] = None):
+        self.min_chars = min_chars if min_chars is not None else int(os.getenv("REPLY_MIN_SENTENCE_CHARS", 20))
+        self._buffer = ""
+
+    def push(self, delta: str) -> List[str]:
+        """Añade texto y devuelve las frases completas."""
+        self._buffer += delta
+        sentences = []
+        search_from = 0
+        while True:
+            match = _SENTENCE_END.search(self._buffer, search_from)
+            if match is None:
+                break
+            sentence = self._buffer[:match.end()].strip()
+            if len(sentence) < self.min_chars:
+                # Demasiado corta: seguir buscando el siguiente fin de frase
+                search_from = match.end()
+                continue
+            sentences.append(sentence)
+            self._buffer = self._buffer[match.end():]
+            search_from = 0
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Devuelve el texto pendiente al terminar la respuesta."""
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest or None
+
+
+def split_sentences(text: str, min_chars: Optional[int] = None) -> List[str]:
+    """Corta un texto completo en frases."""
+    splitter = SentenceSplitter(min_chars)
+    sentences = splitter.push(text)
+    rest = splitter.flush()
+    return sentences + ([rest] if rest else [])
+
+
+async def iter_sentences(
+    deltas: AsyncIterator[str], splitter: Optional[SentenceSplitter] = None
+) -> AsyncIterator[str]:
+    """Frases completas de un texto que llega por fragmentos, en cuanto se cierran."""
+    splitter = splitter or SentenceSplitter()
+    async for delta in deltas:
+        for sentence in splitter.push(delta):
+            yield sentence
+    rest = splitter.flush()
+    if rest:
+        yield rest
+
+
+@dataclass
+class SentenceAudio:
+    """Audio de una frase de la respuesta (audio=None si falló la síntesis)."""
+
+    index: int
+    text: str
+    audio: Optional[bytes]
+    error: Optional[str] = None
+
+
+async def stream_sentence_audio(
+    deltas: AsyncIterator[str],
+    synthesize: Callable[[str], Awaitable[bytes]],
+    splitter: Optional[SentenceSplitter] = None,
+    lookahead: Optional[int] = None
+) -> AsyncIterator[SentenceAudio]:
+    """
+    Sintetiza cada frase en cuanto se completa y entrega los audios en orden.
+
+    Args:
+        deltas: fragmentos de texto del LLM según se generan
+        synthesize: corrutina texto → MP3 (p.ej. el pool "tts" del pipeline)
+
+    Un fallo de TTS en una frase no corta la respuesta: esa frase se entrega
+    con audio=None (el cliente puede mostrarla como subtítulo). Los errores
+    del iterador de texto se propagan.
+    """
+    if lookahead is None:
+        lookahead = int(os.getenv("REPLY_TTS_LOOKAHEAD", 2))
+    # Cola acotada: si el cliente consume despacio, se deja de leer del LLM
+    # en lugar de acumular síntesis pendientes
+    pending: asyncio.Queue = asyncio.Queue(maxsize=max(1, lookahead))
+
+    async def produce():
+        try:
+            async for sentence in iter_sentences(deltas, splitter):
+                await pending.put((sentence, asyncio.create_task(synthesize(sentence))))
+            await pending.put(None)
+        except Exception as e:
+            await pending.put(e)
+
+    producer = asyncio.create_task(produce())
+    index = 0
+    try:
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            sentence, task = item
+            try:
+                result = SentenceAudio(index, sentence, await task)
+            except Exception as e:
+                logger.warning(f"⚠️ Error en TTS de la frase {index}: {e}")
+                result = SentenceAudio(index, sentence, None, error=str(e))
+            yield result
+            index += 1
+    finally:
+        # Cliente desconectado o error: no dejar síntesis huérfanas
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if isinstance(item, tuple):
+                item[1].cancel()
@@ -0,0 +1,131 @@
+"""
+Caché de respuestas del LLM para frases de apertura frecuentes.
+
+Los estudiantes suelen abrir con lo mismo ("hola", "buenos días", "¿cómo
+estás?"). Para entradas cortas la respuesta se reutiliza si coinciden:
+- la entrada normalizada (minúsculas, sin tildes ni puntuación)
+- el tramo de estrés (alto 7-10, medio 4-6, bajo 0-3)
+- los últimos mensajes del historial (hash de los k últimos)
+
+Para que el avatar no repita siempre la misma frase se guardan hasta
+LLM_RESPONSE_CACHE_VARIANTS respuestas por clave: mientras no están todas se
+sigue llamando al LLM, y después se elige una al azar.
+
+Configuración:
+- LLM_RESPONSE_CACHE_SIZE: claves en memoria (por defecto 256; 0 = desactivado)
+- LLM_RESPONSE_CACHE_TTL_S: vida de una clave (por defecto 3600)
+- LLM_RESPONSE_CACHE_MAX_WORDS: solo entradas de hasta N palabras (por defecto 6)
+- LLM_RESPONSE_CACHE_HISTORY_K: mensajes de historial en la clave (por defecto 2)
+- LLM_RESPONSE_CACHE_VARIANTS: respuestas por clave (por defecto 3)
+"""
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_input(text: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación y con espacios simples."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text)).strip()
+
+
+def stress_bucket(stress_level: int) -> str:
+    if stress_level >= 7:
+        return "high"
+    if stress_level >= 4:
+        return "mid"
+    return "low"
+
+
+class ResponseCache:
+    """LRU con TTL de respuestas del LLM por (entrada, estrés, historial reciente)."""
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_s: Optional[float] = None,
+        max_words: Optional[int] = None,
+        history_k: Optional[int] = None,
+        variants: Optional[int] = None
+    ):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("LLM_RESPONSE_CACHE_SIZE", 256))
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.getenv("LLM_RESPONSE_CACHE_TTL_S", 3600))
+        self.max_words = max_words if max_words is not None else int(os.getenv("LLM_RESPONSE_CACHE_MAX_WORDS", 6))
+        self.history_k = history_k if history_k is not None else int(os.getenv("LLM_RESPONSE_CACHE_HISTORY_K", 2))
+        self.variants = max(1, variants if variants is not None else int(os.getenv("LLM_RESPONSE_CACHE_VARIANTS", 3)))
+        self._lock = threading.Lock()
+        # clave → (creada, respuestas)
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, user_input: str, stress_level: int, history: List[Dict[str, str]]) -> Optional[str]:
+        """Clave de la entrada, o None si no es cacheable (larga o vacía)."""
+        if not self.enabled:
+            return None
+        normalized = normalize_input(user_input or "")
+        if not normalized or len(normalized.split(" ")) > self.max_words:
+            return None
+        recent = history[-self.history_k:] if self.history_k > 0 else []
+        digest = hashlib.sha1(
+            "\x1f".join(f"{m['role']}:{m['content']}" for m in recent).encode("utf-8")
+        ).hexdigest()[:16]
+        return f"{stress_bucket(stress_level)}|{digest}|{normalized}"
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        """Una respuesta guardada, solo si la clave ya tiene todas sus variantes."""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] >= self.ttl_s:
+                del self._entries[key]
+                entry = None
+            if entry is None or len(entry[1]) < self.variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return random.choice(entry[1])
+
+    def put(self, key: Optional[str], response: str):
+        if key is None or not response:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = (time.time(), [])
+            if response not in entry[1] and len(entry[1]) < self.variants:
+                entry[1].append(response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Instancia compartida
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
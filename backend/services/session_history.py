@@ -0,0 +1,184 @@
+"""
+Historial de conversación por sesión para el LLM.
+
+Sustituye al dict sin límite de LLMService: cada sesión guarda sus últimos
+mensajes, caduca tras SESSION_HISTORY_TTL_S sin uso, se expulsa por LRU al
+superar SESSION_HISTORY_MAX_SESSIONS y se borra en /session/{id}/end.
+
+Con varios workers de uvicorn cada uno tiene su propia copia. Con
+SESSION_HISTORY_BACKEND=mongo, cuando una sesión no está en memoria o está
+atrasada (el cliente indica más turnos previos de los que este worker vio),
+se reconstruye a partir de los últimos turnos de la colección `turns`, que
+ya se guardan en cada petición (con este backend, antes de responder: ver
+services/turn_writer.py). Los turnos al día no tocan la BD.
+
+Configuración:
+- SESSION_HISTORY_MAX_SESSIONS: sesiones en memoria (por defecto 1000)
+- SESSION_HISTORY_TTL_S: vida de una sesión sin actividad (por defecto 3600)
+- SESSION_HISTORY_MAX_MESSAGES: mensajes por sesión (por defecto 10)
+- SESSION_HISTORY_BACKEND: "memory" (por defecto) o "mongo"
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+# (session_id, límite de turnos) → turnos de la BD, del más antiguo al más reciente
+TurnLoader = Callable[[str, int], Awaitable[List[Dict[str, Any]]]]
+
+
+@dataclass
+class _SessionEntry:
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    turns: int = 0  # turnos de la sesión que este worker conoce
+    last_used: float = 0.0
+
+
+def messages_from_turns(turns: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Mensajes de historial a partir de documentos de la colección `turns`."""
+    messages = []
+    for turn in turns:
+        if turn.get("user_transcription"):
+            messages.append({"role": "user", "content": turn["user_transcription"]})
+        if turn.get("avatar_response"):
+            messages.append({"role": "assistant", "content": turn["avatar_response"]})
+    return messages
+
+
+class SessionHistoryStore:
+    """Historiales por sesión con TTL, LRU y número máximo de sesiones."""
+
+    def __init__(
+        self,
+        max_sessions: Optional[int] = None,
+        ttl_s: Optional[float] = None,
+        max_messages: Optional[int] = None,
+        backend: Optional[str] = None
+    ):
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("SESSION_HISTORY_MAX_SESSIONS", 1000))
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.getenv("SESSION_HISTORY_TTL_S", 3600))
+        self.max_messages = max_messages if max_messages is not None else int(os.getenv("SESSION_HISTORY_MAX_MESSAGES", 10))
+        self.backend = (backend or os.getenv("SESSION_HISTORY_BACKEND", "memory")).lower()
+        # El LLM corre en el pool de hilos del pipeline
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+        self.reloads = 0
+
+    @property
+    def shared(self) -> bool:
+        return self.backend == "mongo"
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        """Copia del historial de la sesión (vacío si no existe)."""
+        with self._lock:
+            entry = self._touch(session_id)
+            return list(entry.messages) if entry else []
+
+    def append(self, session_id: str, role: str, content: str):
+        """Agrega un mensaje; se conservan los últimos max_messages."""
+        with self._lock:
+            entry = self._touch(session_id) or self._create(session_id)
+            entry.messages.append({"role": role, "content": content})
+            if len(entry.messages) > self.max_messages:
+                del entry.messages[:-self.max_messages]
+
+    def mark_turn(self, session_id: str, turn_number: int):
+        """Registra que la sesión llegó al turno turn_number en este worker."""
+        with self._lock:
+            entry = self._touch(session_id) or self._create(session_id)
+            entry.turns = max(entry.turns, turn_number)
+
+    def remove(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    async def sync(self, session_id: str, previous_turns: int, load_turns: TurnLoader) -> bool:
+        """
+        Recarga la sesión desde el backend compartido si este worker no la
+        tiene o le faltan turnos. Devuelve True si recargó.
+        """
+        if not self.shared:
+            return False
+        with self._lock:
+            entry = self._touch(session_id)
+            known = entry.turns if entry is not None else 0
+            if known >= previous_turns:
+                return False  # al día (o sesión nueva: no hay nada que leer)
+        # Cada turno aporta hasta dos mensajes
+        turns = await load_turns(session_id, (self.max_messages + 1) // 2)
+        messages = messages_from_turns(turns)[-self.max_messages:]
+        loaded = max((t.get("turn_number", 0) for t in turns), default=0)
+        if loaded < previous_turns:
+            logger.warning(
+                f"⚠️ Historial de {session_id} incompleto: la BD tiene hasta el turno {loaded} "
+                f"de {previous_turns} (faltan turnos sin guardar)"
+            )
+        with self._lock:
+            entry = self._sessions.get(session_id) or self._create(session_id)
+            entry.messages = messages
+            entry.turns = max(previous_turns, loaded)
+            self.reloads += 1
+        return True
+
+    def sweep(self) -> int:
+        """Borra las sesiones caducadas. Devuelve cuántas."""
+        with self._lock:
+            return self._expire(time.time())
+
+    def _touch(self, session_id: str) -> Optional[_SessionEntry]:
+        """Entrada vigente de la sesión, marcada como recién usada (con el lock)."""
+        now = time.time()
+        self._expire(now)
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            entry.last_used = now
+            self._sessions.move_to_end(session_id)
+        return entry
+
+    def _create(self, session_id: str) -> _SessionEntry:
+        entry = self._sessions[session_id] = _SessionEntry(last_used=time.time())
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def _expire(self, now: float) -> int:
+        expired = 0
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry.last_used < self.ttl_s:
+                break  # orden LRU: el resto es más reciente
+            del self._sessions[session_id]
+            expired += 1
+        self.expirations += expired
+        return expired
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "reloads": self.reloads,
+            }
+
+
+# Instancia compartida
+_session_history: Optional[SessionHistoryStore] = None
+
+
+def get_session_history() -> SessionHistoryStore:
+    global _session_history
+    if _session_history is None:
+        _session_history = SessionHistoryStore()
+    return _session_history
@@ -1,6 +1,11 @@
 from gtts import gTTS
+import io
 import os
 
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
 class SimpleTTSService:
     """
     Servicio TTS simple usando gTTS (Google Text-to-Speech offline).
@@ -8,7 +13,7 @@ class SimpleTTSService:
     """
     
     def __init__(self):
-        print("✅ SimpleTTSService inicializado (usando gTTS)")
+        logger.info("✅ SimpleTTSService inicializado (usando gTTS)")
     
     def synthesize(
         self,
@@ -31,18 +36,37 @@ class SimpleTTSService:
             # Crear directorio si no existe
             os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else ".", exist_ok=True)
             
-            # Generar audio con gTTS
-            # Usar voz lenta si el estrés es bajo, normal si es alto
-            slow = stress_level < 5
-            
-            # Usar tld='com.mx' para voz masculina mexicana
-            # O tld='es' para español de España (también masculino)
-            tts = gTTS(text=text, lang='es', slow=slow, tld='com.mx')
-            tts.save(output_path)
+            with open(output_path, "wb") as out:
+                out.write(self.synthesize_bytes(text, stress_level))
             
-            print(f"✅ Audio TTS generado: {output_path}")
+            logger.debug(f"✅ Audio TTS generado: {output_path}")
             return output_path
             
         except Exception as e:
-            print(f"❌ Error en SimpleTTSService: {e}")
+            logger.error(f"❌ Error en SimpleTTSService: {e}")
             raise
+    
+    def synthesize_bytes(self, text: str, stress_level: int) -> bytes:
+        """
+        Sintetizar texto a MP3 en memoria (sin archivo), para enviar por streaming.
+        
+        Returns:
+            bytes: Audio MP3
+        """
+        params = self.cache_params(stress_level)
+        tts = gTTS(text=text, lang=params["lang"], slow=params["slow"], tld=params["tld"])
+        buffer = io.BytesIO()
+        tts.write_to_fp(buffer)
+        return buffer.getvalue()
+    
+    def cache_params(self, stress_level: int) -> dict:
+        """Voz y prosodia que determinan el audio (clave del caché de TTS)."""
+        return {
+            "engine": "gtts",
+            "lang": "es",
+            # Usar tld='com.mx' para voz masculina mexicana
+            # O tld='es' para español de España (también masculino)
+            "tld": "com.mx",
+            # Usar voz lenta si el estrés es bajo, normal si es alto
+            "slow": stress_level < 5,
+        }
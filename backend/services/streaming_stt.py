@@ -0,0 +1,165 @@
+"""
+Transcripción incremental de un enunciado que llega por fragmentos PCM.
+
+Mientras el usuario habla se transcribe periódicamente una ventana móvil del
+audio no confirmado. Cuando esa ventana supera STREAM_WINDOW_S, los segmentos
+de Whisper que terminan antes de los últimos STREAM_KEEP_S segundos se
+confirman y ya no se vuelven a decodificar. Al terminar la voz solo queda
+por transcribir la cola no confirmada, así que el texto final llega en unos
+cientos de ms. Las características de emoción se acumulan trama a trama.
+El audio de un enunciado se limita a STREAM_MAX_UTTERANCE_S: al llegar ahí
+(`full`) se cierra como si hubiera terminado la voz.
+
+Configuración:
+- STREAM_PARTIAL_INTERVAL_S: audio nuevo entre transcripciones parciales (1.0)
+- STREAM_WINDOW_S: tamaño máximo de la ventana sin confirmar (8.0)
+- STREAM_KEEP_S: cola que nunca se confirma en parciales (2.0)
+- STREAM_END_SILENCE_MS: silencio que marca el fin de la voz (500)
+- STREAM_MAX_UTTERANCE_S: duración máxima del audio de un enunciado (60.0)
+"""
+import os
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+
+from services.acoustic_features import IncrementalFeatures
+from services.audio_buffer import AudioBuffer, SAMPLE_RATE
+from services.vad import StreamingVAD, VoiceActivityDetector
+
+Transcribe = Callable[[AudioBuffer], Awaitable[dict]]
+
+
+class StreamingTranscriber:
+    """Estado de transcripción en streaming de una conexión."""
+
+    def __init__(self, transcribe: Transcribe):
+        self.transcribe = transcribe
+        self.partial_interval = int(float(os.getenv("STREAM_PARTIAL_INTERVAL_S", 1.0)) * SAMPLE_RATE)
+        self.window = int(float(os.getenv("STREAM_WINDOW_S", 8.0)) * SAMPLE_RATE)
+        self.keep = int(float(os.getenv("STREAM_KEEP_S", 2.0)) * SAMPLE_RATE)
+        self.end_silence_ms = float(os.getenv("STREAM_END_SILENCE_MS", 500))
+        self.max_samples = int(float(os.getenv("STREAM_MAX_UTTERANCE_S", 60.0)) * SAMPLE_RATE)
+        self._generation = 0
+        self.reset()
+
+    def reset(self):
+        """Prepara el estado para el siguiente enunciado."""
+        self._generation += 1
+        self._chunks: List[np.ndarray] = []
+        self._audio = np.zeros(0, dtype=np.float32)
+        self.n_samples = 0
+        self.committed_text = ""
+        self.committed_samples = 0
+        self.last_partial = ""
+        self._samples_at_partial = 0
+        self.partial_running = False
+        self.had_speech = False
+        self.features = IncrementalFeatures()
+        self.vad = StreamingVAD(VoiceActivityDetector(), end_silence_ms=self.end_silence_ms)
+
+    @property
+    def audio(self) -> np.ndarray:
+        """Audio completo del enunciado (concatenado bajo demanda)."""
+        if self._chunks:
+            self._audio = np.concatenate([self._audio] + self._chunks)
+            self._chunks = []
+        return self._audio
+
+    @property
+    def duration(self) -> float:
+        return self.n_samples / SAMPLE_RATE
+
+    @property
+    def full(self) -> bool:
+        """True si el enunciado llegó a STREAM_MAX_UTTERANCE_S."""
+        return self.n_samples >= self.max_samples
+
+    def push(self, samples: np.ndarray) -> Optional[str]:
+        """
+        Añade un fragmento float32 a 16 kHz.
+
+        Returns:
+            "start"/"end" si el VAD detecta inicio/fin de voz, o None
+        """
+        self._chunks.append(samples)
+        self.n_samples += len(samples)
+        self.features.push(samples)
+        event = self.vad.push(samples)
+        if event == "start":
+            self.had_speech = True
+        return event
+
+    def partial_due(self) -> bool:
+        return (
+            self.had_speech
+            and not self.partial_running
+            and self.n_samples - self._samples_at_partial >= self.partial_interval
+        )
+
+    async def partial(self) -> Optional[str]:
+        """Transcribe la ventana no confirmada; devuelve el texto parcial."""
+        generation = self._generation
+        committed = self.committed_samples
+        window = self.audio[committed:]
+        self._samples_at_partial = self.n_samples
+        self.partial_running = True
+        try:
+            result = await self.transcribe(AudioBuffer(window))
+        finally:
+            if generation == self._generation:
+                self.partial_running = False
+
+        # El enunciado terminó (o se confirmó otra parte) mientras se decodificaba
+        if generation != self._generation or committed != self.committed_samples:
+            return None
+
+        self._commit(result, len(window))
+        pending = self._segments_after(result, self.committed_samples - committed)
+        self.last_partial = _join(self.committed_text, pending)
+        return self.last_partial
+
+    def _commit(self, result: dict, window_len: int):
+        """Confirma los segmentos que terminan antes de los últimos keep segundos."""
+        if window_len <= self.window:
+            return
+        cutoff = (window_len - self.keep) / SAMPLE_RATE
+        committed_end = 0.0
+        for segment in result.get("segments", []):
+            if segment["end"] > cutoff:
+                break
+            self.committed_text = _join(self.committed_text, segment["text"])
+            committed_end = segment["end"]
+        self.committed_samples += int(committed_end * SAMPLE_RATE)
+
+    @staticmethod
+    def _segments_after(result: dict, offset_samples: int) -> str:
+        offset = offset_samples / SAMPLE_RATE
+        segments = result.get("segments", [])
+        if not segments:
+            return result["text"] if offset_samples == 0 else ""
+        return " ".join(s["text"].strip() for s in segments if s["end"] > offset)
+
+    async def finalize(self) -> dict:
+        """
+        Transcribe la cola no confirmada y agrega las características.
+
+        Returns:
+            dict: {"text": str, "features": np.ndarray, "duration_sec": float}
+        """
+        committed_text = self.committed_text
+        features = self.features.finalize()
+        duration = self.duration
+
+        text = committed_text
+        if self.had_speech:
+            tail = self.audio[self.committed_samples:]
+            if len(tail) > 0:
+                result = await self.transcribe(AudioBuffer(tail))
+                text = _join(committed_text, result["text"])
+
+        return {"text": text.strip(), "features": features, "duration_sec": duration}
+
+
+def _join(left: str, right: str) -> str:
+    left, right = left.strip(), right.strip()
+    return f"{left} {right}".strip()
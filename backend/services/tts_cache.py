@@ -0,0 +1,257 @@
+"""
+Caché de TTS direccionado por contenido.
+
+Muchas respuestas del avatar son frases fijas (respuestas offline del LLM,
+respuestas de emergencia, "no te escuché"). El audio se identifica por
+sha256(texto, voz, prosodia derivada del estrés) y se guarda en disco como
+temp/tts_cache/<clave>.mp3, así que:
+- un acierto evita la llamada a TTS por completo
+- la URL (/static/tts_cache/<clave>.mp3) es estable y Unity puede cachearla
+
+Por defecto solo se guardan las frases registradas como fijas
+(register_canned); las respuestas libres del LLM casi nunca se repiten y
+desplazarían a las fijas. Con TTS_CACHE_ALL=true se guarda todo. Las
+frases que no se guardan tampoco se buscan: cuentan como "uncacheable" y no
+como fallos, para que hits/misses midan solo lo cacheable.
+
+Configuración:
+- TTS_CACHE_ENABLED: "false" para desactivar el caché (por defecto activo)
+- TTS_CACHE_DIR: directorio del caché (por defecto temp/tts_cache)
+- TTS_CACHE_MAX_MB: tamaño máximo en disco, se expulsa por LRU (por defecto 256)
+- TTS_CACHE_ALL: guardar también las frases no registradas (por defecto false)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+CACHE_SUBDIR = "tts_cache"
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() not in ("false", "0", "no")
+
+
+def normalize_text(text: str) -> str:
+    """Texto tal como se sintetiza (los espacios sobrantes no cambian el audio)."""
+    return " ".join(text.split())
+
+
+class TTSCache:
+    """Caché LRU en disco de audios MP3 sintetizados."""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None, store_all: Optional[bool] = None):
+        self.directory = directory or os.getenv("TTS_CACHE_DIR", os.path.join("temp", CACHE_SUBDIR))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("TTS_CACHE_MAX_MB", 256)) * 1024 * 1024)
+        self.store_all = store_all if store_all is not None else _flag("TTS_CACHE_ALL", "false")
+        self._lock = threading.Lock()
+        # clave → tamaño en bytes, del menos al más recientemente usado
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._canned = set()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Reconstruye el índice LRU desde el disco (orden por fecha de modificación)."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            elif entry.is_file() and entry.name.endswith(".tmp"):
+                # Escritura interrumpida
+                os.remove(entry.path)
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def key(text: str, params: Dict[str, Any]) -> str:
+        payload = json.dumps({"text": normalize_text(text), **params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def key_for(self, tts, text: str, stress_level: int) -> str:
+        return self.key(text, tts.cache_params(stress_level))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    @staticmethod
+    def url_path(key: str) -> str:
+        """Ruta relativa a temp/ (la que se sirve bajo /static/)."""
+        return f"{CACHE_SUBDIR}/{key}.mp3"
+
+    def register_canned(self, texts: Iterable[str]):
+        """Registra frases fijas: se guardan en caché aunque TTS_CACHE_ALL esté desactivado."""
+        with self._lock:
+            self._canned.update(normalize_text(t) for t in texts)
+
+    def should_store(self, text: str) -> bool:
+        return self.store_all or normalize_text(text) in self._canned
+
+    def _cacheable(self, text: str) -> bool:
+        """should_store, contando las frases no cacheables en uncacheable."""
+        if self.should_store(text):
+            return True
+        with self._lock:
+            self.uncacheable += 1
+        return False
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> Optional[str]:
+        """Path del audio si está en caché (y lo marca como recién usado)."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        path = self.path(key)
+        try:
+            # La fecha de modificación conserva el orden LRU entre reinicios
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+            return None
+        return path
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, audio: bytes) -> str:
+        """Guarda el audio de forma atómica y expulsa lo menos usado si se supera el límite."""
+        path = self.path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(audio)
+            self._total_bytes += len(audio)
+            evicted = self._evict()
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except FileNotFoundError:
+                pass
+        return path
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        evicted = []
+        # Nunca se expulsa la entrada recién guardada
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            evicted.append(old_key)
+        return evicted
+
+    def cached_file(self, tts, text: str, stress_level: int) -> Optional[str]:
+        """
+        Audio de text desde el caché, sintetizándolo si es una frase cacheable.
+
+        Returns:
+            ruta relativa a temp/ para la URL, o None si la frase no se cachea
+            (el llamador la sintetiza por su cuenta)
+        """
+        if not self._cacheable(text):
+            return None
+        key = self.key_for(tts, text, stress_level)
+        if self.get(key) is None:
+            self.put(key, tts.synthesize_bytes(text=text, stress_level=stress_level))
+        return self.url_path(key)
+
+    def synthesize_bytes(self, tts, text: str, stress_level: int) -> bytes:
+        """Como tts.synthesize_bytes, pero sirviendo y guardando desde el caché."""
+        if not self._cacheable(text):
+            return tts.synthesize_bytes(text=text, stress_level=stress_level)
+        key = self.key_for(tts, text, stress_level)
+        audio = self.get_bytes(key)
+        if audio is not None:
+            return audio
+        audio = tts.synthesize_bytes(text=text, stress_level=stress_level)
+        self.put(key, audio)
+        return audio
+
+    def presynthesize(self, tts, utterances: Iterable[Tuple[str, Iterable[int]]]) -> int:
+        """
+        Sintetiza por adelantado frases fijas para los niveles de estrés
+        indicados. Las variantes con la misma prosodia se sintetizan una vez.
+
+        Returns:
+            int: número de audios nuevos generados
+        """
+        created = 0
+        start = time.perf_counter()
+        for text, levels in utterances:
+            self.register_canned([text])
+            seen = set()
+            for stress_level in levels:
+                key = self.key_for(tts, text, stress_level)
+                if key in seen or self.contains(key):
+                    continue
+                seen.add(key)
+                try:
+                    self.put(key, tts.synthesize_bytes(text=text, stress_level=stress_level))
+                    created += 1
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo presintetizar '{text[:30]}...': {e}")
+                    return created
+        logger.info(f"🗣️ Caché TTS: {created} frases fijas sintetizadas en {time.perf_counter() - start:.1f}s")
+        return created
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncacheable": self.uncacheable,
+                "evictions": self.evictions,
+            }
+
+
+# Instancia compartida
+_tts_cache: Optional[TTSCache] = None
+
+
+def get_tts_cache() -> Optional[TTSCache]:
+    """Caché compartido, o None si TTS_CACHE_ENABLED=false."""
+    global _tts_cache
+    if not _flag("TTS_CACHE_ENABLED", "true"):
+        return None
+    if _tts_cache is None:
+        _tts_cache = TTSCache()
+    return _tts_cache
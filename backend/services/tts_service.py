@@ -35,20 +35,29 @@ class TTSService:
         Returns:
             str: Path del archivo generado
         """
-        # Ajustar parámetros según estrés
-        # Estrés alto = voz más rápida, pitch variable, volumen alto
-        speaking_rate = 0.9 + (stress_level * 0.02)  # 0.9 - 1.1
-        pitch = -2.0 + (stress_level * 0.4)  # -2.0 a +2.0
-        volume_gain = 0.0 + (stress_level * 0.5)  # 0.0 a +5.0
+        # Guardar archivo
+        with open(output_path, "wb") as out:
+            out.write(self.synthesize_bytes(text, stress_level))
+        
+        return output_path
+    
+    def synthesize_bytes(self, text: str, stress_level: int) -> bytes:
+        """
+        Sintetizar texto a MP3 en memoria (sin archivo), para enviar por streaming.
+        
+        Returns:
+            bytes: Audio MP3
+        """
+        params = self.cache_params(stress_level)
         
         # Configurar síntesis
         synthesis_input = texttospeech.SynthesisInput(text=text)
         
         audio_config = texttospeech.AudioConfig(
             audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=speaking_rate,
-            pitch=pitch,
-            volume_gain_db=volume_gain
+            speaking_rate=params["speaking_rate"],
+            pitch=params["pitch"],
+            volume_gain_db=params["volume_gain_db"]
         )
         
         # Generar audio
@@ -57,9 +66,16 @@ class TTSService:
             voice=self.voice,
             audio_config=audio_config
         )
-        
-        # Guardar archivo
-        with open(output_path, "wb") as out:
-            out.write(response.audio_content)
-        
-        return output_path
\ No newline at end of file
+        return response.audio_content
+    
+    def cache_params(self, stress_level: int) -> dict:
+        """Voz y prosodia que determinan el audio (clave del caché de TTS)."""
+        # Ajustar parámetros según estrés
+        # Estrés alto = voz más rápida, pitch variable, volumen alto
+        return {
+            "engine": "google",
+            "voice": self.voice.name,
+            "speaking_rate": round(0.9 + (stress_level * 0.02), 3),  # 0.9 - 1.1
+            "pitch": round(-2.0 + (stress_level * 0.4), 3),  # -2.0 a +2.0
+            "volume_gain_db": round(0.0 + (stress_level * 0.5), 3),  # 0.0 a +5.0
+        }
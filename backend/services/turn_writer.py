@@ -0,0 +1,255 @@
+"""
+Escritura diferida (write-behind) de los turnos en MongoDB.
+
+Guardar un turno costaba dos viajes a la BD (insert_one + $inc en la sesión)
+antes de devolver la respuesta. Ahora el turno se encola y la respuesta sale
+enseguida; una tarea de fondo agrupa los pendientes y los escribe con un
+insert_many y un bulk_write de los $inc por sesión, al llenarse un lote o
+cada TURN_WRITE_FLUSH_MS.
+
+Si la escritura falla los turnos vuelven a la cola y se reintenta con espera
+exponencial; tras TURN_WRITE_MAX_RETRIES fallos seguidos se descarta el lote
+más antiguo. Cada turno lleva su `_id` desde que se encola, así que un
+reintento no lo duplica. Al apagar la app (lifespan) se vacía la cola.
+
+Las lecturas de turnos de este worker (historial, /session/{id}/turns, fin
+de sesión) llaman antes a wait_idle(): despiertan a la tarea de fondo y
+esperan (hasta TURN_WRITE_READ_WAIT_MS) a que escriba lo pendiente. No
+escriben ellas mismas, así que una ráfaga de lecturas con la BD caída no
+gasta los reintentos ni puede descartar turnos. Otros workers
+no ven los turnos que este aún no escribió: con varios workers,
+GET /session/{id} en otro worker puede dar un total_turns atrasado hasta un
+intervalo. Por eso, con SESSION_HISTORY_BACKEND=mongo (el historial del LLM
+se recarga de la BD cuando la sesión cambia de worker) la escritura es
+siempre síncrona: si no, la recarga perdería los últimos intercambios.
+
+Configuración:
+- TURN_WRITE_MODE: "behind" (por defecto) o "sync" (await en cada turno, como antes);
+  con SESSION_HISTORY_BACKEND=mongo se ignora y siempre es "sync"
+- TURN_WRITE_BATCH_SIZE: turnos por insert_many (por defecto 50)
+- TURN_WRITE_FLUSH_MS: intervalo máximo entre escrituras (por defecto 250)
+- TURN_WRITE_MAX_PENDING: turnos en cola; al superarlo se descartan los más antiguos (por defecto 10000)
+- TURN_WRITE_MAX_RETRIES: fallos seguidos antes de descartar un lote (por defecto 5)
+- TURN_WRITE_READ_WAIT_MS: espera máxima de una lectura a la cola (por defecto 1000)
+"""
+import asyncio
+import os
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from bson import ObjectId
+
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class TurnWriter:
+    """Cola de turnos pendientes con escritura por lotes en segundo plano."""
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        flush_interval_s: Optional[float] = None,
+        max_pending: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        read_wait_s: Optional[float] = None,
+        retry_base_s: float = 0.5,
+        retry_max_s: float = 30.0
+    ):
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv("TURN_WRITE_BATCH_SIZE", 50))
+        self.flush_interval_s = flush_interval_s if flush_interval_s is not None else float(os.getenv("TURN_WRITE_FLUSH_MS", 250)) / 1000
+        self.max_pending = max_pending if max_pending is not None else int(os.getenv("TURN_WRITE_MAX_PENDING", 10000))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("TURN_WRITE_MAX_RETRIES", 5))
+        self.read_wait_s = read_wait_s if read_wait_s is not None else float(os.getenv("TURN_WRITE_READ_WAIT_MS", 1000)) / 1000
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self._pending: Deque[Dict[str, Any]] = deque()
+        # Sesiones con turnos ya insertados a los que les falta el $inc
+        self._increments: Counter = Counter()
+        self._failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Puesto cuando no queda nada por escribir (lo esperan las lecturas)
+        self._idle: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        if os.getenv("SESSION_HISTORY_BACKEND", "memory").lower() == "mongo":
+            # Otro worker puede recargar el historial en el siguiente turno
+            return False
+        return os.getenv("TURN_WRITE_MODE", "behind").lower() != "sync"
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, turn: Dict[str, Any]):
+        """Encola un turno; se escribirá en el próximo lote (no espera a la BD)."""
+        turn.setdefault("_id", ObjectId())
+        turn.setdefault("timestamp", datetime.utcnow())
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            self.dropped += 1
+            logger.warning("⚠️ Cola de turnos llena: se descarta el más antiguo")
+        self._pending.append(turn)
+        self._ensure_running()
+        self._idle.clear()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_running(self):
+        """Lanza la tarea de escritura en el event loop actual si no está corriendo."""
+        self._bind_loop()
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run())
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._pending and not self._increments:
+                continue
+            try:
+                await self.flush()
+            except Exception as e:
+                if not self._failures:
+                    continue  # el lote se acaba de descartar
+                delay = min(self.retry_max_s, self.retry_base_s * 2 ** (self._failures - 1))
+                logger.warning(f"⚠️ No se pudieron guardar {len(self._pending)} turnos (reintento en {delay:.1f}s): {e}")
+                await asyncio.sleep(delay)
+
+    async def wait_idle(self) -> bool:
+        """
+        Espera (hasta read_wait_s) a que la tarea de fondo escriba lo
+        pendiente. Para lecturas: no escribe ni cuenta fallos. Devuelve
+        False si quedan turnos sin escribir (BD caída o lenta).
+        """
+        if not self._pending and not self._increments:
+            return True
+        self._ensure_running()
+        if self._failures:
+            return False  # la tarea de fondo está esperando para reintentar
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.read_wait_s)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def flush(self):
+        """
+        Escribe todo lo pendiente. Si la BD falla, los turnos vuelven a la
+        cola y la excepción se propaga (la tarea de fondo reintenta).
+        """
+        self._bind_loop()
+        if not self._pending and not self._increments:
+            self._idle.set()
+            return
+        async with self._lock:
+            while self._pending or self._increments:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                try:
+                    await self._write(batch)
+                except Exception:
+                    self._failed(batch)
+                    raise
+                self._failures = 0
+            self._idle.set()
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        from services.database import TurnWriteError, get_db
+
+        db = await get_db()
+        if batch:
+            try:
+                inserted = await db.insert_turns(batch)
+            except TurnWriteError as e:
+                self._inserted(e.inserted)
+                batch[:] = e.failed
+                raise
+            if inserted is None:
+                raise ConnectionError("MongoDB no disponible")
+            self._inserted(inserted)
+            batch.clear()
+            self.batches += 1
+        if self._increments:
+            if not await db.increment_session_turns(dict(self._increments)):
+                raise ConnectionError("MongoDB no disponible")
+            self._increments.clear()
+
+    def _inserted(self, turns: List[Dict[str, Any]]):
+        self.written += len(turns)
+        self._increments.update(t["session_id"] for t in turns)
+
+    def _failed(self, batch: List[Dict[str, Any]]):
+        """Devuelve a la cola lo que no se escribió; tras demasiados fallos lo descarta."""
+        self._failures += 1
+        self.retries += 1
+        if self._failures <= self.max_retries:
+            self._pending.extendleft(reversed(batch))
+            return
+        self.dropped += len(batch)
+        logger.error(
+            f"❌ Descartados tras {self._failures} intentos fallidos: {len(batch)} turnos "
+            f"y el contador de {len(self._increments)} sesiones"
+        )
+        self._increments.clear()
+        self._failures = 0
+
+    async def close(self):
+        """Para la tarea de fondo y escribe lo pendiente (al apagar la app)."""
+        self._bind_loop()
+        if self._task is not None:
+            # Con el lock: no se corta un lote a medio escribir
+            async with self._lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"❌ {len(self._pending)} turnos sin guardar al apagar: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "behind" if self.enabled else "sync",
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
+
+
+# Instancia compartida
+_turn_writer: Optional[TurnWriter] = None
+
+
+def get_turn_writer() -> TurnWriter:
+    global _turn_writer
+    if _turn_writer is None:
+        _turn_writer = TurnWriter()
+    return _turn_writer
@@ -0,0 +1,178 @@
+"""
+Detección de actividad de voz (VAD) por energía y tasa de cruces por cero.
+
+Se ejecuta antes de Whisper: recorta el silencio inicial y final del audio y
+marca los clips sin voz para que no pasen por STT ni por el clasificador de
+emociones (los micrófonos push-to-talk generan muchos clips vacíos).
+
+Una trama es voz si su energía supera el umbral, o si está algo por debajo
+pero tiene un ZCR alto (consonantes fricativas como "s" o "f"). El umbral se
+adapta al ruido de fondo del clip, limitado entre VAD_ENERGY_DB y -30 dBFS.
+
+Configuración:
+- VAD_ENABLED: "false" para desactivar el VAD (por defecto activo)
+- VAD_ENERGY_DB: umbral mínimo de energía en dBFS (por defecto -45)
+- VAD_MIN_SPEECH_MS: voz mínima para considerar que hubo habla (por defecto 150)
+- VAD_PAD_MS: margen que se conserva alrededor de la voz al recortar (por defecto 200)
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from services.audio_buffer import AudioBuffer, SAMPLE_RATE
+
+FRAME_MS = 25
+HOP_MS = 10
+# Margen sobre el ruido de fondo y techo del umbral adaptativo
+NOISE_MARGIN_DB = 10.0
+MAX_THRESHOLD_DB = -30.0
+# Las tramas con ZCR alto cuentan como voz hasta este margen bajo el umbral
+FRICATIVE_MARGIN_DB = 5.0
+FRICATIVE_ZCR = 0.25
+
+
+@dataclass(frozen=True)
+class VadResult:
+    """Resultado del VAD sobre un clip completo."""
+
+    is_speech: bool
+    start: int  # primera muestra a conservar
+    end: int  # última muestra (exclusiva) a conservar
+    speech_ms: float
+    threshold_db: float
+
+    def trim(self, audio: AudioBuffer) -> AudioBuffer:
+        """Audio sin silencio inicial/final (vista del mismo array, sin copia)."""
+        return AudioBuffer(audio.samples[self.start:self.end], audio.sample_rate)
+
+
+class VoiceActivityDetector:
+    """VAD vectorizado por tramas de FRAME_MS con salto de HOP_MS."""
+
+    def __init__(
+        self,
+        sample_rate: int = SAMPLE_RATE,
+        energy_db: Optional[float] = None,
+        min_speech_ms: Optional[float] = None,
+        pad_ms: Optional[float] = None
+    ):
+        self.sample_rate = sample_rate
+        self.frame_length = sample_rate * FRAME_MS // 1000
+        self.hop_length = sample_rate * HOP_MS // 1000
+        self.energy_db = energy_db if energy_db is not None else float(os.getenv("VAD_ENERGY_DB", -45))
+        self.min_speech_ms = min_speech_ms if min_speech_ms is not None else float(os.getenv("VAD_MIN_SPEECH_MS", 150))
+        self.pad_ms = pad_ms if pad_ms is not None else float(os.getenv("VAD_PAD_MS", 200))
+
+    def frame_features(self, samples: np.ndarray):
+        """Energía (dBFS) y ZCR de cada trama."""
+        if len(samples) < self.frame_length:
+            samples = np.pad(samples, (0, self.frame_length - len(samples)))
+        frames = sliding_window_view(samples, self.frame_length)[::self.hop_length]
+        energy_db = 10 * np.log10(np.mean(frames.astype(np.float32) ** 2, axis=1) + 1e-12)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return energy_db, zcr
+
+    def threshold_for(self, energy_db: np.ndarray) -> float:
+        """Umbral adaptativo: ruido de fondo + margen, acotado."""
+        noise_floor = float(np.percentile(energy_db, 10))
+        return max(self.energy_db, min(noise_floor + NOISE_MARGIN_DB, MAX_THRESHOLD_DB))
+
+    def speech_frames(self, energy_db: np.ndarray, zcr: np.ndarray, threshold_db: float) -> np.ndarray:
+        fricative = (energy_db > threshold_db - FRICATIVE_MARGIN_DB) & (zcr > FRICATIVE_ZCR)
+        return (energy_db > threshold_db) | fricative
+
+    def detect(self, audio: AudioBuffer) -> VadResult:
+        samples = audio.samples
+        if len(samples) == 0:
+            return VadResult(False, 0, 0, 0.0, self.energy_db)
+
+        energy_db, zcr = self.frame_features(samples)
+        threshold_db = self.threshold_for(energy_db)
+        speech = self.speech_frames(energy_db, zcr, threshold_db)
+
+        speech_ms = float(np.count_nonzero(speech) * HOP_MS)
+        if speech_ms < self.min_speech_ms:
+            return VadResult(False, 0, 0, speech_ms, threshold_db)
+
+        voiced = np.flatnonzero(speech)
+        pad = int(self.pad_ms * self.sample_rate / 1000)
+        start = max(0, voiced[0] * self.hop_length - pad)
+        end = min(len(samples), voiced[-1] * self.hop_length + self.frame_length + pad)
+        return VadResult(True, int(start), int(end), speech_ms, threshold_db)
+
+
+class StreamingVAD:
+    """
+    VAD incremental para audio que llega por fragmentos.
+
+    push() devuelve "start" cuando empieza la voz, "end" cuando tras haber voz
+    se acumulan end_silence_ms de silencio, o None.
+    """
+
+    def __init__(self, detector: Optional[VoiceActivityDetector] = None, end_silence_ms: float = 500):
+        self.detector = detector or VoiceActivityDetector()
+        self.end_silence_frames = int(end_silence_ms / HOP_MS)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._noise_floor_db: Optional[float] = None
+        self._speech_frames = 0
+        self._silence_run = 0
+        self.in_speech = False
+
+    def push(self, chunk: np.ndarray) -> Optional[str]:
+        samples = np.concatenate([self._tail, chunk.astype(np.float32, copy=False)])
+        frame_length, hop = self.detector.frame_length, self.detector.hop_length
+        if len(samples) < frame_length:
+            self._tail = samples
+            return None
+
+        n_frames = 1 + (len(samples) - frame_length) // hop
+        energy_db, zcr = self.detector.frame_features(samples[:(n_frames - 1) * hop + frame_length])
+        self._tail = samples[n_frames * hop:]
+
+        # Ruido de fondo: mínimo con recuperación lenta
+        chunk_floor = float(np.percentile(energy_db, 10))
+        if self._noise_floor_db is None:
+            self._noise_floor_db = chunk_floor
+        else:
+            self._noise_floor_db = min(chunk_floor, self._noise_floor_db + 0.5)
+        threshold_db = max(
+            self.detector.energy_db,
+            min(self._noise_floor_db + NOISE_MARGIN_DB, MAX_THRESHOLD_DB)
+        )
+
+        event = None
+        for is_speech in self.detector.speech_frames(energy_db, zcr, threshold_db):
+            if is_speech:
+                self._speech_frames += 1
+                self._silence_run = 0
+                if not self.in_speech and self._speech_frames * HOP_MS >= self.detector.min_speech_ms:
+                    self.in_speech = True
+                    event = "start"
+            else:
+                self._silence_run += 1
+                if self.in_speech and self._silence_run >= self.end_silence_frames:
+                    self.in_speech = False
+                    self._speech_frames = 0
+                    event = "end"
+                elif not self.in_speech:
+                    self._speech_frames = 0
+        return event
+
+
+# Instancia compartida
+_vad: Optional[VoiceActivityDetector] = None
+
+
+def get_vad() -> VoiceActivityDetector:
+    global _vad
+    if _vad is None:
+        _vad = VoiceActivityDetector()
+    return _vad
+
+
+def vad_enabled() -> bool:
+    return os.getenv("VAD_ENABLED", "true").lower() not in ("false", "0", "no")
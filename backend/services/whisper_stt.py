@@ -1,64 +1,172 @@
-import whisper
-import torch
+import abc
+import logging
 import os
-from typing import Optional
+import time
+from typing import Optional, Union
+
+import numpy as np
+
+from services.audio_buffer import AudioBuffer, SAMPLE_RATE
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+class STTEngine(abc.ABC):
+    """
+    Interfaz común de los motores de transcripción.
+
+    Motores disponibles (variable STT_ENGINE):
+    - "whisper": openai-whisper (PyTorch)
+    - "faster-whisper": CTranslate2, cuantizado (int8 por defecto), mucho más
+      rápido en servidores sin GPU
+    - "auto" (por defecto): faster-whisper si está instalado, si no openai-whisper
+    """
+
+    name = "base"
+
+    def transcribe(self, audio: Union[AudioBuffer, str], language: str = "es") -> dict:
+        """
+        Transcribir audio a texto.
+
+        Args:
+            audio: AudioBuffer ya decodificado (16 kHz) o path a un archivo
+
+        Returns:
+            dict: {"text": str, "language": str, "segments": list}
+        """
+        if isinstance(audio, str):
+            audio = AudioBuffer.from_file(audio)
+
+        # Estadísticas de depuración: solo se calculan con LOG_LEVEL=DEBUG
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            max_amplitude = audio.max_amplitude
+            logger.debug(
+                "🔍 Audio: %.2fs, %d Hz, amplitud máx %.4f%s",
+                audio.duration, audio.sample_rate, max_amplitude,
+                " (casi SILENCIO)" if max_amplitude < 0.01 else ""
+            )
+
+        result = self._transcribe_samples(audio.samples, language)
+
+        if debug:
+            logger.debug("🔍 Resultado: '%s' (%d segmentos)", result["text"], len(result["segments"]))
+
+        return result
+
+    @abc.abstractmethod
+    def _transcribe_samples(self, samples: np.ndarray, language: str) -> dict:
+        """Transcribe muestras float32 a 16 kHz; mismo dict que transcribe()."""
+
+    def warmup(self):
+        """Decodificación de prueba para que la primera petición real no pague la inicialización."""
+        start = time.perf_counter()
+        # 1 s de ruido muy bajo (el silencio absoluto se descarta en algunos motores)
+        noise = np.random.default_rng(0).normal(0, 1e-3, SAMPLE_RATE).astype(np.float32)
+        self._transcribe_samples(noise, "es")
+        logger.info("🔥 %s precalentado en %.2fs", self.name, time.perf_counter() - start)
+
+
+class WhisperSTT(STTEngine):
+    name = "whisper"
 
-class WhisperSTT:
     def __init__(self, model_name: str = "base"):
         """
         Inicializar Whisper.
         Modelos: tiny, base, small, medium, large
         """
+        import whisper
+        import torch
+
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"Cargando Whisper modelo '{model_name}' en {device}...")
+        logger.info("Cargando Whisper modelo '%s' en %s...", model_name, device)
         self.model = whisper.load_model(model_name, device=device)
         self.device = device
-    
-    def transcribe(self, audio_path: str, language: str = "es") -> dict:
-        """
-        Transcribir audio a texto.
-        
-        Returns:
-            dict: {"text": str, "language": str, "segments": list}
-        """
-        # Debug: check audio file
-        import os
-        file_size = os.path.getsize(audio_path) if os.path.exists(audio_path) else 0
-        print(f"🔍 [Whisper Debug] Audio file: {audio_path}, size: {file_size} bytes")
-        
-        try:
-            import librosa
-            audio_data, sr = librosa.load(audio_path, sr=None)
-            duration = len(audio_data) / sr if sr > 0 else 0
-            max_amplitude = max(abs(audio_data)) if len(audio_data) > 0 else 0
-            print(f"🔍 [Whisper Debug] Duration: {duration:.2f}s, Sample rate: {sr}, Max amplitude: {max_amplitude:.4f}")
-            
-            if max_amplitude < 0.01:
-                print(f"⚠️ [Whisper Debug] Audio is nearly SILENT (max amplitude {max_amplitude:.6f})")
-        except Exception as e:
-            print(f"⚠️ [Whisper Debug] Could not analyze audio: {e}")
-        
+
+    def _transcribe_samples(self, samples: np.ndarray, language: str) -> dict:
+        # Whisper acepta directamente el array float32 a 16 kHz
         result = self.model.transcribe(
-            audio_path,
+            samples,
             language=language,
             fp16=False if self.device == "cpu" else True
         )
-        
-        print(f"🔍 [Whisper Debug] Raw result text: '{result['text']}'")
-        print(f"🔍 [Whisper Debug] Segments count: {len(result.get('segments', []))}")
-        
         return {
             "text": result["text"].strip(),
             "language": result["language"],
             "segments": result.get("segments", [])
         }
 
+
+class FasterWhisperSTT(STTEngine):
+    name = "faster-whisper"
+
+    def __init__(self, model_name: str = "base"):
+        """
+        Inicializar faster-whisper (CTranslate2).
+
+        Variables de entorno:
+        - WHISPER_COMPUTE_TYPE: int8 (por defecto en CPU), int8_float16, float16...
+        - WHISPER_CPU_THREADS: hilos de CTranslate2 por modelo (0 = automático)
+        - WHISPER_BEAM_SIZE: 1 (greedy, como openai-whisper por defecto)
+        """
+        from faster_whisper import WhisperModel
+
+        device = os.getenv("WHISPER_DEVICE", "cpu")
+        compute_type = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+        logger.info("Cargando faster-whisper modelo '%s' en %s (%s)...", model_name, device, compute_type)
+        self.model = WhisperModel(
+            model_name,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=int(os.getenv("WHISPER_CPU_THREADS", 0))
+        )
+        self.device = device
+        self.beam_size = int(os.getenv("WHISPER_BEAM_SIZE", 1))
+
+    def _transcribe_samples(self, samples: np.ndarray, language: str) -> dict:
+        segments, info = self.model.transcribe(
+            samples,
+            language=language,
+            beam_size=self.beam_size
+        )
+        # segments es un generador: la decodificación ocurre al recorrerlo
+        segments = [
+            {"id": s.id, "start": s.start, "end": s.end, "text": s.text}
+            for s in segments
+        ]
+        return {
+            "text": "".join(s["text"] for s in segments).strip(),
+            "language": info.language,
+            "segments": segments
+        }
+
+
+ENGINES = {
+    WhisperSTT.name: WhisperSTT,
+    FasterWhisperSTT.name: FasterWhisperSTT,
+}
+
+
+def create_stt_engine(engine: str = "auto", model_name: str = "base") -> STTEngine:
+    """Crea el motor indicado; "auto" prefiere faster-whisper si está instalado."""
+    if engine == "auto":
+        try:
+            import faster_whisper  # noqa: F401
+            engine = FasterWhisperSTT.name
+        except ImportError:
+            engine = WhisperSTT.name
+
+    if engine not in ENGINES:
+        raise ValueError(f"Motor STT desconocido: {engine} (opciones: {', '.join(ENGINES)})")
+    return ENGINES[engine](model_name)
+
 # Singleton
-_whisper_instance: Optional[WhisperSTT] = None
+_whisper_instance: Optional[STTEngine] = None
 
-def get_whisper_service() -> WhisperSTT:
+def get_whisper_service() -> STTEngine:
     global _whisper_instance
     if _whisper_instance is None:
         model_name = os.getenv("WHISPER_MODEL", "base")
-        _whisper_instance = WhisperSTT(model_name)
-    return _whisper_instance
\ No newline at end of file
+        engine = os.getenv("STT_ENGINE", "auto").lower()
+        _whisper_instance = create_stt_engine(engine, model_name)
+    return _whisper_instance